@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+
+# Rolling resource consumption analytics in bounded memory.  Each window (e.g. one hour and
+# one day) is a ring of time buckets.  A bucket keeps exact per-operation-type totals (there
+# are only ~50 operation types), a Space-Saving sketch of the heaviest resource users per
+# resource, and a HyperLogLog sketch of the distinct resource users.  Queries merge the
+# buckets of a window, so memory depends on bucket_count, top_k and the HyperLogLog
+# precision, never on the number of transactions or accounts.
+
+import calendar
+import collections
+import hashlib
+import heapq
+import math
+import time
+
+import rcdemo
+
+class SpaceSaving(object):
+    # Weighted Space-Saving heavy hitters sketch with at most k entries.  Each estimate
+    # overcounts the true weight by at most its error, which is at most total_weight / k.
+    def __init__(self, k):
+        self.k = k
+        self.counts = {}
+        self.errors = {}
+        self.total_weight = 0
+        # Lazy min-heap of (count, key), stale entries are skipped when popping
+        self._heap = []
+
+    def add( self, key, weight=1 ):
+        if weight <= 0:
+            return
+        self.total_weight += weight
+        counts = self.counts
+        if key in counts:
+            counts[key] += weight
+        elif len(counts) < self.k:
+            counts[key] = weight
+            self.errors[key] = 0
+        else:
+            min_key, min_count = self._pop_min()
+            del counts[min_key]
+            del self.errors[min_key]
+            counts[key] = min_count + weight
+            self.errors[key] = min_count
+        heapq.heappush( self._heap, (counts[key], key) )
+        if len(self._heap) > 4 * self.k:
+            self._heap = [(count, key) for key, count in counts.items()]
+            heapq.heapify(self._heap)
+
+    def _pop_min(self):
+        heap = self._heap
+        while True:
+            count, key = heapq.heappop(heap)
+            if self.counts.get(key) == count:
+                return key, count
+
+    def merge( self, other ):
+        # Mergeable Space-Saving: a key missing from a full sketch may have had up to that
+        # sketch's smallest count, so it is charged that count as both weight and error.  The
+        # k largest sums are kept; every dropped sum is at most the smallest kept one, so the
+        # smallest count still bounds the weight of any key not in the result.  Returns a new
+        # sketch.
+        result = SpaceSaving(self.k)
+        floor1 = self._floor()
+        floor2 = other._floor()
+        counts = {}
+        errors = {}
+        for key in set(self.counts) | set(other.counts):
+            counts[key] = self.counts.get(key, floor1) + other.counts.get(key, floor2)
+            errors[key] = self.errors.get(key, floor1) + other.errors.get(key, floor2)
+        for key, count in heapq.nlargest( self.k, counts.items(), key=lambda item : (item[1], item[0]) ):
+            result.counts[key] = count
+            result.errors[key] = errors[key]
+        result._heap = [(count, key) for key, count in result.counts.items()]
+        heapq.heapify(result._heap)
+        result.total_weight = self.total_weight + other.total_weight
+        return result
+
+    def _floor(self):
+        # Upper bound on the weight of keys not in the sketch
+        if len(self.counts) < self.k:
+            return 0
+        return min(self.counts.values())
+
+    def top( self, n=None ):
+        # [(key, estimate, error)] by decreasing estimate
+        items = sorted( self.counts.items(), key=lambda item : (-item[1], item[0]) )
+        return [(key, count, self.errors[key]) for key, count in items[:n]]
+
+class HyperLogLog(object):
+    # Distinct count sketch with 2**precision one-byte registers, standard error about
+    # 1.04 / sqrt(2**precision)
+    def __init__(self, precision=12):
+        self.precision = precision
+        self.m = 1 << precision
+        self.registers = bytearray(self.m)
+
+    def add( self, key ):
+        h = int.from_bytes( hashlib.blake2b( key.encode("utf8"), digest_size=8 ).digest(), "big" )
+        index = h >> (64 - self.precision)
+        rest = h & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge( self, other ):
+        result = HyperLogLog(self.precision)
+        result.registers = bytearray( max(a, b) for a, b in zip(self.registers, other.registers) )
+        return result
+
+    def count(self):
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros > 0:
+            # Linear counting for small cardinalities
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+class AnalyticsBucket(object):
+    def __init__(self, resource_names, account_resources, top_k, hll_precision):
+        # op_type -> [op_count] + counts in resource_names order
+        self.operations = {}
+        self.transaction_count = 0
+        self.accounts = collections.OrderedDict( (resource_name, SpaceSaving(top_k)) for resource_name in account_resources )
+        self.distinct_accounts = HyperLogLog(hll_precision)
+
+class RollingWindow(object):
+    # The last length seconds, as bucket_count buckets of length / bucket_count seconds.
+    # Expiry is by bucket, so a query covers between length - bucket length and length seconds.
+    def __init__(self, length, resource_names, account_resources, bucket_count=60, top_k=100, hll_precision=12):
+        self.length = length
+        self.resource_names = resource_names
+        self.account_resources = account_resources
+        self.bucket_count = bucket_count
+        self.bucket_length = max(1, length // bucket_count)
+        self.top_k = top_k
+        self.hll_precision = hll_precision
+        # deque of (bucket_index, AnalyticsBucket), oldest first
+        self.buckets = collections.deque()
+        self.late_count = 0
+
+    def get_bucket( self, timestamp ):
+        # Returns the bucket of timestamp, None if it has already expired
+        index = timestamp // self.bucket_length
+        buckets = self.buckets
+        if buckets and index <= buckets[-1][0]:
+            for bucket_index, bucket in reversed(buckets):
+                if bucket_index == index:
+                    return bucket
+                if bucket_index < index:
+                    break
+            if index <= buckets[-1][0] - self.bucket_count:
+                self.late_count += 1
+                return None
+            # A gap bucket for out of order data within the window
+            bucket = AnalyticsBucket( self.resource_names, self.account_resources, self.top_k, self.hll_precision )
+            buckets.append( (index, bucket) )
+            self.buckets = collections.deque( sorted( buckets, key=lambda item : item[0] ) )
+            return bucket
+        bucket = AnalyticsBucket( self.resource_names, self.account_resources, self.top_k, self.hll_precision )
+        buckets.append( (index, bucket) )
+        self.expire( index )
+        return bucket
+
+    def expire( self, current_index ):
+        buckets = self.buckets
+        while buckets and buckets[0][0] <= current_index - self.bucket_count:
+            buckets.popleft()
+
+    def report( self, now=None, top_n=None ):
+        if now is not None:
+            self.expire( now // self.bucket_length )
+        n = len(self.resource_names)
+        operations = {}
+        transaction_count = 0
+        accounts = None
+        distinct = HyperLogLog(self.hll_precision)
+        for bucket_index, bucket in self.buckets:
+            transaction_count += bucket.transaction_count
+            for op_type, totals in bucket.operations.items():
+                merged = operations.get(op_type)
+                if merged is None:
+                    merged = operations[op_type] = [0] * (n + 1)
+                for i, value in enumerate(totals):
+                    merged[i] += value
+            if accounts is None:
+                accounts = bucket.accounts
+            else:
+                accounts = collections.OrderedDict( (resource_name, sketch.merge( bucket.accounts[resource_name] ))
+                                                    for resource_name, sketch in accounts.items() )
+            distinct = distinct.merge( bucket.distinct_accounts )
+
+        return collections.OrderedDict((
+           ("window_seconds", self.length),
+           ("transaction_count", transaction_count),
+           ("operations", collections.OrderedDict(
+              (op_type, collections.OrderedDict( [("count", totals[0])] + list(zip(self.resource_names, totals[1:])) ))
+              for op_type, totals in sorted(operations.items()) )),
+           ("top_accounts", collections.OrderedDict(
+              (resource_name, [collections.OrderedDict( (("account", account), ("estimate", estimate), ("max_error", error)) )
+                               for account, estimate, error in sketch.top( top_n )])
+              for resource_name, sketch in (accounts or {}).items() )),
+           ("distinct_accounts", distinct.count()),
+           ))
+
+class RollingAnalytics(object):
+    # Feeds transactions through count_resources.count_by_operation() into every window.
+    # Accounts are the resource users of the transactions, see get_resource_user().
+    def __init__(self, count_resources, windows=(3600, 86400), bucket_count=60, top_k=100, hll_precision=12,
+                 account_resources=("resource_state_bytes", "resource_history_bytes", "resource_market_bytes")):
+        self.count_resources = count_resources
+        self.resource_names = count_resources.resource_names
+        self.account_resources = account_resources
+        self._account_indexes = [self.resource_names.index(resource_name) for resource_name in account_resources]
+        self.windows = collections.OrderedDict(
+           (length, RollingWindow( length, self.resource_names, account_resources, bucket_count, top_k, hll_precision ))
+           for length in windows )
+
+    def add_transaction( self, tx, timestamp, tx_size=-1 ):
+        op_counts = self.count_resources.count_by_operation( tx, tx_size )
+        resource_user = rcdemo.get_resource_user( tx )
+        tx_totals = [0] * len(self.resource_names)
+        for op_type, counts in op_counts:
+            for i, value in enumerate(counts):
+                tx_totals[i] += value
+
+        for window in self.windows.values():
+            bucket = window.get_bucket( timestamp )
+            if bucket is None:
+                continue
+            bucket.transaction_count += 1
+            for op_type, counts in op_counts:
+                totals = bucket.operations.get(op_type)
+                if totals is None:
+                    totals = bucket.operations[op_type] = [0] * (len(counts) + 1)
+                totals[0] += 1
+                for i, value in enumerate(counts, 1):
+                    totals[i] += value
+            if resource_user is not None:
+                for resource_name, i in zip(self.account_resources, self._account_indexes):
+                    bucket.accounts[resource_name].add( resource_user, tx_totals[i] )
+                bucket.distinct_accounts.add( resource_user )
+
+    def add_block( self, block ):
+        # block needs a "timestamp" like "2018-09-28T01:02:03"
+        timestamp = calendar.timegm( time.strptime( block["timestamp"], "%Y-%m-%dT%H:%M:%S" ) )
+        tx_sizes = block.get("transaction_sizes")
+        for i, tx in enumerate(block["transactions"]):
+            self.add_transaction( tx, timestamp, -1 if tx_sizes is None else tx_sizes[i] )
+
+    def report( self, now=None, top_n=10 ):
+        return collections.OrderedDict( (length, window.report( now, top_n )) for length, window in self.windows.items() )
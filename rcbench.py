@@ -0,0 +1,392 @@
+#!/usr/bin/env python3
+
+# Benchmarks of the counting and pricing path over a seeded synthetic workload.
+#
+#    python3 rcbench.py --count 20000 --output bench.json
+#    python3 rcbench.py --count 20000 --compare bench.json
+#
+# The workload contains every non-virtual operation type known to CountOperationVisitor,
+# weighted towards the votes, custom_json's, comments and transfers that dominate real traffic.
+
+import argparse
+import collections
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+import rcdemo
+
+def base58_encode( b ):
+    n = int.from_bytes(b, "big")
+    s = ""
+    while n > 0:
+        n, r = divmod(n, 58)
+        s = rcdemo.base58_alphabet[r] + s
+    return "1" * (len(b) - len(b.lstrip(b"\x00"))) + s
+
+class TransactionGenerator(object):
+    def __init__(self, seed=0):
+        self.rng = random.Random(seed)
+        self.accounts = ["{}{}".format(self.rng.choice(["alice", "bob", "carol", "dave", "eve"]), i) for i in range(1000)]
+        self.op_weights = collections.OrderedDict()
+        for op_type in rcdemo.operation_names:
+            self.op_weights[op_type] = 1
+        self.op_weights.update({
+           "vote_operation" : 400,
+           "custom_json_operation" : 300,
+           "comment_operation" : 80,
+           "comment_options_operation" : 40,
+           "transfer_operation" : 60,
+           "claim_reward_balance_operation" : 30,
+           "transfer_to_vesting_operation" : 10,
+           "delegate_vesting_shares_operation" : 5,
+           "account_create_operation" : 3,
+           "claim_account_operation" : 3,
+           "create_claimed_account_operation" : 3,
+           "limit_order_create_operation" : 5,
+           })
+        self._op_types = list(self.op_weights.keys())
+        self._cum_weights = []
+        total = 0
+        for w in self.op_weights.values():
+            total += w
+            self._cum_weights.append(total)
+
+    # Field generators
+
+    def account(self):
+        return self.rng.choice(self.accounts)
+
+    def text( self, lo, hi, alphabet="abcdefghijklmnopqrstuvwxyz0123456789-" ):
+        return "".join(self.rng.choice(alphabet) for i in range(self.rng.randint(lo, hi)))
+
+    def permlink(self):
+        # Mostly short, with a tail of long generated permlinks
+        if self.rng.random() < 0.1:
+            return self.text(100, 255)
+        return self.text(8, 60)
+
+    def asset( self, nai="@@000000021" ):
+        precision = 6 if nai == "@@000000037" else 3
+        return {"amount" : str(self.rng.randint(1, 10**9)), "precision" : precision, "nai" : nai}
+
+    def hex( self, size ):
+        return bytes(self.rng.getrandbits(8) for i in range(size)).hex()
+
+    def time( self ):
+        return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(1538000000 + self.rng.randint(0, 10**6)))
+
+    def public_key(self):
+        key = bytes([2]) + bytes(self.rng.getrandbits(8) for i in range(32))
+        return "STM" + base58_encode(key + b"\x00\x00\x00\x00")
+
+    def authority( self, max_members=1 ):
+        # Multisig authorities with up to max_members account and key members
+        return {
+           "weight_threshold" : 1,
+           "account_auths" : sorted([[a, 1] for a in set(self.account() for i in range(self.rng.randint(0, max_members)))]),
+           "key_auths" : [[self.public_key(), 1] for i in range(self.rng.randint(1, max_members))],
+           }
+
+    def symbol(self):
+        return {"nai" : "@@{:08d}{}".format(self.rng.randint(10**7, 10**8 - 1), self.rng.randint(0, 9)), "precision" : 3}
+
+    def chain_properties(self):
+        return {"account_creation_fee" : self.asset(), "maximum_block_size" : 65536, "sbd_interest_rate" : 0}
+
+    def signed_block_header(self):
+        return {"previous" : self.hex(20), "timestamp" : self.time(), "witness" : self.account(),
+                "transaction_merkle_root" : self.hex(20), "extensions" : [], "witness_signature" : self.hex(65)}
+
+    def pow2_input(self):
+        return {"worker_account" : self.account(), "prev_block" : self.hex(20), "nonce" : self.rng.getrandbits(63)}
+
+    def generation_unit(self):
+        return {"steem_unit" : [[self.account(), 1]], "token_unit" : [[self.account(), 2]]}
+
+    def cap_commitment(self):
+        return {"lower_bound" : 1, "upper_bound" : 10**9, "hash" : self.hex(32)}
+
+    # Operations
+
+    def account_creator( self, **extra ):
+        op = {"fee" : self.asset(), "creator" : self.account(), "new_account_name" : self.text(3, 16, "abcdefghijklmnopqrstuvwxyz"),
+              "owner" : self.authority(8), "active" : self.authority(8), "posting" : self.authority(8),
+              "memo_key" : self.public_key(), "json_metadata" : "", "extensions" : []}
+        op.update(extra)
+        return op
+
+    def operation_value( self, op_type ):
+        a = self.account
+        if op_type == "vote_operation":
+            return {"voter" : a(), "author" : a(), "permlink" : self.permlink(), "weight" : self.rng.randint(-10000, 10000)}
+        if op_type == "comment_operation":
+            return {"parent_author" : a(), "parent_permlink" : self.permlink(), "author" : a(), "permlink" : self.permlink(),
+                    "title" : self.text(0, 80), "body" : self.text(100, 8000), "json_metadata" : self.text(0, 500)}
+        if op_type == "comment_options_operation":
+            beneficiaries = sorted(set(a() for i in range(self.rng.randint(0, 8))))
+            return {"author" : a(), "permlink" : self.permlink(), "max_accepted_payout" : self.asset("@@000000013"),
+                    "percent_steem_dollars" : 10000, "allow_votes" : True, "allow_curation_rewards" : True,
+                    "extensions" : [{"type" : "comment_payout_beneficiaries", "value" : {"beneficiaries" :
+                       [{"account" : b, "weight" : 100} for b in beneficiaries]}}] if beneficiaries else []}
+        if op_type == "custom_json_operation":
+            return {"required_auths" : [], "required_posting_auths" : [a()], "id" : self.rng.choice(["follow", "reblog", "sm_battle"]),
+                    "json" : json.dumps(["follow", {"follower" : a(), "following" : a(), "what" : ["blog"]}])}
+        if op_type in ("transfer_operation", "transfer_to_savings_operation"):
+            return {"from" : a(), "to" : a(), "amount" : self.asset(), "memo" : self.text(0, 200)}
+        if op_type == "transfer_to_vesting_operation":
+            return {"from" : a(), "to" : a(), "amount" : self.asset()}
+        if op_type == "withdraw_vesting_operation":
+            return {"account" : a(), "vesting_shares" : self.asset("@@000000037")}
+        if op_type == "limit_order_create_operation":
+            return {"owner" : a(), "orderid" : self.rng.getrandbits(32), "amount_to_sell" : self.asset(), "min_to_receive" : self.asset("@@000000013"),
+                    "fill_or_kill" : self.rng.random() < 0.3, "expiration" : self.time()}
+        if op_type == "limit_order_create2_operation":
+            return {"owner" : a(), "orderid" : self.rng.getrandbits(32), "amount_to_sell" : self.asset(),
+                    "exchange_rate" : {"base" : self.asset(), "quote" : self.asset("@@000000013")},
+                    "fill_or_kill" : self.rng.random() < 0.3, "expiration" : self.time()}
+        if op_type == "limit_order_cancel_operation":
+            return {"owner" : a(), "orderid" : self.rng.getrandbits(32)}
+        if op_type == "feed_publish_operation":
+            return {"publisher" : a(), "exchange_rate" : {"base" : self.asset("@@000000013"), "quote" : self.asset()}}
+        if op_type == "convert_operation":
+            return {"owner" : a(), "requestid" : self.rng.getrandbits(32), "amount" : self.asset("@@000000013")}
+        if op_type == "account_create_operation":
+            return self.account_creator()
+        if op_type == "account_create_with_delegation_operation":
+            return self.account_creator( delegation=self.asset("@@000000037") )
+        if op_type == "create_claimed_account_operation":
+            return self.account_creator()
+        if op_type == "account_update_operation":
+            return {"account" : a(), "owner" : self.authority(4) if self.rng.random() < 0.5 else None,
+                    "active" : self.authority(4), "posting" : None, "memo_key" : self.public_key(), "json_metadata" : self.text(0, 200)}
+        if op_type == "witness_update_operation":
+            return {"owner" : a(), "url" : "https://" + self.text(10, 120), "block_signing_key" : self.public_key(),
+                    "props" : self.chain_properties(), "fee" : self.asset()}
+        if op_type == "account_witness_vote_operation":
+            return {"account" : a(), "witness" : a(), "approve" : True}
+        if op_type == "account_witness_proxy_operation":
+            return {"account" : a(), "proxy" : a()}
+        if op_type == "pow_operation":
+            return {"worker_account" : a(), "block_id" : self.hex(20), "nonce" : self.rng.getrandbits(63),
+                    "work" : {"worker" : self.public_key(), "input" : self.hex(32), "signature" : self.hex(65), "work" : self.hex(32)},
+                    "props" : self.chain_properties()}
+        if op_type == "custom_operation":
+            return {"required_auths" : [a()], "id" : 777, "data" : self.hex(self.rng.randint(0, 200))}
+        if op_type == "report_over_production_operation":
+            return {"reporter" : a(), "first_block" : self.signed_block_header(), "second_block" : self.signed_block_header()}
+        if op_type == "delete_comment_operation":
+            return {"author" : a(), "permlink" : self.permlink()}
+        if op_type == "set_withdraw_vesting_route_operation":
+            return {"from_account" : a(), "to_account" : a(), "percent" : 5000, "auto_vest" : False}
+        if op_type == "claim_account_operation":
+            return {"creator" : a(), "fee" : self.rng.choice([self.asset(), {"amount" : "0", "precision" : 3, "nai" : "@@000000021"}]),
+                    "extensions" : []}
+        if op_type == "request_account_recovery_operation":
+            return {"recovery_account" : a(), "account_to_recover" : a(), "new_owner_authority" : self.authority(), "extensions" : []}
+        if op_type == "recover_account_operation":
+            return {"account_to_recover" : a(), "new_owner_authority" : self.authority(), "recent_owner_authority" : self.authority(),
+                    "extensions" : []}
+        if op_type == "change_recovery_account_operation":
+            return {"account_to_recover" : a(), "new_recovery_account" : a(), "extensions" : []}
+        if op_type == "escrow_transfer_operation":
+            return {"from" : a(), "to" : a(), "agent" : a(), "escrow_id" : 1, "sbd_amount" : self.asset("@@000000013"),
+                    "steem_amount" : self.asset(), "fee" : self.asset(), "ratification_deadline" : self.time(),
+                    "escrow_expiration" : self.time(), "json_meta" : ""}
+        if op_type == "escrow_dispute_operation":
+            return {"from" : a(), "to" : a(), "agent" : a(), "who" : a(), "escrow_id" : 1}
+        if op_type == "escrow_release_operation":
+            return {"from" : a(), "to" : a(), "agent" : a(), "who" : a(), "receiver" : a(), "escrow_id" : 1,
+                    "sbd_amount" : self.asset("@@000000013"), "steem_amount" : self.asset()}
+        if op_type == "escrow_approve_operation":
+            return {"from" : a(), "to" : a(), "agent" : a(), "who" : a(), "escrow_id" : 1, "approve" : True}
+        if op_type == "pow2_operation":
+            return {"work" : {"type" : "pow2", "value" : {"input" : self.pow2_input(), "pow_summary" : self.rng.getrandbits(32)}},
+                    "new_owner_key" : self.public_key(), "props" : self.chain_properties()}
+        if op_type == "transfer_from_savings_operation":
+            return {"from" : a(), "request_id" : 1, "to" : a(), "amount" : self.asset(), "memo" : self.text(0, 100)}
+        if op_type == "cancel_transfer_from_savings_operation":
+            return {"from" : a(), "request_id" : 1}
+        if op_type == "custom_binary_operation":
+            return {"required_owner_auths" : [], "required_active_auths" : [], "required_posting_auths" : [a()],
+                    "required_auths" : [], "id" : "binary", "data" : self.hex(self.rng.randint(0, 200))}
+        if op_type == "decline_voting_rights_operation":
+            return {"account" : a(), "decline" : True}
+        if op_type == "reset_account_operation":
+            return {"reset_account" : a(), "account_to_reset" : a(), "new_owner_authority" : self.authority()}
+        if op_type == "set_reset_account_operation":
+            return {"account" : a(), "current_reset_account" : a(), "reset_account" : a()}
+        if op_type == "claim_reward_balance_operation":
+            return {"account" : a(), "reward_steem" : self.asset(), "reward_sbd" : self.asset("@@000000013"),
+                    "reward_vests" : self.asset("@@000000037")}
+        if op_type == "delegate_vesting_shares_operation":
+            return {"delegator" : a(), "delegatee" : a(), "vesting_shares" : self.asset("@@000000037")}
+        if op_type == "witness_set_properties_operation":
+            return {"owner" : a(), "props" : [["key", self.hex(33)], ["url", self.hex(40)]], "extensions" : []}
+        if op_type == "claim_reward_balance2_operation":
+            return {"account" : a(), "extensions" : [], "reward_tokens" : [self.asset(), self.asset("@@000000037")]}
+        if op_type == "smt_setup_operation":
+            return {"control_account" : a(), "symbol" : self.symbol(), "decimal_places" : 3, "max_supply" : 10**15,
+                    "initial_generation_policy" : {"type" : "smt_capped_generation_policy", "value" : {
+                       "pre_soft_cap_unit" : self.generation_unit(), "post_soft_cap_unit" : self.generation_unit(),
+                       "min_steem_units_commitment" : self.cap_commitment(), "hard_cap_steem_units_commitment" : self.cap_commitment(),
+                       "soft_cap_percent" : 5000, "min_unit_ratio" : 1, "max_unit_ratio" : 100, "extensions" : []}},
+                    "generation_begin_time" : self.time(), "generation_end_time" : self.time(),
+                    "announced_launch_time" : self.time(), "launch_expiration_time" : self.time(), "extensions" : []}
+        if op_type == "smt_cap_reveal_operation":
+            return {"control_account" : a(), "symbol" : self.symbol(), "cap" : {"amount" : 10**9, "nonce" : self.rng.getrandbits(128)},
+                    "extensions" : []}
+        if op_type == "smt_refund_operation":
+            return {"executor" : a(), "contributor" : a(), "symbol" : self.symbol(), "contribution_id" : 1,
+                    "amount" : self.asset(), "extensions" : []}
+        if op_type == "smt_setup_emissions_operation":
+            return {"control_account" : a(), "symbol" : self.symbol(), "schedule_time" : self.time(),
+                    "emissions_unit" : {"token_unit" : [["$from", 1]]}, "interval_seconds" : 3600, "interval_count" : 24,
+                    "lep_time" : self.time(), "rep_time" : self.time(), "lep_abs_amount" : self.asset(), "rep_abs_amount" : self.asset(),
+                    "lep_rel_amount_numerator" : 1, "rep_rel_amount_numerator" : 1, "rel_amount_denom_bits" : 10, "extensions" : []}
+        if op_type == "smt_set_setup_parameters_operation":
+            return {"control_account" : a(), "symbol" : self.symbol(),
+                    "setup_parameters" : [{"type" : "smt_param_allow_voting", "value" : {"value" : True}}], "extensions" : []}
+        if op_type == "smt_set_runtime_parameters_operation":
+            return {"control_account" : a(), "symbol" : self.symbol(), "runtime_parameters" : [
+                       {"type" : "smt_param_windows_v1", "value" : {"cashout_window_seconds" : 86400, "reverse_auction_window_seconds" : 1800}}],
+                    "extensions" : []}
+        if op_type == "smt_create_operation":
+            return {"control_account" : a(), "symbol" : self.symbol(), "smt_creation_fee" : self.asset(), "precision" : 3,
+                    "extensions" : []}
+        raise ValueError("No generator for "+op_type)
+
+    def operation( self, op_type=None ):
+        if op_type is None:
+            op_type = self.rng.choices( self._op_types, cum_weights=self._cum_weights )[0]
+        return {"type" : op_type, "value" : self.operation_value( op_type )}
+
+    def transaction( self, op_count=None ):
+        if op_count is None:
+            op_count = 1 if self.rng.random() < 0.9 else self.rng.randint(2, 5)
+        return {
+           "ref_block_num" : self.rng.getrandbits(16),
+           "ref_block_prefix" : self.rng.getrandbits(32),
+           "expiration" : self.time(),
+           "operations" : [self.operation() for i in range(op_count)],
+           "extensions" : [],
+           "signatures" : [self.hex(65) for i in range(1 if self.rng.random() < 0.95 else 2)],
+           }
+
+    def transactions( self, count ):
+        # Every operation type occurs at least once, the rest follows the weighted mix
+        txs = [self.transaction(0) for op_type in self._op_types]
+        for tx, op_type in zip(txs, self._op_types):
+            tx["operations"].append( self.operation( op_type ) )
+        txs.extend( self.transaction() for i in range(max(count - len(txs), 0)) )
+        self.rng.shuffle(txs)
+        return txs
+
+def measure( f, args_list ):
+    # Calls f(*args) for each args, returns per-call latencies in nanoseconds
+    latencies = []
+    perf_counter_ns = time.perf_counter_ns
+    for args in args_list:
+        start = perf_counter_ns()
+        f(*args)
+        latencies.append(perf_counter_ns() - start)
+    return latencies
+
+def summarize( latencies ):
+    latencies = sorted(latencies)
+    n = len(latencies)
+    total = sum(latencies)
+    def percentile( p ):
+        return latencies[min(n - 1, (n * p) // 100)]
+    return collections.OrderedDict((
+       ("calls", n),
+       ("calls_per_second", n * 1e9 / total if total > 0 else 0.0),
+       ("mean_ns", total / n),
+       ("p50_ns", percentile(50)),
+       ("p90_ns", percentile(90)),
+       ("p99_ns", percentile(99)),
+       ("max_ns", latencies[-1]),
+       ))
+
+def run_benchmarks( txs, model, block_size=50 ):
+    counter = model.count_resources
+
+    def measure_size( tx ):
+        ser = rcdemo.SizeSerializer()
+        ser.signed_transaction(tx)
+        return ser.flush()
+
+    tx_args = [(tx, measure_size(tx)) for tx in txs]
+
+    cost_args = []
+    for tx, tx_size in tx_args:
+        resource_count = counter( tx, tx_size )["resource_count"]
+        for resource_name in model.resource_names:
+            params = model.resource_params["resource_params"][resource_name]
+            cost_args.append( (params["price_curve_params"], int(model.resource_pool[resource_name]["pool"]),
+                               resource_count[resource_name] * params["resource_dynamics_params"]["resource_unit"], model.rc_regen) )
+
+    block_counts = []
+    for i in range(0, len(tx_args), block_size):
+        count = collections.OrderedDict( (resource_name, 0) for resource_name in model.resource_names )
+        for tx, tx_size in tx_args[i:i+block_size]:
+            for resource_name, value in counter( tx, tx_size )["resource_count"].items():
+                count[resource_name] += value
+        block_counts.append( (count,) )
+
+    results = collections.OrderedDict()
+    results["serialize"] = summarize( measure( lambda tx : rcdemo.Serializer().signed_transaction(tx), [(tx,) for tx in txs] ) )
+    results["measure_size"] = summarize( measure( measure_size, [(tx,) for tx in txs] ) )
+    results["count_resources"] = summarize( measure( counter, tx_args ) )
+    results["count_resources_unsized"] = summarize( measure( counter, [(tx,) for tx in txs] ) )
+    results["compute_rc_cost_of_resource"] = summarize( measure( rcdemo.compute_rc_cost_of_resource, cost_args ) )
+    results["get_transaction_rc_cost"] = summarize( measure( model.get_transaction_rc_cost, tx_args ) )
+    results["apply_rc_pool_dynamics"] = summarize( measure( model.apply_rc_pool_dynamics, block_counts ) )
+    return results
+
+def compare( results, baseline ):
+    lines = ["{:32} {:>14} {:>14} {:>8}".format("benchmark", "baseline/s", "current/s", "ratio")]
+    for name, r in results["benchmarks"].items():
+        b = baseline["benchmarks"].get(name)
+        if b is None:
+            continue
+        if b["calls_per_second"]:
+            ratio = "{:8.3f}".format( r["calls_per_second"] / b["calls_per_second"] )
+        else:
+            ratio = "{:>8}".format("n/a")
+        lines.append("{:32} {:14.0f} {:14.0f} {}".format(
+           name, b["calls_per_second"], r["calls_per_second"], ratio))
+    return "\n".join(lines)
+
+def main( argv=None ):
+    parser = argparse.ArgumentParser( description="Benchmark RC counting and pricing" )
+    parser.add_argument( "--seed", type=int, default=0 )
+    parser.add_argument( "--count", type=int, default=10000, help="Number of synthetic transactions" )
+    parser.add_argument( "--output", help="Write JSON results to this file instead of stdout" )
+    parser.add_argument( "--compare", help="Print a comparison against a previous JSON result" )
+    args = parser.parse_args(argv)
+
+    txs = TransactionGenerator( args.seed ).transactions( args.count )
+    results = collections.OrderedDict((
+       ("python", sys.version),
+       ("platform", platform.platform()),
+       ("cpu_count", os.cpu_count()),
+       ("seed", args.seed),
+       ("transaction_count", len(txs)),
+       ("benchmarks", run_benchmarks( txs, rcdemo.model )),
+       ))
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            print( compare( results, json.load(f) ) )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump( results, f, indent=1 )
+    elif not args.compare:
+        print( json.dumps( results, indent=1 ) )
+
+if __name__ == "__main__":
+    main()
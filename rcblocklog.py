@@ -0,0 +1,535 @@
+#!/usr/bin/env python3
+
+# Reads a steemd block_log directly, without a node or JSON.  The block_log is the fc::raw
+# encoding of each signed_block followed by the uint64 file position of its start, and
+# block_log.index holds the uint64 position of block n at offset 8*(n-1).
+#
+# The file is memory-mapped and decoded in place.  Each transaction's tx_size is the length
+# of its encoded byte span, so nothing is re-serialized.  Payload strings (the fields in
+# rcdemo.payload_fields) are skipped and replaced by their size like parse_block_record()
+# does, and with trim=True only the fields in rcdemo.operation_record_fields are kept, so the
+# blocks can be passed to count_blocks(), replay_blocks() and the other block consumers.
+#
+# Public keys are returned as the hex of the 33 byte compressed key, since the base58check
+# form needs RIPEMD-160, which hashlib does not always provide.
+
+import argparse
+import json
+import mmap
+import os
+import struct
+import time
+
+import rcdemo
+
+legacy_symbol_prefixes = dict(
+   (bytes([precision]) + name.encode("ascii")[:3], (nai, precision, name))
+   for nai, (precision, name) in rcdemo.legacy_nai_symbols.items() )
+
+payload_field_names = set( name.decode("ascii") for name in rcdemo.payload_fields )
+
+damm_table = (
+   (0, 3, 1, 7, 5, 9, 8, 6, 4, 2),
+   (7, 0, 9, 2, 1, 5, 4, 8, 6, 3),
+   (4, 2, 0, 6, 8, 7, 1, 3, 5, 9),
+   (1, 7, 5, 0, 9, 8, 3, 4, 2, 6),
+   (6, 1, 2, 3, 0, 4, 5, 9, 7, 8),
+   (3, 6, 7, 4, 2, 0, 9, 5, 8, 1),
+   (5, 8, 6, 9, 7, 2, 0, 1, 3, 4),
+   (8, 9, 4, 5, 3, 6, 2, 0, 1, 7),
+   (9, 4, 3, 8, 6, 1, 7, 2, 0, 5),
+   (2, 5, 8, 1, 4, 3, 6, 7, 9, 0),
+   )
+
+def nai_string( nai_num ):
+    # "@@" + 8 digits + Damm check digit
+    digits = "{:08d}".format(nai_num)
+    check = 0
+    for d in digits:
+        check = damm_table[check][int(d)]
+    return "@@" + digits + str(check)
+
+# Inverse of rcdemo.Serializer, reading from a bytes-like buffer (bytes, mmap, memoryview)
+# starting at pos.  Methods have the same names and return the JSON representation.
+class Deserializer(object):
+    def __init__(self, buf, pos=0):
+        self.buf = buf
+        self.pos = pos
+        self.operation_layouts = operation_layouts( self )
+
+    # Primitive types
+
+    def raw( self, n ):
+        b = bytes(self.buf[self.pos:self.pos+n])
+        if len(b) != n:
+            raise EOFError("Unexpected end of data at {}".format(self.pos))
+        self.pos += n
+        return b
+
+    def _unpack( self, s ):
+        v = s.unpack_from(self.buf, self.pos)[0]
+        self.pos += s.size
+        return v
+
+    def uint8( self ):
+        return self._unpack( uint8_struct )
+
+    def uint16( self ):
+        return self._unpack( uint16_struct )
+
+    def uint32( self ):
+        return self._unpack( uint32_struct )
+
+    def uint64( self ):
+        return self._unpack( uint64_struct )
+
+    def uint128( self ):
+        return int.from_bytes( self.raw(16), "little" )
+
+    def int16( self ):
+        return self._unpack( int16_struct )
+
+    def int64( self ):
+        return self._unpack( int64_struct )
+
+    def boolean( self ):
+        return self._unpack( uint8_struct ) != 0
+
+    def varint( self ):
+        v = 0
+        shift = 0
+        buf = self.buf
+        while True:
+            b = buf[self.pos]
+            self.pos += 1
+            v |= (b & 0x7F) << shift
+            if b < 0x80:
+                return v
+            shift += 7
+
+    def string( self ):
+        n = self.varint()
+        return self.raw(n).decode("utf8", "surrogateescape")
+
+    def hex_bytes( self ):
+        n = self.varint()
+        return self.raw(n).hex()
+
+    def payload( self ):
+        # A payload string is skipped, returns its size like strip_payloads() does
+        n = self.varint()
+        self.pos += n
+        return n
+
+    def payload_hex( self ):
+        # A payload vector<char>, returns the length of its hex form like strip_payloads() does
+        return 2 * self.payload()
+
+    def time_point_sec( self ):
+        return time.strftime( "%Y-%m-%dT%H:%M:%S", time.gmtime( self.uint32() ) )
+
+    def public_key( self ):
+        return self.raw( rcdemo.STEEM_PUBLIC_KEY_SIZE ).hex()
+
+    def signature( self ):
+        return self.raw( rcdemo.STEEM_SIGNATURE_SIZE ).hex()
+
+    def block_id( self ):
+        return self.raw(20).hex()
+
+    def checksum( self ):
+        return self.raw(20).hex()
+
+    def digest( self ):
+        return self.raw(32).hex()
+
+    # Containers
+
+    def vector( self, f ):
+        return [f() for i in range(self.varint())]
+
+    def flat_map( self, fk, fv ):
+        result = []
+        for i in range(self.varint()):
+            k = fk()
+            result.append( [k, fv()] )
+        return result
+
+    def optional( self, f ):
+        return f() if self.boolean() else None
+
+    def static_variant( self, types ):
+        which = self.varint()
+        if which >= len(types):
+            raise ValueError("Unknown static_variant type {} at {}".format(which, self.pos))
+        return {"type" : types[which], "value" : getattr(self, types[which])()}
+
+    def void_t( self ):
+        return {}
+
+    def extensions( self ):
+        return self.vector( lambda : self.static_variant( ["void_t"] ) )
+
+    # Protocol types
+
+    def asset_symbol( self ):
+        # Legacy symbols are 8 bytes, recognized by their first 4 like steemd's unpack()
+        prefix = bytes(self.buf[self.pos:self.pos+4])
+        legacy = legacy_symbol_prefixes.get(prefix)
+        if legacy is not None:
+            self.pos += 8
+            return {"nai" : legacy[0], "precision" : legacy[1]}
+        asset_num = self.uint32()
+        return {"nai" : nai_string( asset_num >> 5 ), "precision" : asset_num & 0x0F}
+
+    def asset( self ):
+        amount = self.int64()
+        symbol = self.asset_symbol()
+        return {"amount" : str(amount), "precision" : symbol["precision"], "nai" : symbol["nai"]}
+
+    def price( self ):
+        base = self.asset()
+        return {"base" : base, "quote" : self.asset()}
+
+    def authority( self ):
+        weight_threshold = self.uint32()
+        account_auths = self.flat_map( self.string, self.uint16 )
+        key_auths = self.flat_map( self.public_key, self.uint16 )
+        return {"weight_threshold" : weight_threshold, "account_auths" : account_auths, "key_auths" : key_auths}
+
+    def chain_properties( self ):
+        return self.fields( (("account_creation_fee", self.asset), ("maximum_block_size", self.uint32), ("sbd_interest_rate", self.uint16)) )
+
+    def version( self ):
+        v = self.uint32()
+        return "{}.{}.{}".format(v >> 24, (v >> 16) & 0xFF, v & 0xFFFF)
+
+    def hardfork_version_vote( self ):
+        return self.fields( (("hf_version", self.version), ("hf_time", self.time_point_sec)) )
+
+    def signed_block_header( self ):
+        return self.fields((
+           ("previous", self.block_id),
+           ("timestamp", self.time_point_sec),
+           ("witness", self.string),
+           ("transaction_merkle_root", self.checksum),
+           ("extensions", lambda : self.vector( lambda : self.static_variant( ["void_t", "version", "hardfork_version_vote"] ) )),
+           ("witness_signature", self.signature),
+           ))
+
+    def pow( self ):
+        return self.fields( (("worker", self.public_key), ("input", self.digest), ("signature", self.signature), ("work", self.digest)) )
+
+    def pow2_input( self ):
+        return self.fields( (("worker_account", self.string), ("prev_block", self.block_id), ("nonce", self.uint64)) )
+
+    def pow2( self ):
+        return self.fields( (("input", self.pow2_input), ("pow_summary", self.uint32)) )
+
+    def equihash_proof( self ):
+        return self.fields( (("n", self.uint32), ("k", self.uint32), ("seed", self.digest), ("inputs", lambda : self.vector( self.uint32 ))) )
+
+    def equihash_pow( self ):
+        return self.fields( (("input", self.pow2_input), ("proof", self.equihash_proof), ("prev_block", self.block_id), ("pow_summary", self.uint32)) )
+
+    def comment_payout_beneficiaries( self ):
+        return {"beneficiaries" : self.vector( lambda : self.fields( (("account", self.string), ("weight", self.uint16)) ) )}
+
+    def allowed_vote_assets( self ):
+        return {"votable_assets" : self.flat_map( self.asset_symbol,
+           lambda : self.fields( (("max_accepted_payout", self.int64), ("allow_curation_rewards", self.boolean)) ) )}
+
+    def smt_generation_unit( self ):
+        return self.fields( (("steem_unit", lambda : self.flat_map( self.string, self.uint16 )), ("token_unit", lambda : self.flat_map( self.string, self.uint16 ))) )
+
+    def smt_cap_commitment( self ):
+        return self.fields( (("lower_bound", self.int64), ("upper_bound", self.int64), ("hash", self.digest)) )
+
+    def smt_capped_generation_policy( self ):
+        return self.fields((
+           ("pre_soft_cap_unit", self.smt_generation_unit),
+           ("post_soft_cap_unit", self.smt_generation_unit),
+           ("min_steem_units_commitment", self.smt_cap_commitment),
+           ("hard_cap_steem_units_commitment", self.smt_cap_commitment),
+           ("soft_cap_percent", self.uint16),
+           ("min_unit_ratio", self.uint32),
+           ("max_unit_ratio", self.uint32),
+           ("extensions", self.extensions),
+           ))
+
+    def smt_param_allow_voting( self ):
+        return {"value" : self.boolean()}
+
+    def smt_param_windows_v1( self ):
+        return self.fields( (("cashout_window_seconds", self.uint32), ("reverse_auction_window_seconds", self.uint32)) )
+
+    def smt_param_vote_regeneration_period_seconds_v1( self ):
+        return self.fields( (("vote_regeneration_period_seconds", self.uint32), ("votes_per_regeneration_period", self.uint32)) )
+
+    def smt_param_rewards_v1( self ):
+        return self.fields((
+           ("content_constant", self.uint128),
+           ("percent_curation_rewards", self.uint16),
+           ("percent_content_rewards", self.uint16),
+           ("author_reward_curve", self.int64),
+           ("curation_reward_curve", self.int64),
+           ))
+
+    def fields( self, layout ):
+        # Reads a struct given as ((name, read), ...) in encoding order
+        result = {}
+        for name, read in layout:
+            result[name] = read()
+        return result
+
+    # Transactions
+
+    def operation( self ):
+        which = self.varint()
+        if which >= len(rcdemo.operation_names):
+            raise ValueError("Unknown operation type {} at {}".format(which, self.pos))
+        op_type = rcdemo.operation_names[which]
+        return {"type" : op_type, "value" : self.fields( self.operation_layouts[op_type] )}
+
+    def transaction( self ):
+        return self.fields((
+           ("ref_block_num", self.uint16),
+           ("ref_block_prefix", self.uint32),
+           ("expiration", self.time_point_sec),
+           ("operations", lambda : self.vector( self.operation )),
+           ("extensions", self.extensions),
+           ))
+
+    def signed_transaction( self ):
+        tx = self.transaction()
+        tx["signatures"] = self.vector( self.signature )
+        return tx
+
+    def signed_block( self ):
+        block = self.signed_block_header()
+        block["transactions"] = self.vector( self.signed_transaction )
+        return block
+
+uint8_struct = struct.Struct("<B")
+uint16_struct = struct.Struct("<H")
+uint32_struct = struct.Struct("<I")
+uint64_struct = struct.Struct("<Q")
+int16_struct = struct.Struct("<h")
+int64_struct = struct.Struct("<q")
+
+def operation_layouts( d ):
+    # Field layouts of the operations for Deserializer d, in the order of rcdemo.Serializer.
+    # Payload fields are read with d.payload / d.payload_hex.
+    string = d.string
+    asset = d.asset
+    authority = d.authority
+    strings = lambda : d.vector( d.string )
+    optional_authority = lambda : d.optional( d.authority )
+    account_creator = (("owner", authority), ("active", authority), ("posting", authority),
+                       ("memo_key", d.public_key), ("json_metadata", d.payload))
+    return {
+       "vote_operation" : (("voter", string), ("author", string), ("permlink", string), ("weight", d.int16)),
+       "comment_operation" : (("parent_author", string), ("parent_permlink", string), ("author", string), ("permlink", string),
+                              ("title", d.payload), ("body", d.payload), ("json_metadata", d.payload)),
+       "transfer_operation" : (("from", string), ("to", string), ("amount", asset), ("memo", d.payload)),
+       "transfer_to_vesting_operation" : (("from", string), ("to", string), ("amount", asset)),
+       "withdraw_vesting_operation" : (("account", string), ("vesting_shares", asset)),
+       "limit_order_create_operation" : (("owner", string), ("orderid", d.uint32), ("amount_to_sell", asset), ("min_to_receive", asset),
+                                         ("fill_or_kill", d.boolean), ("expiration", d.time_point_sec)),
+       "limit_order_cancel_operation" : (("owner", string), ("orderid", d.uint32)),
+       "feed_publish_operation" : (("publisher", string), ("exchange_rate", d.price)),
+       "convert_operation" : (("owner", string), ("requestid", d.uint32), ("amount", asset)),
+       "account_create_operation" : (("fee", asset), ("creator", string), ("new_account_name", string)) + account_creator,
+       "account_update_operation" : (("account", string), ("owner", optional_authority), ("active", optional_authority),
+                                     ("posting", optional_authority), ("memo_key", d.public_key), ("json_metadata", d.payload)),
+       "witness_update_operation" : (("owner", string), ("url", string), ("block_signing_key", d.public_key),
+                                     ("props", d.chain_properties), ("fee", asset)),
+       "account_witness_vote_operation" : (("account", string), ("witness", string), ("approve", d.boolean)),
+       "account_witness_proxy_operation" : (("account", string), ("proxy", string)),
+       "pow_operation" : (("worker_account", string), ("block_id", d.block_id), ("nonce", d.uint64), ("work", d.pow),
+                          ("props", d.chain_properties)),
+       "custom_operation" : (("required_auths", strings), ("id", d.uint16), ("data", d.payload_hex)),
+       "report_over_production_operation" : (("reporter", string), ("first_block", d.signed_block_header),
+                                             ("second_block", d.signed_block_header)),
+       "delete_comment_operation" : (("author", string), ("permlink", string)),
+       "custom_json_operation" : (("required_auths", strings), ("required_posting_auths", strings), ("id", string), ("json", d.payload)),
+       "comment_options_operation" : (("author", string), ("permlink", string), ("max_accepted_payout", asset),
+                                      ("percent_steem_dollars", d.uint16), ("allow_votes", d.boolean), ("allow_curation_rewards", d.boolean),
+                                      ("extensions", lambda : d.vector( lambda : d.static_variant( ["comment_payout_beneficiaries", "allowed_vote_assets"] ) ))),
+       "set_withdraw_vesting_route_operation" : (("from_account", string), ("to_account", string), ("percent", d.uint16), ("auto_vest", d.boolean)),
+       "limit_order_create2_operation" : (("owner", string), ("orderid", d.uint32), ("amount_to_sell", asset), ("exchange_rate", d.price),
+                                          ("fill_or_kill", d.boolean), ("expiration", d.time_point_sec)),
+       "claim_account_operation" : (("creator", string), ("fee", asset), ("extensions", d.extensions)),
+       "create_claimed_account_operation" : (("creator", string), ("new_account_name", string)) + account_creator + (("extensions", d.extensions),),
+       "request_account_recovery_operation" : (("recovery_account", string), ("account_to_recover", string),
+                                               ("new_owner_authority", authority), ("extensions", d.extensions)),
+       "recover_account_operation" : (("account_to_recover", string), ("new_owner_authority", authority),
+                                      ("recent_owner_authority", authority), ("extensions", d.extensions)),
+       "change_recovery_account_operation" : (("account_to_recover", string), ("new_recovery_account", string), ("extensions", d.extensions)),
+       "escrow_transfer_operation" : (("from", string), ("to", string), ("sbd_amount", asset), ("steem_amount", asset), ("escrow_id", d.uint32),
+                                      ("agent", string), ("fee", asset), ("json_meta", d.payload), ("ratification_deadline", d.time_point_sec),
+                                      ("escrow_expiration", d.time_point_sec)),
+       "escrow_dispute_operation" : (("from", string), ("to", string), ("agent", string), ("who", string), ("escrow_id", d.uint32)),
+       "escrow_release_operation" : (("from", string), ("to", string), ("agent", string), ("who", string), ("receiver", string),
+                                     ("escrow_id", d.uint32), ("sbd_amount", asset), ("steem_amount", asset)),
+       "pow2_operation" : (("work", lambda : d.static_variant( ["pow2", "equihash_pow"] )),
+                           ("new_owner_key", lambda : d.optional( d.public_key )), ("props", d.chain_properties)),
+       "escrow_approve_operation" : (("from", string), ("to", string), ("agent", string), ("who", string), ("escrow_id", d.uint32),
+                                     ("approve", d.boolean)),
+       "transfer_to_savings_operation" : (("from", string), ("to", string), ("amount", asset), ("memo", d.payload)),
+       "transfer_from_savings_operation" : (("from", string), ("request_id", d.uint32), ("to", string), ("amount", asset), ("memo", d.payload)),
+       "cancel_transfer_from_savings_operation" : (("from", string), ("request_id", d.uint32)),
+       "custom_binary_operation" : (("required_owner_auths", strings), ("required_active_auths", strings), ("required_posting_auths", strings),
+                                    ("required_auths", lambda : d.vector( d.authority )), ("id", string), ("data", d.payload_hex)),
+       "decline_voting_rights_operation" : (("account", string), ("decline", d.boolean)),
+       "reset_account_operation" : (("reset_account", string), ("account_to_reset", string), ("new_owner_authority", authority)),
+       "set_reset_account_operation" : (("account", string), ("current_reset_account", string), ("reset_account", string)),
+       "claim_reward_balance_operation" : (("account", string), ("reward_steem", asset), ("reward_sbd", asset), ("reward_vests", asset)),
+       "delegate_vesting_shares_operation" : (("delegator", string), ("delegatee", string), ("vesting_shares", asset)),
+       "account_create_with_delegation_operation" : (("fee", asset), ("delegation", asset), ("creator", string), ("new_account_name", string))
+                                                    + account_creator + (("extensions", d.extensions),),
+       "witness_set_properties_operation" : (("owner", string), ("props", lambda : d.flat_map( d.string, d.hex_bytes )), ("extensions", d.extensions)),
+       "claim_reward_balance2_operation" : (("account", string), ("extensions", d.extensions), ("reward_tokens", lambda : d.vector( d.asset ))),
+       "smt_setup_operation" : (("control_account", string), ("symbol", d.asset_symbol), ("decimal_places", d.uint8), ("max_supply", d.int64),
+                                ("initial_generation_policy", lambda : d.static_variant( ["smt_capped_generation_policy"] )),
+                                ("generation_begin_time", d.time_point_sec), ("generation_end_time", d.time_point_sec),
+                                ("announced_launch_time", d.time_point_sec), ("launch_expiration_time", d.time_point_sec), ("extensions", d.extensions)),
+       "smt_cap_reveal_operation" : (("control_account", string), ("symbol", d.asset_symbol),
+                                     ("cap", lambda : d.fields( (("amount", d.int64), ("nonce", d.uint128)) )), ("extensions", d.extensions)),
+       "smt_refund_operation" : (("executor", string), ("contributor", string), ("symbol", d.asset_symbol), ("contribution_id", d.uint32),
+                                 ("amount", asset), ("extensions", d.extensions)),
+       "smt_setup_emissions_operation" : (("control_account", string), ("symbol", d.asset_symbol), ("schedule_time", d.time_point_sec),
+                                          ("emissions_unit", lambda : {"token_unit" : d.flat_map( d.string, d.uint16 )}),
+                                          ("interval_seconds", d.uint32), ("interval_count", d.uint32), ("lep_time", d.time_point_sec),
+                                          ("rep_time", d.time_point_sec), ("lep_abs_amount", asset), ("rep_abs_amount", asset),
+                                          ("lep_rel_amount_numerator", d.uint32), ("rep_rel_amount_numerator", d.uint32),
+                                          ("rel_amount_denom_bits", d.uint8), ("extensions", d.extensions)),
+       "smt_set_setup_parameters_operation" : (("control_account", string), ("symbol", d.asset_symbol),
+                                               ("setup_parameters", lambda : d.vector( lambda : d.static_variant( ["smt_param_allow_voting"] ) )),
+                                               ("extensions", d.extensions)),
+       "smt_set_runtime_parameters_operation" : (("control_account", string), ("symbol", d.asset_symbol),
+                                                 ("runtime_parameters", lambda : d.vector( lambda : d.static_variant( [
+                                                    "smt_param_windows_v1",
+                                                    "smt_param_vote_regeneration_period_seconds_v1",
+                                                    "smt_param_rewards_v1",
+                                                    ] ) )),
+                                                 ("extensions", d.extensions)),
+       "smt_create_operation" : (("control_account", string), ("symbol", d.asset_symbol), ("smt_creation_fee", asset),
+                                 ("precision", d.uint8), ("extensions", d.extensions)),
+       }
+
+class BlockLogReader(object):
+    # Memory-mapped block_log, with block_log.index (if present) for random access
+    def __init__(self, filename, index_filename=None):
+        self.filename = filename
+        self._file = open(filename, "rb")
+        self.buf = mmap.mmap( self._file.fileno(), 0, access=mmap.ACCESS_READ )
+        if index_filename is None:
+            index_filename = filename + ".index"
+        self.index = None
+        self._index_file = None
+        if os.path.exists(index_filename) and os.path.getsize(index_filename) > 0:
+            self._index_file = open(index_filename, "rb")
+            self.index = mmap.mmap( self._index_file.fileno(), 0, access=mmap.ACCESS_READ )
+        self.decoder = Deserializer( self.buf )
+
+    def head_block_num(self):
+        if self.index is not None:
+            return len(self.index) // 8
+        # The last 8 bytes are the position of the last block, whose number is in its header
+        if len(self.buf) == 0:
+            return 0
+        return self.read_block_at( uint64_struct.unpack_from(self.buf, len(self.buf) - 8)[0] )[0]["block_num"]
+
+    def block_position( self, block_num ):
+        if self.index is None:
+            raise ValueError("Random access needs block_log.index")
+        if block_num < 1 or 8 * block_num > len(self.index):
+            raise IndexError("Block {} is not in the block_log".format(block_num))
+        return uint64_struct.unpack_from(self.index, 8 * (block_num - 1))[0]
+
+    def read_block_at( self, pos, trim=True ):
+        # Returns (block, position of the next block)
+        d = self.decoder
+        d.pos = pos
+        previous = d.block_id()
+        timestamp = d.time_point_sec()
+        witness = d.string()
+        d.pos += 20
+        d.vector( lambda : d.static_variant( ["void_t", "version", "hardfork_version_vote"] ) )
+        d.pos += rcdemo.STEEM_SIGNATURE_SIZE
+
+        txs = []
+        tx_sizes = []
+        for i in range(d.varint()):
+            start = d.pos
+            if trim:
+                # Skip ref_block_num, ref_block_prefix and expiration
+                d.pos += 10
+                ops = d.vector( d.operation )
+                d.extensions()
+                signature_count = d.varint()
+                d.pos += signature_count * rcdemo.STEEM_SIGNATURE_SIZE
+                txs.append( {"operations" : [
+                   {"type" : op["type"], "value" : dict( (k, op["value"][k]) for k in rcdemo.operation_record_fields.get(op["type"], ()) if k in op["value"] )}
+                   for op in ops]} )
+            else:
+                txs.append( d.signed_transaction() )
+            # The transaction's size is the length of its encoding
+            tx_sizes.append( d.pos - start )
+        block = {
+           # The block number of previous is in its first 4 bytes, big endian
+           "block_num" : int(previous[:8], 16) + 1,
+           "timestamp" : timestamp,
+           "witness" : witness,
+           "transactions" : txs,
+           "transaction_sizes" : tx_sizes,
+           }
+        # Skip the uint64 position which follows each block
+        return block, d.pos + 8
+
+    def read_block( self, block_num, trim=True ):
+        return self.read_block_at( self.block_position( block_num ), trim )[0]
+
+    def blocks( self, start_block_num=1, end_block_num=None, trim=True ):
+        # Yields blocks in [start_block_num, end_block_num) sequentially.  The first one is
+        # found through the index when there is one, otherwise by reading forward from the
+        # start of the log and skipping earlier blocks.
+        if start_block_num > 1 and self.index is not None:
+            pos = self.block_position( start_block_num )
+        else:
+            pos = 0
+        size = len(self.buf)
+        while pos < size:
+            block, pos = self.read_block_at( pos, trim )
+            if end_block_num is not None and block["block_num"] >= end_block_num:
+                break
+            if block["block_num"] >= start_block_num:
+                yield block
+
+    def close(self):
+        self.buf.close()
+        self._file.close()
+        if self.index is not None:
+            self.index.close()
+            self._index_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+def main( argv=None ):
+    parser = argparse.ArgumentParser( description="Count RC resources straight from a steemd block_log" )
+    parser.add_argument( "block_log" )
+    parser.add_argument( "--start", type=int, default=1, help="First block number" )
+    parser.add_argument( "--end", type=int, help="Stop before this block number" )
+    args = parser.parse_args(argv)
+
+    with BlockLogReader( args.block_log ) as reader:
+        totals = rcdemo.count_blocks( reader.blocks( args.start, args.end ), rcdemo.resource_params )
+    print( json.dumps( totals.to_dict(), indent=1 ) )
+
+if __name__ == "__main__":
+    main()
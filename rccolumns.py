@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+
+# Columnar store of per-transaction resource counts and RC costs.  Each column is a file of
+# fixed-width little-endian integers, one row per transaction, in replay order:
+#
+#   block_num, tx_index                  uint32
+#   count.<resource_name>                int64, unscaled like get_resource_count_matrix()
+#   cost.<resource_name>                 int64, like get_rc_cost_columns()
+#
+# meta.json records the resource names.  The row count is derived from the column file
+# sizes, so rows left incomplete by an interrupted writer are ignored and overwritten.
+#
+# ColumnStoreReader maps the files with numpy.memmap when NumPy is installed.  Without it,
+# columns are memoryviews over mmap, which are zero-copy too but lack NumPy's vectorized
+# aggregations.
+
+import array
+import bisect
+import collections
+import json
+import mmap
+import os
+import sys
+
+import rcdemo
+
+column_formats = {"block_num" : "I", "tx_index" : "I"}
+numpy_dtypes = {"I" : "<u4", "q" : "<i8"}
+
+def column_names( resource_names ):
+    return (["block_num", "tx_index"]
+      + ["count." + resource_name for resource_name in resource_names]
+      + ["cost." + resource_name for resource_name in resource_names])
+
+def column_format( name ):
+    return column_formats.get(name, "q")
+
+def column_filename( directory, name ):
+    return os.path.join(directory, name + ".col")
+
+def read_row_count( directory, names ):
+    return min( os.path.getsize(column_filename( directory, name )) // array.array(column_format( name )).itemsize
+                for name in names )
+
+class ColumnStoreWriter(object):
+    # Appends rows to the store in directory, creating it if needed
+    def __init__(self, directory, resource_names, buffer_rows=65536):
+        self.directory = directory
+        self.resource_names = list(resource_names)
+        self.names = column_names( self.resource_names )
+        self.buffer_rows = buffer_rows
+        meta_filename = os.path.join(directory, "meta.json")
+        if os.path.exists(meta_filename):
+            with open(meta_filename, "r") as f:
+                meta = json.load(f)
+            if meta["resource_names"] != self.resource_names:
+                raise ValueError("Store {} has resource_names {}".format(directory, meta["resource_names"]))
+        else:
+            os.makedirs(directory, exist_ok=True)
+            with open(meta_filename, "w") as f:
+                json.dump( collections.OrderedDict( (("version", 1), ("resource_names", self.resource_names)) ), f )
+            for name in self.names:
+                open(column_filename( directory, name ), "ab").close()
+        self.row_count = read_row_count( directory, self.names )
+        self._files = []
+        for name in self.names:
+            f = open(column_filename( directory, name ), "r+b")
+            f.truncate( self.row_count * array.array(column_format( name )).itemsize )
+            f.seek(0, os.SEEK_END)
+            self._files.append(f)
+        self._buffers = [array.array(column_format( name )) for name in self.names]
+
+    def append( self, block_num, tx_index, counts, costs ):
+        buffers = self._buffers
+        buffers[0].append(block_num)
+        buffers[1].append(tx_index)
+        for i, value in enumerate(counts, 2):
+            buffers[i].append(value)
+        for i, value in enumerate(costs, 2 + len(self.resource_names)):
+            buffers[i].append(value)
+        if len(buffers[0]) >= self.buffer_rows:
+            self.flush()
+
+    def append_block( self, block_num, count_matrix, cost_columns ):
+        # count_matrix and cost_columns as in replay_blocks( ..., per_transaction=True ) snapshots
+        n = len(count_matrix)
+        if n == 0:
+            return
+        buffers = self._buffers
+        buffers[0].extend( [block_num] * n )
+        buffers[1].extend( range(n) )
+        for i, column in enumerate(zip(*count_matrix), 2):
+            buffers[i].extend(column)
+        for i, column in enumerate(cost_columns.values(), 2 + len(self.resource_names)):
+            buffers[i].extend(column)
+        if len(buffers[0]) >= self.buffer_rows:
+            self.flush()
+
+    def flush(self):
+        rows = len(self._buffers[0])
+        for f, buf in zip(self._files, self._buffers):
+            if sys.byteorder != "little":
+                buf.byteswap()
+            buf.tofile(f)
+            f.flush()
+            del buf[:]
+        self.row_count += rows
+
+    def close(self):
+        self.flush()
+        for f in self._files:
+            f.close()
+        self._files = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+def write_replay( directory, blocks, model, **kwargs ):
+    # Replays blocks (see replay_blocks) and appends every transaction to the store,
+    # returns the number of blocks written
+    block_count = 0
+    with ColumnStoreWriter( directory, model.resource_names ) as writer:
+        for snapshot in rcdemo.replay_blocks( blocks, model, per_transaction=True, **kwargs ):
+            writer.append_block( snapshot["block_num"], snapshot["count_matrix"], snapshot["cost_columns"] )
+            block_count += 1
+    return block_count
+
+class ColumnStoreReader(object):
+    def __init__(self, directory, use_numpy=None):
+        # use_numpy=None uses NumPy if it can be imported
+        self.directory = directory
+        with open(os.path.join(directory, "meta.json"), "r") as f:
+            meta = json.load(f)
+        self.resource_names = meta["resource_names"]
+        self.names = column_names( self.resource_names )
+        self.row_count = read_row_count( directory, self.names )
+        self.numpy = None
+        if use_numpy is not False:
+            try:
+                import numpy
+                self.numpy = numpy
+            except ImportError:
+                if use_numpy:
+                    raise
+        self._columns = {}
+        self._maps = []
+
+    def column( self, name ):
+        # The whole column, mapped on first use
+        col = self._columns.get(name)
+        if col is not None:
+            return col
+        fmt = column_format( name )
+        if self.numpy is not None:
+            if self.row_count == 0:
+                col = self.numpy.zeros( 0, dtype=numpy_dtypes[fmt] )
+            else:
+                col = self.numpy.memmap( column_filename( self.directory, name ), dtype=numpy_dtypes[fmt], mode="r", shape=(self.row_count,) )
+        else:
+            if sys.byteorder != "little":
+                raise NotImplementedError("The memoryview reader needs a little-endian machine, install NumPy")
+            if self.row_count == 0:
+                col = memoryview(array.array(fmt))
+            else:
+                with open(column_filename( self.directory, name ), "rb") as f:
+                    m = mmap.mmap( f.fileno(), 0, access=mmap.ACCESS_READ )
+                view = memoryview(m)
+                rows = view[:self.row_count * array.array(fmt).itemsize]
+                col = rows.cast(fmt)
+                self._maps.append( (m, [col, rows, view]) )
+        self._columns[name] = col
+        return col
+
+    def block_rows( self, start_block_num, end_block_num ):
+        # Row range (start, end) of the blocks in [start_block_num, end_block_num), found by
+        # binary search since rows are stored in block order
+        block_num = self.column( "block_num" )
+        if self.numpy is not None:
+            return (int(block_num.searchsorted( start_block_num, "left" )), int(block_num.searchsorted( end_block_num, "left" )))
+        return (bisect.bisect_left( block_num, start_block_num ), bisect.bisect_left( block_num, end_block_num ))
+
+    def sum( self, name, start=0, end=None ):
+        col = self.column( name )[start:end]
+        if self.numpy is not None:
+            # int64 sums of RC costs over long ranges can overflow.  Sum chunks short enough
+            # that their int64 sums cannot, and add the chunk sums as Python ints.
+            if not len(col):
+                return 0
+            largest = max( int(col.max()), -int(col.min()), 1 )
+            n = max( 1, 2**63 // (largest + 1) )
+            return sum( int(col[i:i+n].sum( dtype=self.numpy.int64 )) for i in range(0, len(col), n) )
+        return sum(col)
+
+    def totals( self, start_block_num=None, end_block_num=None ):
+        # Sums of every count and cost column over a block range, default everything
+        start, end = 0, self.row_count
+        if start_block_num is not None or end_block_num is not None:
+            start, end = self.block_rows( 0 if start_block_num is None else start_block_num,
+                                          2**32 if end_block_num is None else end_block_num )
+        return collections.OrderedDict((
+           ("transaction_count", end - start),
+           ("resource_count", collections.OrderedDict( (resource_name, self.sum( "count." + resource_name, start, end ))
+                                                       for resource_name in self.resource_names )),
+           ("cost", collections.OrderedDict( (resource_name, self.sum( "cost." + resource_name, start, end ))
+                                             for resource_name in self.resource_names )),
+           ))
+
+    def close(self):
+        self._columns = {}
+        for m, views in self._maps:
+            try:
+                for view in views:
+                    view.release()
+                m.close()
+            except BufferError:
+                # A caller still holds a view of this column, the map is closed when collected
+                pass
+        self._maps = []
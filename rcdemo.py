@@ -1,6 +1,15 @@
 #!/usr/bin/env python3
 
+import array
+import bisect
 import collections
+import contextlib
+import itertools
+import os
+import re
+import struct
+import threading
+import time
 
 class CountOperationVisitor(object):
 
@@ -238,15 +247,1138 @@ class CountOperationVisitor(object):
     def visit_producer_reward_operation( self, op ): pass
     def visit_clear_null_account_balance_operation( self, op ): pass
 
+# Order of fc::static_variant operation, with STEEM_ENABLE_SMT
+operation_names = [
+    "vote_operation",
+    "comment_operation",
+    "transfer_operation",
+    "transfer_to_vesting_operation",
+    "withdraw_vesting_operation",
+    "limit_order_create_operation",
+    "limit_order_cancel_operation",
+    "feed_publish_operation",
+    "convert_operation",
+    "account_create_operation",
+    "account_update_operation",
+    "witness_update_operation",
+    "account_witness_vote_operation",
+    "account_witness_proxy_operation",
+    "pow_operation",
+    "custom_operation",
+    "report_over_production_operation",
+    "delete_comment_operation",
+    "custom_json_operation",
+    "comment_options_operation",
+    "set_withdraw_vesting_route_operation",
+    "limit_order_create2_operation",
+    "claim_account_operation",
+    "create_claimed_account_operation",
+    "request_account_recovery_operation",
+    "recover_account_operation",
+    "change_recovery_account_operation",
+    "escrow_transfer_operation",
+    "escrow_dispute_operation",
+    "escrow_release_operation",
+    "pow2_operation",
+    "escrow_approve_operation",
+    "transfer_to_savings_operation",
+    "transfer_from_savings_operation",
+    "cancel_transfer_from_savings_operation",
+    "custom_binary_operation",
+    "decline_voting_rights_operation",
+    "reset_account_operation",
+    "set_reset_account_operation",
+    "claim_reward_balance_operation",
+    "delegate_vesting_shares_operation",
+    "account_create_with_delegation_operation",
+    "witness_set_properties_operation",
+    "claim_reward_balance2_operation",
+    "smt_setup_operation",
+    "smt_cap_reveal_operation",
+    "smt_refund_operation",
+    "smt_setup_emissions_operation",
+    "smt_set_setup_parameters_operation",
+    "smt_set_runtime_parameters_operation",
+    "smt_create_operation",
+    ]
+
+operation_ids = dict( (name, i) for i, name in enumerate(operation_names) )
+
+# Legacy assets are serialized as an 8-byte precision + name, SMT's as a 4-byte asset_num
+legacy_nai_symbols = {
+    "@@000000021" : (3, "STEEM"),
+    "@@000000013" : (3, "SBD"),
+    "@@000000037" : (6, "VESTS"),
+    }
+
+STEEM_PUBLIC_KEY_SIZE = 33
+STEEM_SIGNATURE_SIZE = 65
+
+base58_alphabet = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+
+def base58_decode( s ):
+    n = 0
+    for c in s:
+        n = n*58 + base58_alphabet.index(c)
+    pad = len(s) - len(s.lstrip("1"))
+    return b"\x00" * pad + n.to_bytes((n.bit_length() + 7) // 8, "little")[::-1]
+
+def varint_size( n ):
+    size = 1
+    while n >= 0x80:
+        n >>= 7
+        size += 1
+    return size
+
+def get_static_variant( sv ):
+    # Accept both {"type" : name, "value" : v} and [name, v]
+    if isinstance(sv, dict):
+        return sv["type"], sv["value"]
+    return sv[0], sv[1]
+
+# Port of the fc::raw serialization of signed_transaction.  Each protocol type is a method
+# named after its C++ type which takes the JSON representation returned by the API.
+class Serializer(object):
+
+    def __init__(self):
+        self.buf = bytearray()
+
+    def flush(self):
+        result = bytes(self.buf)
+        self.buf = bytearray()
+        return result
+
+    # Primitive types
+
+    def raw( self, b ):
+        self.buf += b
+
+    def uint8( self, v ):
+        self.buf += struct.pack("<B", int(v))
+
+    def uint16( self, v ):
+        self.buf += struct.pack("<H", int(v))
+
+    def uint32( self, v ):
+        self.buf += struct.pack("<I", int(v))
+
+    def uint64( self, v ):
+        self.buf += struct.pack("<Q", int(v))
+
+    def uint128( self, v ):
+        self.buf += int(v).to_bytes(16, "little")
+
+    def int16( self, v ):
+        self.buf += struct.pack("<h", int(v))
+
+    def int64( self, v ):
+        self.buf += struct.pack("<q", int(v))
+
+    def boolean( self, v ):
+        self.buf += b"\x01" if v else b"\x00"
+
+    def varint( self, v ):
+        v = int(v)
+        while v >= 0x80:
+            self.buf.append((v & 0x7F) | 0x80)
+            v >>= 7
+        self.buf.append(v)
+
+    def string( self, s ):
+        b = s.encode("utf8")
+        self.varint(len(b))
+        self.buf += b
+
+    def hex_bytes( self, h ):
+        # vector<char>
+        b = bytes.fromhex(h)
+        self.varint(len(b))
+        self.buf += b
+
+    def fixed_hex( self, h, size ):
+        b = bytes.fromhex(h)
+        if len(b) != size:
+            raise ValueError("Expected {} bytes, got {}".format(size, len(b)))
+        self.buf += b
+
+    def time_point_sec( self, t ):
+        # Imported here since only full serialization needs it, not counting or pricing
+        import calendar
+        self.uint32(calendar.timegm(time.strptime(t, "%Y-%m-%dT%H:%M:%S")))
+
+    def public_key( self, k ):
+        # Prefix (STM, TST, ...) + base58( compressed key + 4 byte checksum )
+        self.buf += base58_decode(k[3:])[:STEEM_PUBLIC_KEY_SIZE]
+
+    def signature( self, s ):
+        self.fixed_hex( s, STEEM_SIGNATURE_SIZE )
+
+    def block_id( self, h ):
+        self.fixed_hex( h, 20 )
+
+    def checksum( self, h ):
+        self.fixed_hex( h, 20 )
+
+    def digest( self, h ):
+        self.fixed_hex( h, 32 )
+
+    # Containers
+
+    def vector( self, f, v ):
+        self.varint(len(v))
+        for x in v:
+            f(x)
+
+    def flat_map( self, fk, fv, m ):
+        if isinstance(m, dict):
+            m = list(m.items())
+        self.varint(len(m))
+        for k, v in m:
+            fk(k)
+            fv(v)
+
+    def optional( self, f, v ):
+        if v is None:
+            self.boolean(False)
+        else:
+            self.boolean(True)
+            f(v)
+
+    def static_variant( self, types, sv ):
+        name, value = get_static_variant(sv)
+        if isinstance(name, int):
+            which = name
+        else:
+            which = types.index(name)
+        self.varint(which)
+        getattr(self, types[which])(value)
+
+    def void_t( self, v ):
+        pass
+
+    def extensions( self, exts ):
+        # flat_set< static_variant< void_t > >
+        self.vector( lambda e : self.static_variant( ["void_t"], e ), exts )
+
+    # Protocol types
+
+    def asset_symbol( self, symbol ):
+        if isinstance(symbol, dict):
+            nai = symbol["nai"]
+            precision = symbol.get("precision", symbol.get("decimals"))
+        else:
+            nai, precision = symbol
+        if nai in legacy_nai_symbols:
+            precision, name = legacy_nai_symbols[nai]
+            self.legacy_symbol( precision, name )
+        else:
+            self.uint32( (int(nai[2:-1]) << 5) | 0x10 | int(precision) )
+
+    def legacy_symbol( self, precision, name ):
+        self.uint8( precision )
+        self.raw( name.encode("ascii").ljust(7, b"\x00") )
+
+    def asset( self, a ):
+        if isinstance(a, dict):
+            self.int64( a["amount"] )
+            self.asset_symbol( a )
+        else:
+            # Legacy "1.000 STEEM" format
+            amount, name = a.split(" ")
+            self.int64( amount.replace(".", "") )
+            self.legacy_symbol( len(amount.partition(".")[2]), name )
+
+    def price( self, p ):
+        self.asset( p["base"] )
+        self.asset( p["quote"] )
+
+    def authority( self, auth ):
+        self.uint32( auth["weight_threshold"] )
+        self.flat_map( self.string, self.uint16, auth["account_auths"] )
+        self.flat_map( self.public_key, self.uint16, auth["key_auths"] )
+
+    def chain_properties( self, props ):
+        self.asset( props["account_creation_fee"] )
+        self.uint32( props["maximum_block_size"] )
+        self.uint16( props["sbd_interest_rate"] )
+
+    def version( self, v ):
+        major, minor, patch = (int(x) for x in v.split("."))
+        self.uint32( (major << 24) | (minor << 16) | patch )
+
+    def hardfork_version_vote( self, v ):
+        self.version( v["hf_version"] )
+        self.time_point_sec( v["hf_time"] )
+
+    def signed_block_header( self, h ):
+        self.block_id( h["previous"] )
+        self.time_point_sec( h["timestamp"] )
+        self.string( h["witness"] )
+        self.checksum( h["transaction_merkle_root"] )
+        self.vector( lambda e : self.static_variant( ["void_t", "version", "hardfork_version_vote"], e ), h["extensions"] )
+        self.signature( h["witness_signature"] )
+
+    def pow( self, work ):
+        self.public_key( work["worker"] )
+        self.digest( work["input"] )
+        self.signature( work["signature"] )
+        self.digest( work["work"] )
+
+    def pow2_input( self, i ):
+        self.string( i["worker_account"] )
+        self.block_id( i["prev_block"] )
+        self.uint64( i["nonce"] )
+
+    def pow2( self, work ):
+        self.pow2_input( work["input"] )
+        self.uint32( work["pow_summary"] )
+
+    def equihash_pow( self, work ):
+        self.pow2_input( work["input"] )
+        self.uint32( work["proof"]["n"] )
+        self.uint32( work["proof"]["k"] )
+        self.digest( work["proof"]["seed"] )
+        self.vector( self.uint32, work["proof"]["inputs"] )
+        self.block_id( work["prev_block"] )
+        self.uint32( work["pow_summary"] )
+
+    def comment_payout_beneficiaries( self, bens ):
+        def beneficiary_route_type( b ):
+            self.string( b["account"] )
+            self.uint16( b["weight"] )
+        self.vector( beneficiary_route_type, bens["beneficiaries"] )
+
+    def allowed_vote_assets( self, ava ):
+        def votable_asset_info_v1( info ):
+            self.int64( info["max_accepted_payout"] )
+            self.boolean( info["allow_curation_rewards"] )
+        self.flat_map( self.asset_symbol, votable_asset_info_v1, ava["votable_assets"] )
+
+    def smt_generation_unit( self, u ):
+        self.flat_map( self.string, self.uint16, u["steem_unit"] )
+        self.flat_map( self.string, self.uint16, u["token_unit"] )
+
+    def smt_cap_commitment( self, c ):
+        self.int64( c["lower_bound"] )
+        self.int64( c["upper_bound"] )
+        self.digest( c["hash"] )
+
+    def smt_capped_generation_policy( self, p ):
+        self.smt_generation_unit( p["pre_soft_cap_unit"] )
+        self.smt_generation_unit( p["post_soft_cap_unit"] )
+        self.smt_cap_commitment( p["min_steem_units_commitment"] )
+        self.smt_cap_commitment( p["hard_cap_steem_units_commitment"] )
+        self.uint16( p["soft_cap_percent"] )
+        self.uint32( p["min_unit_ratio"] )
+        self.uint32( p["max_unit_ratio"] )
+        self.extensions( p["extensions"] )
+
+    def smt_param_allow_voting( self, p ):
+        self.boolean( p["value"] )
+
+    def smt_param_windows_v1( self, p ):
+        self.uint32( p["cashout_window_seconds"] )
+        self.uint32( p["reverse_auction_window_seconds"] )
+
+    def smt_param_vote_regeneration_period_seconds_v1( self, p ):
+        self.uint32( p["vote_regeneration_period_seconds"] )
+        self.uint32( p["votes_per_regeneration_period"] )
+
+    def smt_param_rewards_v1( self, p ):
+        self.uint128( p["content_constant"] )
+        self.uint16( p["percent_curation_rewards"] )
+        self.uint16( p["percent_content_rewards"] )
+        self.int64( p["author_reward_curve"] )
+        self.int64( p["curation_reward_curve"] )
+
+    # Transactions
+
+    def operation( self, op ):
+        self.varint( operation_ids[op["type"]] )
+        getattr(self, op["type"])(op["value"])
+
+    def transaction( self, tx ):
+        self.uint16( tx["ref_block_num"] )
+        self.uint32( tx["ref_block_prefix"] )
+        self.time_point_sec( tx["expiration"] )
+        self.vector( self.operation, tx["operations"] )
+        self.extensions( tx["extensions"] )
+
+    def signed_transaction( self, tx ):
+        self.transaction( tx )
+        self.vector( self.signature, tx["signatures"] )
+
+    # Operations
+
+    def vote_operation( self, op ):
+        self.string( op["voter"] )
+        self.string( op["author"] )
+        self.string( op["permlink"] )
+        self.int16( op["weight"] )
+
+    def comment_operation( self, op ):
+        self.string( op["parent_author"] )
+        self.string( op["parent_permlink"] )
+        self.string( op["author"] )
+        self.string( op["permlink"] )
+        self.string( op["title"] )
+        self.string( op["body"] )
+        self.string( op["json_metadata"] )
+
+    def transfer_operation( self, op ):
+        self.string( op["from"] )
+        self.string( op["to"] )
+        self.asset( op["amount"] )
+        self.string( op["memo"] )
+
+    def transfer_to_vesting_operation( self, op ):
+        self.string( op["from"] )
+        self.string( op["to"] )
+        self.asset( op["amount"] )
+
+    def withdraw_vesting_operation( self, op ):
+        self.string( op["account"] )
+        self.asset( op["vesting_shares"] )
+
+    def limit_order_create_operation( self, op ):
+        self.string( op["owner"] )
+        self.uint32( op["orderid"] )
+        self.asset( op["amount_to_sell"] )
+        self.asset( op["min_to_receive"] )
+        self.boolean( op["fill_or_kill"] )
+        self.time_point_sec( op["expiration"] )
+
+    def limit_order_cancel_operation( self, op ):
+        self.string( op["owner"] )
+        self.uint32( op["orderid"] )
+
+    def feed_publish_operation( self, op ):
+        self.string( op["publisher"] )
+        self.price( op["exchange_rate"] )
+
+    def convert_operation( self, op ):
+        self.string( op["owner"] )
+        self.uint32( op["requestid"] )
+        self.asset( op["amount"] )
+
+    def account_create_operation( self, op ):
+        self.asset( op["fee"] )
+        self.string( op["creator"] )
+        self.string( op["new_account_name"] )
+        self.authority( op["owner"] )
+        self.authority( op["active"] )
+        self.authority( op["posting"] )
+        self.public_key( op["memo_key"] )
+        self.string( op["json_metadata"] )
+
+    def account_update_operation( self, op ):
+        self.string( op["account"] )
+        self.optional( self.authority, op.get("owner") )
+        self.optional( self.authority, op.get("active") )
+        self.optional( self.authority, op.get("posting") )
+        self.public_key( op["memo_key"] )
+        self.string( op["json_metadata"] )
+
+    def witness_update_operation( self, op ):
+        self.string( op["owner"] )
+        self.string( op["url"] )
+        self.public_key( op["block_signing_key"] )
+        self.chain_properties( op["props"] )
+        self.asset( op["fee"] )
+
+    def account_witness_vote_operation( self, op ):
+        self.string( op["account"] )
+        self.string( op["witness"] )
+        self.boolean( op["approve"] )
+
+    def account_witness_proxy_operation( self, op ):
+        self.string( op["account"] )
+        self.string( op["proxy"] )
+
+    def pow_operation( self, op ):
+        self.string( op["worker_account"] )
+        self.block_id( op["block_id"] )
+        self.uint64( op["nonce"] )
+        self.pow( op["work"] )
+        self.chain_properties( op["props"] )
+
+    def custom_operation( self, op ):
+        self.vector( self.string, op["required_auths"] )
+        self.uint16( op["id"] )
+        self.hex_bytes( op["data"] )
+
+    def report_over_production_operation( self, op ):
+        self.string( op["reporter"] )
+        self.signed_block_header( op["first_block"] )
+        self.signed_block_header( op["second_block"] )
+
+    def delete_comment_operation( self, op ):
+        self.string( op["author"] )
+        self.string( op["permlink"] )
+
+    def custom_json_operation( self, op ):
+        self.vector( self.string, op["required_auths"] )
+        self.vector( self.string, op["required_posting_auths"] )
+        self.string( op["id"] )
+        self.string( op["json"] )
+
+    def comment_options_operation( self, op ):
+        self.string( op["author"] )
+        self.string( op["permlink"] )
+        self.asset( op["max_accepted_payout"] )
+        self.uint16( op["percent_steem_dollars"] )
+        self.boolean( op["allow_votes"] )
+        self.boolean( op["allow_curation_rewards"] )
+        self.vector( lambda e : self.static_variant( ["comment_payout_beneficiaries", "allowed_vote_assets"], e ), op["extensions"] )
+
+    def set_withdraw_vesting_route_operation( self, op ):
+        self.string( op["from_account"] )
+        self.string( op["to_account"] )
+        self.uint16( op["percent"] )
+        self.boolean( op["auto_vest"] )
+
+    def limit_order_create2_operation( self, op ):
+        self.string( op["owner"] )
+        self.uint32( op["orderid"] )
+        self.asset( op["amount_to_sell"] )
+        self.price( op["exchange_rate"] )
+        self.boolean( op["fill_or_kill"] )
+        self.time_point_sec( op["expiration"] )
+
+    def claim_account_operation( self, op ):
+        self.string( op["creator"] )
+        self.asset( op["fee"] )
+        self.extensions( op["extensions"] )
+
+    def create_claimed_account_operation( self, op ):
+        self.string( op["creator"] )
+        self.string( op["new_account_name"] )
+        self.authority( op["owner"] )
+        self.authority( op["active"] )
+        self.authority( op["posting"] )
+        self.public_key( op["memo_key"] )
+        self.string( op["json_metadata"] )
+        self.extensions( op["extensions"] )
+
+    def request_account_recovery_operation( self, op ):
+        self.string( op["recovery_account"] )
+        self.string( op["account_to_recover"] )
+        self.authority( op["new_owner_authority"] )
+        self.extensions( op["extensions"] )
+
+    def recover_account_operation( self, op ):
+        self.string( op["account_to_recover"] )
+        self.authority( op["new_owner_authority"] )
+        self.authority( op["recent_owner_authority"] )
+        self.extensions( op["extensions"] )
+
+    def change_recovery_account_operation( self, op ):
+        self.string( op["account_to_recover"] )
+        self.string( op["new_recovery_account"] )
+        self.extensions( op["extensions"] )
+
+    def escrow_transfer_operation( self, op ):
+        self.string( op["from"] )
+        self.string( op["to"] )
+        self.asset( op["sbd_amount"] )
+        self.asset( op["steem_amount"] )
+        self.uint32( op["escrow_id"] )
+        self.string( op["agent"] )
+        self.asset( op["fee"] )
+        self.string( op["json_meta"] )
+        self.time_point_sec( op["ratification_deadline"] )
+        self.time_point_sec( op["escrow_expiration"] )
+
+    def escrow_dispute_operation( self, op ):
+        self.string( op["from"] )
+        self.string( op["to"] )
+        self.string( op["agent"] )
+        self.string( op["who"] )
+        self.uint32( op["escrow_id"] )
+
+    def escrow_release_operation( self, op ):
+        self.string( op["from"] )
+        self.string( op["to"] )
+        self.string( op["agent"] )
+        self.string( op["who"] )
+        self.string( op["receiver"] )
+        self.uint32( op["escrow_id"] )
+        self.asset( op["sbd_amount"] )
+        self.asset( op["steem_amount"] )
+
+    def pow2_operation( self, op ):
+        self.static_variant( ["pow2", "equihash_pow"], op["work"] )
+        self.optional( self.public_key, op.get("new_owner_key") )
+        self.chain_properties( op["props"] )
+
+    def escrow_approve_operation( self, op ):
+        self.string( op["from"] )
+        self.string( op["to"] )
+        self.string( op["agent"] )
+        self.string( op["who"] )
+        self.uint32( op["escrow_id"] )
+        self.boolean( op["approve"] )
+
+    def transfer_to_savings_operation( self, op ):
+        self.string( op["from"] )
+        self.string( op["to"] )
+        self.asset( op["amount"] )
+        self.string( op["memo"] )
+
+    def transfer_from_savings_operation( self, op ):
+        self.string( op["from"] )
+        self.uint32( op["request_id"] )
+        self.string( op["to"] )
+        self.asset( op["amount"] )
+        self.string( op["memo"] )
+
+    def cancel_transfer_from_savings_operation( self, op ):
+        self.string( op["from"] )
+        self.uint32( op["request_id"] )
+
+    def custom_binary_operation( self, op ):
+        self.vector( self.string, op["required_owner_auths"] )
+        self.vector( self.string, op["required_active_auths"] )
+        self.vector( self.string, op["required_posting_auths"] )
+        self.vector( self.authority, op["required_auths"] )
+        self.string( op["id"] )
+        self.hex_bytes( op["data"] )
+
+    def decline_voting_rights_operation( self, op ):
+        self.string( op["account"] )
+        self.boolean( op["decline"] )
+
+    def reset_account_operation( self, op ):
+        self.string( op["reset_account"] )
+        self.string( op["account_to_reset"] )
+        self.authority( op["new_owner_authority"] )
+
+    def set_reset_account_operation( self, op ):
+        self.string( op["account"] )
+        self.string( op["current_reset_account"] )
+        self.string( op["reset_account"] )
+
+    def claim_reward_balance_operation( self, op ):
+        self.string( op["account"] )
+        self.asset( op["reward_steem"] )
+        self.asset( op["reward_sbd"] )
+        self.asset( op["reward_vests"] )
+
+    def delegate_vesting_shares_operation( self, op ):
+        self.string( op["delegator"] )
+        self.string( op["delegatee"] )
+        self.asset( op["vesting_shares"] )
+
+    def account_create_with_delegation_operation( self, op ):
+        self.asset( op["fee"] )
+        self.asset( op["delegation"] )
+        self.string( op["creator"] )
+        self.string( op["new_account_name"] )
+        self.authority( op["owner"] )
+        self.authority( op["active"] )
+        self.authority( op["posting"] )
+        self.public_key( op["memo_key"] )
+        self.string( op["json_metadata"] )
+        self.extensions( op["extensions"] )
+
+    def witness_set_properties_operation( self, op ):
+        self.string( op["owner"] )
+        self.flat_map( self.string, self.hex_bytes, op["props"] )
+        self.extensions( op["extensions"] )
+
+    def claim_reward_balance2_operation( self, op ):
+        self.string( op["account"] )
+        self.extensions( op["extensions"] )
+        self.vector( self.asset, op["reward_tokens"] )
+
+    # SMT operations were never enabled on the main network, their layout follows the 0.20 headers
+
+    def smt_setup_operation( self, op ):
+        self.string( op["control_account"] )
+        self.asset_symbol( op["symbol"] )
+        self.uint8( op["decimal_places"] )
+        self.int64( op["max_supply"] )
+        self.static_variant( ["smt_capped_generation_policy"], op["initial_generation_policy"] )
+        self.time_point_sec( op["generation_begin_time"] )
+        self.time_point_sec( op["generation_end_time"] )
+        self.time_point_sec( op["announced_launch_time"] )
+        self.time_point_sec( op["launch_expiration_time"] )
+        self.extensions( op["extensions"] )
+
+    def smt_cap_reveal_operation( self, op ):
+        self.string( op["control_account"] )
+        self.asset_symbol( op["symbol"] )
+        self.int64( op["cap"]["amount"] )
+        self.uint128( op["cap"]["nonce"] )
+        self.extensions( op["extensions"] )
+
+    def smt_refund_operation( self, op ):
+        self.string( op["executor"] )
+        self.string( op["contributor"] )
+        self.asset_symbol( op["symbol"] )
+        self.uint32( op["contribution_id"] )
+        self.asset( op["amount"] )
+        self.extensions( op["extensions"] )
+
+    def smt_setup_emissions_operation( self, op ):
+        self.string( op["control_account"] )
+        self.asset_symbol( op["symbol"] )
+        self.time_point_sec( op["schedule_time"] )
+        self.flat_map( self.string, self.uint16, op["emissions_unit"]["token_unit"] )
+        self.uint32( op["interval_seconds"] )
+        self.uint32( op["interval_count"] )
+        self.time_point_sec( op["lep_time"] )
+        self.time_point_sec( op["rep_time"] )
+        self.asset( op["lep_abs_amount"] )
+        self.asset( op["rep_abs_amount"] )
+        self.uint32( op["lep_rel_amount_numerator"] )
+        self.uint32( op["rep_rel_amount_numerator"] )
+        self.uint8( op["rel_amount_denom_bits"] )
+        self.extensions( op["extensions"] )
+
+    def smt_set_setup_parameters_operation( self, op ):
+        self.string( op["control_account"] )
+        self.asset_symbol( op["symbol"] )
+        self.vector( lambda e : self.static_variant( ["smt_param_allow_voting"], e ), op["setup_parameters"] )
+        self.extensions( op["extensions"] )
+
+    def smt_set_runtime_parameters_operation( self, op ):
+        self.string( op["control_account"] )
+        self.asset_symbol( op["symbol"] )
+        self.vector( lambda e : self.static_variant( [
+           "smt_param_windows_v1",
+           "smt_param_vote_regeneration_period_seconds_v1",
+           "smt_param_rewards_v1",
+           ], e ), op["runtime_parameters"] )
+        self.extensions( op["extensions"] )
+
+    def smt_create_operation( self, op ):
+        self.string( op["control_account"] )
+        self.asset_symbol( op["symbol"] )
+        self.asset( op["smt_creation_fee"] )
+        self.uint8( op["precision"] )
+        self.extensions( op["extensions"] )
+
+# Measure-only mode of Serializer, computes the length of the encoding without building it.
+# flush() returns the size instead of the bytes.
+class SizeSerializer(Serializer):
+
+    def __init__(self):
+        self.size = 0
+
+    def flush(self):
+        result = self.size
+        self.size = 0
+        return result
+
+    def raw( self, b ):
+        self.size += len(b)
+
+    def uint8( self, v ):
+        self.size += 1
+
+    def uint16( self, v ):
+        self.size += 2
+
+    def uint32( self, v ):
+        self.size += 4
+
+    def uint64( self, v ):
+        self.size += 8
+
+    def uint128( self, v ):
+        self.size += 16
+
+    def int16( self, v ):
+        self.size += 2
+
+    def int64( self, v ):
+        self.size += 8
+
+    def boolean( self, v ):
+        self.size += 1
+
+    def varint( self, v ):
+        self.size += varint_size(int(v))
+
+    def string( self, s ):
+        n = len(s) if s.isascii() else len(s.encode("utf8"))
+        self.size += varint_size(n) + n
+
+    def hex_bytes( self, h ):
+        n = len(h) // 2
+        self.size += varint_size(n) + n
+
+    def fixed_hex( self, h, size ):
+        self.size += size
+
+    def time_point_sec( self, t ):
+        self.size += 4
+
+    def public_key( self, k ):
+        self.size += STEEM_PUBLIC_KEY_SIZE
+
+    def signature( self, s ):
+        self.size += STEEM_SIGNATURE_SIZE
+
+    def vector( self, f, v ):
+        self.size += varint_size(len(v))
+        for x in v:
+            f(x)
+
+    def legacy_symbol( self, precision, name ):
+        self.size += 8
+
+    def asset( self, a ):
+        if isinstance(a, dict) and a["nai"] not in legacy_nai_symbols:
+            self.size += 12
+        else:
+            self.size += 16
+
 class SizeInfo(object):
     pass
 
 class ExecInfo(object):
     pass
 
+def compile_operation_counters( size_info, exec_info ):
+    # Flattens CountOperationVisitor into one function per operation type, with the
+    # size_info / exec_info constants folded in.  Each function returns
+    # (state_bytes, execution_time, market_op_count, new_account_op_count)
+    s = size_info
+    def exec_time( op_type ):
+        return exec_info.get(op_type+"_exec_time", 0)
+
+    table = {}
+    for name in dir(CountOperationVisitor):
+        if name.startswith("visit_") and name.endswith("_operation"):
+            op_type = name[len("visit_"):]
+            table[op_type] = lambda op, r=(0, exec_time(op_type), 0, 0) : r
+
+    def constant( op_type, state_bytes, market_op_count=0 ):
+        table[op_type] = lambda op, r=(state_bytes, exec_time(op_type), market_op_count, 0) : r
+
+    constant( "account_witness_vote_operation", s["witness_vote_object_base_size"] )
+    constant( "convert_operation", s["convert_request_object_base_size"] )
+    constant( "decline_voting_rights_operation", s["decline_voting_rights_request_object_base_size"] )
+    constant( "delegate_vesting_shares_operation", max(
+       s["vesting_delegation_object_base_size"],
+       s["vesting_delegation_expiration_object_base_size"] ) )
+    constant( "escrow_transfer_operation", s["escrow_object_base_size"] )
+    constant( "request_account_recovery_operation", s["account_recovery_request_object_base_size"] )
+    constant( "set_withdraw_vesting_route_operation", s["withdraw_vesting_route_object_base_size"] )
+    constant( "vote_operation", s["comment_vote_object_base_size"] )
+    constant( "transfer_from_savings_operation", s["savings_withdraw_object_byte_size"] )
+    constant( "transfer_operation", 0, market_op_count=1 )
+    constant( "transfer_to_vesting_operation", 0, market_op_count=1 )
+
+    authority_base_size = s["authority_base_size"]
+    authority_account_member_size = s["authority_account_member_size"]
+    authority_key_member_size = s["authority_key_member_size"]
+
+    def account_creator( op_type, base_size ):
+        base_size += s["account_object_base_size"] + s["account_authority_object_base_size"] + 3*authority_base_size
+        t = exec_time(op_type)
+        def count( op ):
+            owner, active, posting = op["owner"], op["active"], op["posting"]
+            return (base_size
+              + authority_account_member_size * (len(owner["account_auths"]) + len(active["account_auths"]) + len(posting["account_auths"]))
+              + authority_key_member_size * (len(owner["key_auths"]) + len(active["key_auths"]) + len(posting["key_auths"]))
+              , t, 0, 0)
+        table[op_type] = count
+
+    account_creator( "account_create_operation", 0 )
+    account_creator( "account_create_with_delegation_operation", s["vesting_delegation_object_base_size"] )
+    account_creator( "create_claimed_account_operation", 0 )
+
+    comment_object_base_size = s["comment_object_base_size"]
+    comment_object_permlink_char_size = s["comment_object_permlink_char_size"]
+    comment_object_parent_permlink_char_size = s["comment_object_parent_permlink_char_size"]
+    comment_exec_time = exec_time("comment_operation")
+    def count_comment( op ):
+        return (comment_object_base_size
+          + comment_object_permlink_char_size * len(op["permlink"].encode("utf8"))
+          + comment_object_parent_permlink_char_size * len(op["parent_permlink"].encode("utf8"))
+          , comment_exec_time, 0, 0)
+    table["comment_operation"] = count_comment
+
+    comment_object_beneficiaries_member_size = s["comment_object_beneficiaries_member_size"]
+    comment_options_exec_time = exec_time("comment_options_operation")
+    def count_comment_options( op ):
+        state_bytes = 0
+        for e in op["extensions"]:
+            if e["type"] == "comment_payout_beneficiaries":
+                state_bytes += comment_object_beneficiaries_member_size * len(e["value"]["beneficiaries"])
+            elif e["type"] != "allowed_vote_assets":
+                raise AttributeError("Unknown comment_options extension "+e["type"])
+        return (state_bytes, comment_options_exec_time, 0, 0)
+    table["comment_options_operation"] = count_comment_options
+
+    limit_order_object_base_size = s["limit_order_object_base_size"]
+    def limit_order_creator( op_type ):
+        fill_or_kill_result = (0, exec_time(op_type), 1, 0)
+        result = (limit_order_object_base_size, exec_time(op_type), 1, 0)
+        table[op_type] = lambda op : fill_or_kill_result if op["fill_or_kill"] else result
+
+    limit_order_creator( "limit_order_create_operation" )
+    limit_order_creator( "limit_order_create2_operation" )
+
+    witness_object_base_size = s["witness_object_base_size"]
+    witness_object_url_char_size = s["witness_object_url_char_size"]
+    witness_update_exec_time = exec_time("witness_update_operation")
+    table["witness_update_operation"] = lambda op : (
+        witness_object_base_size + witness_object_url_char_size * len(op["url"].encode("utf8")),
+        witness_update_exec_time, 0, 0)
+
+    claim_account_exec_time = exec_time("claim_account_operation")
+    table["claim_account_operation"] = lambda op : (0, claim_account_exec_time, 0, 1 if int(op["fee"]["amount"]) == 0 else 0)
+
+    return table
+
+def authority_shape( auth ):
+    return (len(auth["account_auths"]), len(auth["key_auths"]))
+
+def account_creator_shape( op ):
+    return (authority_shape(op["owner"]), authority_shape(op["active"]), authority_shape(op["posting"]))
+
+def comment_options_shape( op ):
+    return tuple( (e["type"], len(e["value"]["beneficiaries"]) if e["type"] == "comment_payout_beneficiaries" else 0)
+                  for e in op["extensions"] )
+
+# The fields of each operation which compile_operation_counters() depends on,
+# operations missing from the table only depend on their type
+operation_shapes = {
+    "account_create_operation" : account_creator_shape,
+    "account_create_with_delegation_operation" : account_creator_shape,
+    "create_claimed_account_operation" : account_creator_shape,
+    "comment_operation" : lambda op : (len(op["permlink"].encode("utf8")), len(op["parent_permlink"].encode("utf8"))),
+    "comment_options_operation" : comment_options_shape,
+    "limit_order_create_operation" : lambda op : bool(op["fill_or_kill"]),
+    "limit_order_create2_operation" : lambda op : bool(op["fill_or_kill"]),
+    "witness_update_operation" : lambda op : len(op["url"].encode("utf8")),
+    "claim_account_operation" : lambda op : int(op["fee"]["amount"]) == 0,
+    }
+
+def transaction_shape( tx, tx_size ):
+    # Transactions with the same shape have the same resource count
+    shape = [tx_size]
+    for op in tx["operations"]:
+        f = operation_shapes.get(op["type"])
+        shape.append( (op["type"], None if f is None else f(op["value"])) )
+    return tuple(shape)
+
+class LRUCache(object):
+    # The recency list is updated on every get(), so access is serialized by a lock
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get( self, key ):
+        with self._lock:
+            value = self._data.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._data.move_to_end(key)
+            return value
+
+    def put( self, key, value ):
+        with self._lock:
+            self._data[key] = value
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def info(self):
+        return collections.OrderedDict((
+           ("hits", self.hits),
+           ("misses", self.misses),
+           ("size", len(self._data)),
+           ("maxsize", self.maxsize),
+           ))
+
+class LatencyHistogram(object):
+    # Cumulative histogram in the Prometheus style, bounds are in seconds
+    default_bounds = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 1e-2)
+
+    def __init__(self, bounds=None):
+        self.bounds = self.default_bounds if bounds is None else tuple(bounds)
+        self.bucket_counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum_ns = 0
+
+    def observe( self, ns ):
+        self.count += 1
+        self.sum_ns += ns
+        seconds = ns * 1e-9
+        for i, bound in enumerate(self.bounds):
+            if seconds <= bound:
+                self.bucket_counts[i] += 1
+                return
+        self.bucket_counts[-1] += 1
+
+    def to_dict(self):
+        buckets = collections.OrderedDict()
+        cumulative = 0
+        for bound, n in zip(self.bounds + ("+Inf",), self.bucket_counts):
+            cumulative += n
+            buckets[str(bound)] = cumulative
+        return collections.OrderedDict( (("buckets", buckets), ("count", self.count), ("sum_seconds", self.sum_ns * 1e-9)) )
+
+class Instrumentation(object):
+    # Metrics collected by a ResourceCounter or RCModel whose instrumentation attribute is set.
+    # Resources of the transaction as a whole (history bytes, the transaction object's state
+    # bytes) are split evenly between its operations, market bytes between its market operations.
+    def __init__(self, resource_names, latency_bounds=None):
+        self.resource_names = resource_names
+        self.latency_bounds = latency_bounds
+        self.operation_calls = {}
+        self.operation_time_ns = {}
+        self.operation_resources = {}
+        self.latency = collections.OrderedDict()
+
+    def observe_latency( self, name, ns ):
+        histogram = self.latency.get(name)
+        if histogram is None:
+            histogram = self.latency[name] = LatencyHistogram(self.latency_bounds)
+        histogram.observe(ns)
+
+    def record_operation( self, op_type, ns, units ):
+        if op_type not in self.operation_calls:
+            self.operation_calls[op_type] = 0
+            self.operation_time_ns[op_type] = 0
+            self.operation_resources[op_type] = [0] * len(self.resource_names)
+        self.operation_calls[op_type] += 1
+        self.operation_time_ns[op_type] += ns
+        totals = self.operation_resources[op_type]
+        for i, value in enumerate(units):
+            totals[i] += value
+
+    def snapshot(self):
+        operations = collections.OrderedDict()
+        for op_type in sorted(self.operation_calls):
+            operations[op_type] = collections.OrderedDict((
+               ("calls", self.operation_calls[op_type]),
+               ("seconds", self.operation_time_ns[op_type] * 1e-9),
+               ("resource_count", collections.OrderedDict(zip(self.resource_names, self.operation_resources[op_type]))),
+               ))
+        return collections.OrderedDict((
+           ("operations", operations),
+           ("latency", collections.OrderedDict( (name, h.to_dict()) for name, h in self.latency.items() )),
+           ))
+
+    def prometheus_text( self, prefix="rc" ):
+        lines = [
+           "# HELP {}_operation_calls_total Operations counted, by operation type".format(prefix),
+           "# TYPE {}_operation_calls_total counter".format(prefix),
+           ]
+        for op_type in sorted(self.operation_calls):
+            lines.append('{}_operation_calls_total{{op_type="{}"}} {}'.format(prefix, op_type, self.operation_calls[op_type]))
+        lines += [
+           "# HELP {}_operation_seconds_total Time spent counting operations, by operation type".format(prefix),
+           "# TYPE {}_operation_seconds_total counter".format(prefix),
+           ]
+        for op_type in sorted(self.operation_calls):
+            lines.append('{}_operation_seconds_total{{op_type="{}"}} {!r}'.format(prefix, op_type, self.operation_time_ns[op_type] * 1e-9))
+        lines += [
+           "# HELP {}_operation_resource_units_total Resource units attributed to operations, by operation type".format(prefix),
+           "# TYPE {}_operation_resource_units_total counter".format(prefix),
+           ]
+        for op_type in sorted(self.operation_calls):
+            for resource_name, value in zip(self.resource_names, self.operation_resources[op_type]):
+                lines.append('{}_operation_resource_units_total{{op_type="{}",resource="{}"}} {}'.format(prefix, op_type, resource_name, value))
+        lines += [
+           "# HELP {}_latency_seconds Latency of counting and pricing calls".format(prefix),
+           "# TYPE {}_latency_seconds histogram".format(prefix),
+           ]
+        for name, h in self.latency.items():
+            cumulative = 0
+            for bound, n in zip(h.bounds + ("+Inf",), h.bucket_counts):
+                cumulative += n
+                lines.append('{}_latency_seconds_bucket{{call="{}",le="{}"}} {}'.format(prefix, name, bound, cumulative))
+            lines.append('{}_latency_seconds_sum{{call="{}"}} {!r}'.format(prefix, name, h.sum_ns * 1e-9))
+            lines.append('{}_latency_seconds_count{{call="{}"}} {}'.format(prefix, name, h.count))
+        return "\n".join(lines) + "\n"
+
+# The order of the resources in ResourceCounter results
+resource_count_names = (
+    "resource_history_bytes",
+    "resource_new_accounts",
+    "resource_market_bytes",
+    "resource_state_bytes",
+    "resource_execution_time",
+    )
+
+# Compact results.  Values are lists indexed like resource_names (see resource_name_to_index),
+# to_dict() converts them to the JSON shaped results of the corresponding dict API.
+
+class ResourceCount(object):
+    __slots__ = ("resource_names", "values")
+
+    def __init__(self, resource_names, values):
+        self.resource_names = resource_names
+        self.values = values
+
+    def __getitem__( self, resource_name ):
+        return self.values[self.resource_names.index(resource_name)]
+
+    def to_dict(self):
+        return collections.OrderedDict( (("resource_count", collections.OrderedDict(zip(self.resource_names, self.values))),) )
+
+class TransactionCost(object):
+    __slots__ = ("resource_names", "usage", "cost")
+
+    def __init__(self, resource_names, usage, cost):
+        self.resource_names = resource_names
+        self.usage = usage
+        self.cost = cost
+
+    def total_cost(self):
+        return sum(self.cost)
+
+    def to_dict(self):
+        return collections.OrderedDict((
+           ("usage", collections.OrderedDict( (("resource_count", collections.OrderedDict(zip(self.resource_names, self.usage))),) )),
+           ("cost", collections.OrderedDict(zip(self.resource_names, self.cost))),
+           ))
+
+class PoolDynamics(object):
+    __slots__ = ("resource_names", "dt", "decay", "budget", "usage", "pool", "new_pool")
+
+    def __init__(self, resource_names, dt, decay, budget, usage, pool, new_pool):
+        self.resource_names = resource_names
+        self.dt = dt
+        self.decay = decay
+        self.budget = budget
+        self.usage = usage
+        self.pool = pool
+        self.new_pool = new_pool
+
+    def to_dict(self):
+        names = self.resource_names
+        return collections.OrderedDict((
+           ("dt", collections.OrderedDict(zip(names, self.dt))),
+           ("decay", collections.OrderedDict(zip(names, self.decay))),
+           ("budget", collections.OrderedDict(zip(names, self.budget))),
+           ("usage", collections.OrderedDict(zip(names, self.usage))),
+           ("adjustment", collections.OrderedDict()),
+           ("pool", collections.OrderedDict(zip(names, self.pool))),
+           ("new_pool", collections.OrderedDict(zip(names, self.new_pool))),
+           ))
+
 class ResourceCounter(object):
-    def __init__(self, resource_params):
+    # count_execution_time enables the resource_execution_time count, which steemd
+    # reports as zero because of issue 2972
+    def __init__(self, resource_params, cache_size=0, count_execution_time=False):
         self.resource_params = resource_params
+        self.count_execution_time = count_execution_time
         self.resource_name_to_index = {}
         self._size_info = None
         self._exec_info = None
@@ -261,41 +1393,305 @@ class ResourceCounter(object):
         self._exec_info = ExecInfo()
         for k, v in self.resource_params["size_info"]["resource_execution_time"].items():
             setattr(self._exec_info, k, v)
+        self._count_operation = compile_operation_counters(
+           self.resource_params["size_info"]["resource_state_bytes"],
+           self.resource_params["size_info"]["resource_execution_time"],
+           )
+        self._transaction_object_base_size = self._size_info.transaction_object_base_size
+        self._transaction_object_byte_size = self._size_info.transaction_object_byte_size
+        self._cache = LRUCache(cache_size) if cache_size > 0 else None
+        self.instrumentation = None
+        # Maps _count_values() order to resource_names order, None when they are the same
+        self._values_order = [resource_count_names.index(resource_name) for resource_name in self.resource_names]
+        if self._values_order == list(range(len(resource_count_names))):
+            self._values_order = None
         return
 
     def __call__( self, tx=None, tx_size=-1 ):
         if tx_size < 0:
-            ser = Serializer()
+            ser = SizeSerializer()
             ser.signed_transaction(tx)
-            tx_size = len(ser.flush())
-        result = collections.OrderedDict(
+            tx_size = ser.flush()
+        if self.instrumentation is not None:
+            return self._count_instrumented( tx, tx_size )
+        if self._cache is None:
+            return self._count( tx, tx_size )
+
+        key = transaction_shape( tx, tx_size )
+        items = self._cache.get(key)
+        if items is None:
+            result = self._count( tx, tx_size )
+            self._cache.put( key, tuple(result["resource_count"].items()) )
+            return result
+        return collections.OrderedDict( (("resource_count", collections.OrderedDict(items)),) )
+
+    def cache_info(self):
+        return None if self._cache is None else self._cache.info()
+
+    def _count_instrumented( self, tx, tx_size ):
+        # Bypasses the cache, every operation is counted and timed
+        instrumentation = self.instrumentation
+        start = time.perf_counter_ns()
+        result = self._count( tx, tx_size )
+        instrumentation.observe_latency( "count_resources", time.perf_counter_ns() - start )
+
+        op_counts = []
+        times = []
+        for op in tx["operations"]:
+            start = time.perf_counter_ns()
+            op_counts.append( (op["type"], self._count_operation[op["type"]](op["value"])) )
+            times.append( time.perf_counter_ns() - start )
+        for ns, (op_type, units) in zip(times, self._split_operation_counts( op_counts, tx_size )):
+            instrumentation.record_operation( op_type, ns, units )
+        return result
+
+    def count_by_operation( self, tx=None, tx_size=-1 ):
+        # Returns [(op_type, counts in resource_names order)] for each operation of tx.  The
+        # counts add up to the transaction's count.
+        if tx_size < 0:
+            ser = SizeSerializer()
+            ser.signed_transaction(tx)
+            tx_size = ser.flush()
+        count_operation = self._count_operation
+        return self._split_operation_counts( [(op["type"], count_operation[op["type"]](op["value"])) for op in tx["operations"]], tx_size )
+
+    def _split_operation_counts( self, op_counts, tx_size ):
+        # Transaction level resources (history bytes, the transaction object's state bytes)
+        # are shared evenly between the operations, market bytes between the market
+        # operations, with any remainder going to the first one
+        if len(op_counts) == 0:
+            return []
+        market_ops = sum(1 for op_type, counts in op_counts if counts[2] > 0)
+        history_share = divmod( tx_size, len(op_counts) )
+        state_share = divmod( self._transaction_object_base_size + self._transaction_object_byte_size * tx_size, len(op_counts) )
+        market_share = divmod( tx_size, market_ops ) if market_ops > 0 else (0, 0)
+        market_index = 0
+        result = []
+        for i, (op_type, (state_bytes, execution_time, market_op_count, new_account_op_count)) in enumerate(op_counts):
+            market_bytes = 0
+            if market_op_count > 0:
+                market_bytes = market_share[0] + (market_share[1] if market_index == 0 else 0)
+                market_index += 1
+            values = (
+               history_share[0] + (history_share[1] if i == 0 else 0),
+               new_account_op_count,
+               market_bytes,
+               state_bytes + state_share[0] + (state_share[1] if i == 0 else 0),
+               execution_time if self.count_execution_time else 0,
+               )
+            if self._values_order is not None:
+                values = [values[j] for j in self._values_order]
+            result.append( (op_type, list(values)) )
+        return result
+
+    def count_compact( self, tx=None, tx_size=-1 ):
+        # Like __call__(), but returns a ResourceCount instead of nested OrderedDict's
+        if tx_size < 0:
+            ser = SizeSerializer()
+            ser.signed_transaction(tx)
+            tx_size = ser.flush()
+        values = self._count_values( tx, tx_size )
+        if self._values_order is not None:
+            values = [values[i] for i in self._values_order]
+        return ResourceCount( self.resource_names, list(values) )
+
+    def _count( self, tx, tx_size ):
+        history_bytes, new_accounts, market_bytes, state_bytes, execution_time = self._count_values( tx, tx_size )
+        return collections.OrderedDict(
             (("resource_count", collections.OrderedDict((
-             ("resource_history_bytes", 0),
-             ("resource_new_accounts", 0),
-             ("resource_market_bytes", 0),
-             ("resource_state_bytes", 0),
-             ("resource_execution_time", 0),
+             ("resource_history_bytes", history_bytes),
+             ("resource_new_accounts", new_accounts),
+             ("resource_market_bytes", market_bytes),
+             ("resource_state_bytes", state_bytes),
+             ("resource_execution_time", execution_time),
             ))),)
             )
 
-        resource_count = result["resource_count"]
-        resource_count["resource_history_bytes"] += tx_size
-
-        vtor = CountOperationVisitor(self._size_info, self._exec_info)
+    def _count_values( self, tx, tx_size ):
+        # Returns the counts in resource_count_names order
+        state_bytes_count = 0
+        execution_time_count = 0
+        market_op_count = 0
+        new_account_op_count = 0
+        count_operation = self._count_operation
         for op in tx["operations"]:
-            getattr(vtor, "visit_"+op["type"])(op["value"])
-        resource_count["resource_new_accounts"] += vtor.new_account_op_count
-
-        if vtor.market_op_count > 0:
-           resource_count["resource_market_bytes"] += tx_size
+            state_bytes, execution_time, market_ops, new_account_ops = count_operation[op["type"]](op["value"])
+            state_bytes_count += state_bytes
+            execution_time_count += execution_time
+            market_op_count += market_ops
+            new_account_op_count += new_account_ops
+
+        return (
+           tx_size,
+           new_account_op_count,
+           tx_size if market_op_count > 0 else 0,
+           self._transaction_object_base_size + self._transaction_object_byte_size * tx_size + state_bytes_count,
+           execution_time_count if self.count_execution_time else 0,
+           )
 
-        resource_count["resource_state_bytes"] += (
-             self._size_info.transaction_object_base_size
-           + self._size_info.transaction_object_byte_size * tx_size
-           + vtor.state_bytes_count )
+class CostSchedule(object):
+    # The resource_params in force from start_block_num until the next schedule starts.
+    # The counting tables are compiled on first use and not pickled, so schedules can be
+    # sent to worker processes cheaply.
+    def __init__(self, name, start_block_num, resource_params, count_execution_time=False):
+        self.name = name
+        self.start_block_num = start_block_num
+        self.resource_params = resource_params
+        self.count_execution_time = count_execution_time
+        self._count_resources = None
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["_count_resources"] = None
+        return state
+
+    @property
+    def count_resources(self):
+        if self._count_resources is None:
+            self._count_resources = ResourceCounter( self.resource_params, count_execution_time=self.count_execution_time )
+        return self._count_resources
+
+class CostScheduleRegistry(object):
+    # Versioned cost schedules indexed by start block number.  get_schedule() is a binary
+    # search over the sorted start heights, with the last result remembered since
+    # consecutive blocks almost always fall in the same schedule.
+    def __init__(self):
+        self._start_block_nums = []
+        self._schedules = []
+        self._last = None
+
+    def __len__(self):
+        return len(self._schedules)
+
+    def __iter__(self):
+        return iter(self._schedules)
+
+    def add( self, start_block_num, resource_params, name=None, count_execution_time=False ):
+        if self._schedules and resource_params["resource_names"] != self._schedules[0].resource_params["resource_names"]:
+            raise ValueError("All schedules must have the same resource_names")
+        i = bisect.bisect_left( self._start_block_nums, start_block_num )
+        if i < len(self._start_block_nums) and self._start_block_nums[i] == start_block_num:
+            raise ValueError("A schedule already starts at block {}".format(start_block_num))
+        if name is None:
+            name = "block_{}".format(start_block_num)
+        schedule = CostSchedule( name, start_block_num, resource_params, count_execution_time )
+        self._start_block_nums.insert( i, start_block_num )
+        self._schedules.insert( i, schedule )
+        self._last = None
+        return schedule
+
+    def get_schedule( self, block_num ):
+        last = self._last
+        if last is not None and last[0] <= block_num < last[1]:
+            return last[2]
+        i = bisect.bisect_right( self._start_block_nums, block_num ) - 1
+        if i < 0:
+            raise KeyError("No cost schedule for block {}".format(block_num))
+        end = self._start_block_nums[i+1] if i+1 < len(self._start_block_nums) else float("inf")
+        self._last = (self._start_block_nums[i], end, self._schedules[i])
+        return self._schedules[i]
+
+    def get_counter( self, block_num ):
+        return self.get_schedule( block_num ).count_resources
+
+    @property
+    def resource_names(self):
+        return self._schedules[0].resource_params["resource_names"]
+
+# Port of get_resource_user_visitor.  Each function returns the required authorities
+# of an operation as (active, owner, posting, other), like the get_required_*_authorities()
+# methods in the protocol.
+def required_active( field ):
+    return lambda op : ([op[field]], (), (), ())
+
+def required_owner( field ):
+    return lambda op : ((), [op[field]], (), ())
+
+def required_posting( field ):
+    return lambda op : ((), (), [op[field]], ())
+
+def account_update_authorities( op ):
+    if op.get("owner") is not None:
+        return ((), [op["account"]], (), ())
+    return ([op["account"]], (), (), ())
+
+def pow2_authorities( op ):
+    name, work = get_static_variant( op["work"] )
+    return ([work["input"]["worker_account"]], (), (), ())
+
+operation_authorities = {
+    "vote_operation" : required_posting("voter"),
+    "comment_operation" : required_posting("author"),
+    "transfer_operation" : required_active("from"),
+    "transfer_to_vesting_operation" : required_active("from"),
+    "withdraw_vesting_operation" : required_active("account"),
+    "limit_order_create_operation" : required_active("owner"),
+    "limit_order_cancel_operation" : required_active("owner"),
+    "feed_publish_operation" : required_active("publisher"),
+    "convert_operation" : required_active("owner"),
+    "account_create_operation" : required_active("creator"),
+    "account_update_operation" : account_update_authorities,
+    "witness_update_operation" : required_active("owner"),
+    "account_witness_vote_operation" : required_active("account"),
+    "account_witness_proxy_operation" : required_active("account"),
+    "pow_operation" : required_active("worker_account"),
+    "custom_operation" : lambda op : (op["required_auths"], (), (), ()),
+    "report_over_production_operation" : lambda op : ((), (), (), ()),
+    "delete_comment_operation" : required_posting("author"),
+    "custom_json_operation" : lambda op : (op["required_auths"], (), op["required_posting_auths"], ()),
+    "comment_options_operation" : required_posting("author"),
+    "set_withdraw_vesting_route_operation" : required_active("from_account"),
+    "limit_order_create2_operation" : required_active("owner"),
+    "claim_account_operation" : required_active("creator"),
+    "create_claimed_account_operation" : required_active("creator"),
+    "request_account_recovery_operation" : required_active("recovery_account"),
+    "recover_account_operation" : lambda op : ((), (), (), (op["new_owner_authority"], op["recent_owner_authority"])),
+    "change_recovery_account_operation" : required_owner("account_to_recover"),
+    "escrow_transfer_operation" : required_active("from"),
+    "escrow_dispute_operation" : required_active("who"),
+    "escrow_release_operation" : required_active("who"),
+    "pow2_operation" : pow2_authorities,
+    "escrow_approve_operation" : required_active("who"),
+    "transfer_to_savings_operation" : required_active("from"),
+    "transfer_from_savings_operation" : required_active("from"),
+    "cancel_transfer_from_savings_operation" : required_active("from"),
+    "custom_binary_operation" : lambda op : (op["required_active_auths"], op["required_owner_auths"], op["required_posting_auths"], op["required_auths"]),
+    "decline_voting_rights_operation" : required_owner("account"),
+    "reset_account_operation" : required_active("reset_account"),
+    "set_reset_account_operation" : required_owner("account"),
+    "claim_reward_balance_operation" : required_posting("account"),
+    "delegate_vesting_shares_operation" : required_active("delegator"),
+    "account_create_with_delegation_operation" : required_active("creator"),
+    # Signed by the block signing key, but the resource user is the witness
+    "witness_set_properties_operation" : required_active("owner"),
+    "claim_reward_balance2_operation" : required_posting("account"),
+    "smt_setup_operation" : required_active("control_account"),
+    "smt_cap_reveal_operation" : required_active("control_account"),
+    "smt_refund_operation" : required_active("executor"),
+    "smt_setup_emissions_operation" : required_active("control_account"),
+    "smt_set_setup_parameters_operation" : required_active("control_account"),
+    "smt_set_runtime_parameters_operation" : required_active("control_account"),
+    "smt_create_operation" : required_active("control_account"),
+    }
 
-        # resource_count["resource_execution_time"] += vtor.execution_time_count
-        return result
+def get_operation_resource_user( op ):
+    # Authorities are flat_set's, so the first account is the smallest name
+    active, owner, posting, other = operation_authorities[op["type"]](op["value"])
+    for accounts in (active, owner, posting):
+        if len(accounts) > 0:
+            return min(accounts)
+    for auth in other:
+        for account, weight in auth["account_auths"]:
+            return account
+    return None
+
+def get_resource_user( tx ):
+    # The account which pays the RC cost of tx, the first operation with a required account decides
+    for op in tx["operations"]:
+        resource_user = get_operation_resource_user( op )
+        if resource_user is not None:
+            return resource_user
+    return None
 
 def compute_rc_cost_of_resource( curve_params=None, current_pool=0, resource_count=0, rc_regen=0 ):
     if resource_count <= 0:
@@ -314,6 +1710,55 @@ def compute_rc_cost_of_resource( curve_params=None, current_pool=0, resource_cou
     num_denom = num // denom
     return num_denom+1
 
+class PriceSnapshot(object):
+    # The pool-dependent parts of compute_rc_cost_of_resource() for one chain state, in
+    # resource_names order.  factor is ((rc_regen * coeff_a) >> shift) + 1 already
+    # multiplied by resource_unit, so an unscaled count c costs (factor * c) // denom + 1.
+    # Snapshots are immutable, one can be shared by every caller pricing the same block.
+    __slots__ = ("resource_names", "rc_regen", "pool", "unit", "factor", "denom")
+
+    def __init__(self, resource_params, resource_pool, rc_regen):
+        resource_names = tuple(resource_params["resource_names"])
+        unit = []
+        factor = []
+        denom = []
+        pool = []
+        for resource_name in resource_names:
+            params = resource_params["resource_params"][resource_name]
+            curve_params = params["price_curve_params"]
+            u = params["resource_dynamics_params"]["resource_unit"]
+            p = int(resource_pool[resource_name]["pool"])
+            unit.append(u)
+            factor.append( (((rc_regen * int(curve_params["coeff_a"])) >> int(curve_params["shift"])) + 1) * u )
+            denom.append( int(curve_params["coeff_b"]) + max(p, 0) )
+            pool.append(p)
+        object.__setattr__( self, "resource_names", resource_names )
+        object.__setattr__( self, "rc_regen", rc_regen )
+        object.__setattr__( self, "pool", tuple(pool) )
+        object.__setattr__( self, "unit", tuple(unit) )
+        object.__setattr__( self, "factor", tuple(factor) )
+        object.__setattr__( self, "denom", tuple(denom) )
+
+    def __setattr__( self, name, value ):
+        raise AttributeError("PriceSnapshot is immutable")
+
+    def get_rc_cost( self, count ):
+        # count is a ResourceCount or unscaled counts in resource_names order
+        if isinstance(count, ResourceCount):
+            count = count.values
+        cost = []
+        for c, f, d in zip(count, self.factor, self.denom):
+            if c > 0:
+                cost.append( (f * c) // d + 1 )
+            elif c == 0:
+                cost.append(0)
+            else:
+                cost.append( -((f * -c) // d + 1) )
+        return cost
+
+    def get_total_rc_cost( self, count ):
+        return sum(self.get_rc_cost( count ))
+
 def rd_compute_pool_decay(
    decay_params,
    current_pool,
@@ -327,31 +1772,290 @@ def rd_compute_pool_decay(
     result = decay_amount
     return min(result, current_pool)
 
+def ceil_div( a, b ):
+    return -(-a // b)
+
+def fixed_point_pow( base, n, precision ):
+    # base**n, where base and the result are scaled by 2**precision and truncated
+    result = 1 << precision
+    while n > 0:
+        if n & 1:
+            result = (result * base) >> precision
+        base = (base * base) >> precision
+        n >>= 1
+    return result
+
+def rd_fast_forward_pool(
+   decay_params,
+   budget,
+   current_pool,
+   block_count,
+   exact=False,
+   ):
+    # The pool after block_count blocks without usage, each adding budget and subtracting
+    # rd_compute_pool_decay( decay_params, pool, 1 ), like apply_rc_pool_dynamics().
+    #
+    # With exact=False this is the closed form of the untruncated recurrence
+    # pool' = pool * (1 - k / 2**shift) + budget, with (1 - k / 2**shift)**block_count
+    # computed by repeated squaring, so the cost is O(log(block_count)).  steemd truncates
+    # each block's decay towards zero, which leaves that block's pool between 0 and 1
+    # further from zero, and these errors then decay like the pool, adding up to less than
+    # E = min(block_count, 2**shift / k).  The closed form adds the average, half a unit
+    # per block, and is clamped to the range of pools where the truncated decay equals
+    # budget, where the per-block recurrence stops.  The result is within E / 2 + 1 of the
+    # per-block value (E + 1 if the pool changes sign).  On the embedded pools over up to 30
+    # days of blocks it was within 2000 units, e.g. -368 for resource_market_bytes after a
+    # week (201600 blocks).
+    #
+    # With exact=True the per-block rounding is reproduced.  While the truncated decay
+    # stays the same, the pool moves by the same amount every block, so such runs of blocks
+    # are skipped in one step.  That makes it fast when budget < 2**shift / k, which holds
+    # for the small pools, but a pool whose decay changes every block costs one iteration
+    # per block.
+    k = int(decay_params["decay_per_time_unit"])
+    shift = int(decay_params["decay_per_time_unit_denom_shift"])
+    c = 1 << shift
+    pool = current_pool
+    if block_count <= 0:
+        return pool
+    if k == 0:
+        return pool + budget * block_count
+    if k >= c:
+        # The whole pool decays every block
+        return budget
+
+    if not exact:
+        # pool_eq = budget * c / k is the fixed point of the untruncated recurrence
+        precision = shift + 64 + max(abs(pool), (budget * c) // k).bit_length()
+        one = 1 << precision
+        g = fixed_point_pow( one - (k << (precision - shift)), block_count, precision )
+        num = budget * c * one + (pool * k - budget * c) * g
+        # The average truncation error, (1 - g) / (2 * (k / c)), has the sign of the pool
+        rounding = (c * (one - g)) // 2
+        if pool >= 0:
+            num += rounding
+        elif num <= 0:
+            num -= rounding
+        result = num // (k << precision)
+        if budget >= 0:
+            # The truncated recurrence stops where the decay equals budget, at pools in
+            # [lo, hi), and the pool moves towards that range monotonically
+            lo = ceil_div( budget * c, k )
+            hi = ceil_div( (budget + 1) * c, k )
+            if pool < lo:
+                result = min(result, lo)
+            elif pool >= hi:
+                result = max(result, hi - 1)
+            else:
+                result = pool
+        return result
+
+    n = block_count
+    while n > 0:
+        if pool >= 0:
+            # decay is m for pool in [lo, hi)
+            m = (k * pool) >> shift
+            step = budget - m
+            lo = ceil_div( m * c, k )
+            hi = ceil_div( (m + 1) * c, k )
+        else:
+            # decay is -m for pool in (-hi, -lo]
+            m = (k * -pool) >> shift
+            step = budget + m
+            lo = -ceil_div( (m + 1) * c, k ) + 1
+            hi = -ceil_div( m * c, k ) + 1
+        if step == 0:
+            break
+        if step > 0:
+            t = ceil_div( hi - pool, step )
+        else:
+            t = (pool - lo) // -step + 1
+        t = min(t, n)
+        pool += t * step
+        n -= t
+    return pool
+
 class RCModel(object):
-    def __init__(self, resource_params=None, resource_pool=None, rc_regen=0 ):
+    # count_resources may be passed to share an already compiled ResourceCounter.
+    #
+    # The chain state, resource_pool and rc_regen, is held as one (resource_pool,
+    # PriceSnapshot) tuple which is only ever replaced, by a single reference assignment.
+    # Every pricing and pool dynamics method reads it once, so it sees either the old or the
+    # new state, never a mix, without taking a lock.  Use set_chain_state() to replace both
+    # at once; assigning resource_pool or rc_regen replaces one and keeps the other.  The
+    # resource_pool dict must not be modified in place after it is set.
+    def __init__(self, resource_params=None, resource_pool=None, rc_regen=0, cache_size=0, count_resources=None ):
         self.resource_params = resource_params
-        self.resource_pool = resource_pool
-        self.rc_regen = rc_regen
-        self.count_resources = ResourceCounter(resource_params)
+        if count_resources is None:
+            count_resources = ResourceCounter(resource_params, cache_size=cache_size)
+        self.count_resources = count_resources
         self.resource_names = self.resource_params["resource_names"]
+        self._state = (resource_pool, PriceSnapshot( resource_params, resource_pool, rc_regen ))
+        self._cost_cache = LRUCache(cache_size) if cache_size > 0 else None
+        self.instrumentation = None
+
+    @property
+    def resource_pool(self):
+        return self._state[0]
+
+    @resource_pool.setter
+    def resource_pool(self, resource_pool):
+        self.set_chain_state( resource_pool=resource_pool )
+
+    @property
+    def rc_regen(self):
+        return self._state[1].rc_regen
+
+    @rc_regen.setter
+    def rc_regen(self, rc_regen):
+        self.set_chain_state( rc_regen=rc_regen )
+
+    def set_chain_state(self, resource_pool=None, rc_regen=None):
+        # None keeps the current value
+        current_pool, snapshot = self._state
+        if resource_pool is None:
+            resource_pool = current_pool
+        if rc_regen is None:
+            rc_regen = snapshot.rc_regen
+        self._state = (resource_pool, PriceSnapshot( self.resource_params, resource_pool, rc_regen ))
+
+    def set_instrumentation(self, instrumentation):
+        # Pass None to disable
+        self.instrumentation = instrumentation
+        self.count_resources.instrumentation = instrumentation
 
     def get_transaction_rc_cost(self, tx=None, tx_size=-1):
+        if self.instrumentation is not None:
+            start = time.perf_counter_ns()
+            result = self._get_cached_transaction_rc_cost( tx, tx_size )
+            self.instrumentation.observe_latency( "get_transaction_rc_cost", time.perf_counter_ns() - start )
+            return result
+        return self._get_cached_transaction_rc_cost( tx, tx_size )
+
+    def _get_cached_transaction_rc_cost(self, tx, tx_size):
+        snapshot = self._state[1]
+        if self._cost_cache is None:
+            return self._get_transaction_rc_cost( tx, tx_size, snapshot )
+
+        # Costs also depend on the chain state, entries of replaced states age out of the LRU
+        if tx_size < 0:
+            ser = SizeSerializer()
+            ser.signed_transaction(tx)
+            tx_size = ser.flush()
+        key = (snapshot, transaction_shape( tx, tx_size ))
+        items = self._cost_cache.get(key)
+        if items is None:
+            result = self._get_transaction_rc_cost( tx, tx_size, snapshot )
+            self._cost_cache.put( key, (tuple(result["usage"]["resource_count"].items()), tuple(result["cost"].items())) )
+            return result
+        usage_items, cost_items = items
+        return collections.OrderedDict((
+           ("usage", collections.OrderedDict( (("resource_count", collections.OrderedDict(usage_items)),) )),
+           ("cost", collections.OrderedDict(cost_items)),
+           ))
+
+    def cache_info(self):
+        if self._cost_cache is None:
+            return None
+        return collections.OrderedDict((
+           ("count", self.count_resources.cache_info()),
+           ("cost", self._cost_cache.info()),
+           ))
+
+    def _get_transaction_rc_cost(self, tx, tx_size, snapshot):
         usage = self.count_resources( tx, tx_size )
 
         total_cost = 0
 
         cost = collections.OrderedDict()
 
-        for resource_name in self.resource_params["resource_names"]:
+        for i, resource_name in enumerate(self.resource_params["resource_names"]):
             params = self.resource_params["resource_params"][resource_name]
-            pool = int(self.resource_pool[resource_name]["pool"])
+            pool = snapshot.pool[i]
 
             usage["resource_count"][resource_name] *= params["resource_dynamics_params"]["resource_unit"]
-            cost[resource_name] = compute_rc_cost_of_resource( params["price_curve_params"], pool, usage["resource_count"][resource_name], self.rc_regen)
+            cost[resource_name] = compute_rc_cost_of_resource( params["price_curve_params"], pool, usage["resource_count"][resource_name], snapshot.rc_regen)
             total_cost += cost[resource_name]
-        # TODO: Port get_resource_user()
+        # The account to charge is get_resource_user( tx )
         return collections.OrderedDict( (("usage", usage), ("cost", cost)) )
 
+    def get_transaction_rc_cost_compact(self, tx=None, tx_size=-1):
+        # Like get_transaction_rc_cost(), but returns a TransactionCost
+        snapshot = self.get_price_snapshot()
+        usage = self.count_resources.count_compact( tx, tx_size ).values
+        cost = snapshot.get_rc_cost( usage )
+        return TransactionCost( self.resource_names, [u * unit for u, unit in zip(usage, snapshot.unit)], cost )
+
+    def get_price_snapshot(self):
+        # Returns the PriceSnapshot of the current rc_regen and pool levels
+        return self._state[1]
+
+    def apply_rc_pool_dynamics_compact(self, count):
+        # Like apply_rc_pool_dynamics(), count is a ResourceCount or a list in resource_names order
+        if isinstance(count, ResourceCount):
+            count = count.values
+        n = len(self.resource_names)
+        dt = [1] * n
+        decay = []
+        budget = []
+        usage = []
+        pool = []
+        new_pool = []
+        snapshot = self._state[1]
+        for i, resource_name in enumerate(self.resource_names):
+            params = self.resource_params["resource_params"][resource_name]["resource_dynamics_params"]
+            p = snapshot.pool[i]
+            b = int(params["budget_per_time_unit"]) * dt[i]
+            u = count[i] * params["resource_unit"]
+            d = rd_compute_pool_decay( params["decay_params"], p - u, dt[i] )
+            pool.append(p)
+            budget.append(b)
+            usage.append(u)
+            decay.append(d)
+            new_pool.append(p - d + b - u)
+        return PoolDynamics( self.resource_names, dt, decay, budget, usage, pool, new_pool )
+
+    def fast_forward_pools(self, block_count, exact=False):
+        # The resource pool after block_count blocks without transactions, see
+        # rd_fast_forward_pool().  The model itself is not modified.
+        resource_pool = collections.OrderedDict()
+        snapshot = self._state[1]
+        for i, resource_name in enumerate(self.resource_names):
+            params = self.resource_params["resource_params"][resource_name]["resource_dynamics_params"]
+            resource_pool[resource_name] = collections.OrderedDict( (("pool", rd_fast_forward_pool(
+               params["decay_params"], int(params["budget_per_time_unit"]), snapshot.pool[i],
+               block_count, exact )),) )
+        return resource_pool
+
+    def get_resource_count_matrix(self, txs, tx_sizes=None):
+        # One row per transaction, columns in resource_names order, not yet scaled by resource_unit
+        if tx_sizes is None:
+            tx_sizes = itertools.repeat(-1)
+        return [count.values for count in map(self.count_resources.count_compact, txs, tx_sizes)]
+
+    def get_rc_cost_columns(self, count_matrix):
+        # Same integer arithmetic as compute_rc_cost_of_resource(), with the pool-dependent
+        # factors taken from the price snapshot
+        snapshot = self.get_price_snapshot()
+        cost = collections.OrderedDict()
+        for i, resource_name in enumerate(self.resource_names):
+            f = snapshot.factor[i]
+            d = snapshot.denom[i]
+            column = []
+            for row in count_matrix:
+                c = row[i]
+                if c > 0:
+                    column.append((f * c) // d + 1)
+                elif c == 0:
+                    column.append(0)
+                else:
+                    column.append(-((f * -c) // d + 1))
+            cost[resource_name] = column
+        return cost
+
+    def get_transactions_rc_cost(self, txs, tx_sizes=None):
+        return self.get_rc_cost_columns( self.get_resource_count_matrix( txs, tx_sizes ) )
+
     def apply_rc_pool_dynamics(self, count):
         block_info = collections.OrderedDict((
            ("dt", collections.OrderedDict()),
@@ -363,9 +2067,10 @@ class RCModel(object):
            ("new_pool", collections.OrderedDict()),
            ))
 
-        for resource_name in self.resource_params["resource_names"]:
+        snapshot = self._state[1]
+        for i, resource_name in enumerate(self.resource_params["resource_names"]):
             params = self.resource_params["resource_params"][resource_name]["resource_dynamics_params"]
-            pool = int(self.resource_pool[resource_name]["pool"])
+            pool = snapshot.pool[i]
             dt = 1
 
             block_info["pool"][resource_name] = pool
@@ -377,8 +2082,594 @@ class RCModel(object):
             block_info["new_pool"][resource_name] = pool - block_info["decay"][resource_name] + block_info["budget"][resource_name] - block_info["usage"][resource_name]
         return block_info
 
+def read_jsonl( f ):
+    # f is a filename or an iterable of lines, e.g. an open file or sys.stdin
+    if isinstance(f, str):
+        with open(f, "r") as fp:
+            yield from read_jsonl(fp)
+        return
+    for line in f:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+# Lightweight ingestion of block JSON.  Strings which only contribute to the transaction size
+# (post bodies, memos, custom_json payloads, ...) are replaced by their encoded size before the
+# line is decoded, so they never become Python strings.
+payload_fields = (b"body", b"json_metadata", b"title", b"memo", b"json", b"json_meta", b"data")
+payload_re = re.compile(rb'"(?:' + b"|".join(payload_fields) + rb')"\s*:\s*"')
+unicode_escape_re = re.compile(rb'(?<!\\)(?:\\\\)*\\u([0-9a-fA-F]{4})')
+
+def json_string_size( line, start, end ):
+    # UTF-8 size of the JSON string literal line[start:end], without decoding it
+    size = end - start
+    if line.find(b"\\", start, end) < 0:
+        return size
+    # Every escape sequence starts with a backslash, except the second one of "\\"
+    size -= line.count(b"\\", start, end) - line.count(b"\\\\", start, end)
+    if line.find(b"\\u", start, end) >= 0:
+        for cp in unicode_escape_re.findall(line, start, end):
+            cp = int(cp, 16)
+            # Each \uXXXX is 6 bytes, 1 was already subtracted above
+            if cp < 0x80:
+                size -= 4
+            elif cp < 0x800 or 0xD800 <= cp < 0xE000:
+                # Each half of a surrogate pair accounts for 2 of the 4 bytes
+                size -= 3
+            else:
+                size -= 2
+    return size
+
+def strip_payloads( line ):
+    # Returns line with the payload string values replaced by their size
+    pieces = []
+    pos = 0
+    m = payload_re.search(line)
+    while m is not None:
+        start = m.end()
+        end = line.find(b'"', start)
+        while True:
+            # The closing quote is the first one not preceded by an odd number of backslashes
+            i = end - 1
+            while line[i] == 0x5C:
+                i -= 1
+            if (end - 1 - i) % 2 == 0:
+                break
+            end = line.find(b'"', end + 1)
+        pieces.append( line[pos:start-1] )
+        pieces.append( str(json_string_size( line, start, end )).encode("ascii") )
+        pos = end + 1
+        m = payload_re.search(line, pos)
+    if pos == 0:
+        return line
+    pieces.append( line[pos:] )
+    return b"".join(pieces)
+
+# The fields of each operation read by compile_operation_counters()
+operation_cost_fields = {
+    "account_create_operation" : ("owner", "active", "posting"),
+    "account_create_with_delegation_operation" : ("owner", "active", "posting"),
+    "create_claimed_account_operation" : ("owner", "active", "posting"),
+    "comment_operation" : ("permlink", "parent_permlink"),
+    "comment_options_operation" : ("extensions",),
+    "limit_order_create_operation" : ("fill_or_kill",),
+    "limit_order_create2_operation" : ("fill_or_kill",),
+    "witness_update_operation" : ("url",),
+    "claim_account_operation" : ("fee",),
+    }
+
+# The fields of each operation read by operation_authorities, to find the resource user
+operation_payer_fields = {
+    "vote_operation" : ("voter",),
+    "comment_operation" : ("author",),
+    "transfer_operation" : ("from",),
+    "transfer_to_vesting_operation" : ("from",),
+    "withdraw_vesting_operation" : ("account",),
+    "limit_order_create_operation" : ("owner",),
+    "limit_order_cancel_operation" : ("owner",),
+    "feed_publish_operation" : ("publisher",),
+    "convert_operation" : ("owner",),
+    "account_create_operation" : ("creator",),
+    "account_update_operation" : ("account", "owner"),
+    "witness_update_operation" : ("owner",),
+    "account_witness_vote_operation" : ("account",),
+    "account_witness_proxy_operation" : ("account",),
+    "pow_operation" : ("worker_account",),
+    "custom_operation" : ("required_auths",),
+    "report_over_production_operation" : (),
+    "delete_comment_operation" : ("author",),
+    "custom_json_operation" : ("required_auths", "required_posting_auths"),
+    "comment_options_operation" : ("author",),
+    "set_withdraw_vesting_route_operation" : ("from_account",),
+    "limit_order_create2_operation" : ("owner",),
+    "claim_account_operation" : ("creator",),
+    "create_claimed_account_operation" : ("creator",),
+    "request_account_recovery_operation" : ("recovery_account",),
+    "recover_account_operation" : ("new_owner_authority", "recent_owner_authority"),
+    "change_recovery_account_operation" : ("account_to_recover",),
+    "escrow_transfer_operation" : ("from",),
+    "escrow_dispute_operation" : ("who",),
+    "escrow_release_operation" : ("who",),
+    "pow2_operation" : ("work",),
+    "escrow_approve_operation" : ("who",),
+    "transfer_to_savings_operation" : ("from",),
+    "transfer_from_savings_operation" : ("from",),
+    "cancel_transfer_from_savings_operation" : ("from",),
+    "custom_binary_operation" : ("required_active_auths", "required_owner_auths", "required_posting_auths", "required_auths"),
+    "decline_voting_rights_operation" : ("account",),
+    "reset_account_operation" : ("reset_account",),
+    "set_reset_account_operation" : ("account",),
+    "claim_reward_balance_operation" : ("account",),
+    "delegate_vesting_shares_operation" : ("delegator",),
+    "account_create_with_delegation_operation" : ("creator",),
+    "witness_set_properties_operation" : ("owner",),
+    "claim_reward_balance2_operation" : ("account",),
+    "smt_setup_operation" : ("control_account",),
+    "smt_cap_reveal_operation" : ("control_account",),
+    "smt_refund_operation" : ("executor",),
+    "smt_setup_emissions_operation" : ("control_account",),
+    "smt_set_setup_parameters_operation" : ("control_account",),
+    "smt_set_runtime_parameters_operation" : ("control_account",),
+    "smt_create_operation" : ("control_account",),
+    }
+
+# The fields parse_block_record() keeps with trim, enough to count and to charge a transaction
+operation_record_fields = dict( (op_type, operation_cost_fields.get(op_type, ()) + operation_payer_fields.get(op_type, ()))
+                                for op_type in set(operation_cost_fields) | set(operation_payer_fields) )
+
+class RecordSizeSerializer(SizeSerializer):
+    # SizeSerializer for transactions whose payload strings were replaced by their size
+    def string( self, s ):
+        if s.__class__ is int:
+            self.size += varint_size(s) + s
+        else:
+            SizeSerializer.string( self, s )
+
+    def hex_bytes( self, h ):
+        n = (h if h.__class__ is int else len(h)) // 2
+        self.size += varint_size(n) + n
+
+def parse_block_record( line, trim=True ):
+    # Returns the block with "transaction_sizes" set.  With trim, transactions only keep the
+    # operation fields needed for counting and for get_resource_user(), otherwise everything
+    # but the payload strings.
+    if isinstance(line, str):
+        line = line.encode("utf8")
+    block = json.loads( strip_payloads( line ) )
+    txs = block["transactions"]
+    tx_sizes = []
+    for tx in txs:
+        ser = RecordSizeSerializer()
+        ser.signed_transaction(tx)
+        tx_sizes.append(ser.flush())
+    if trim:
+        record = {}
+        for k in ("block_num", "timestamp"):
+            if k in block:
+                record[k] = block[k]
+        record["transactions"] = [{"operations" : [
+           {"type" : op["type"], "value" : dict( (k, op["value"][k]) for k in operation_record_fields.get(op["type"], ()) if k in op["value"] )}
+           for op in tx["operations"]]} for tx in txs]
+        block = record
+    block["transaction_sizes"] = tx_sizes
+    return block
+
+def read_block_records( f, trim=True ):
+    # Like read_jsonl(), but yields parse_block_record() results
+    if isinstance(f, str):
+        with open(f, "rb") as fp:
+            yield from read_block_records( fp, trim )
+        return
+    for line in f:
+        line = line.strip()
+        if line:
+            yield parse_block_record( line, trim )
+
+def replay_blocks( blocks, model, start_block_num=1, schedules=None, per_transaction=False ):
+    # Replays a stream of blocks (a JSONL filename or an iterable of block dicts) through the
+    # pool dynamics, starting from model's resource pool.  The model itself is not modified.
+    #
+    # Transactions are priced against the pool at the start of their block, like steemd does.
+    # Yields one snapshot per block, "pool" is the pool level after the block in the same
+    # format as get_resource_pool, so a snapshot can be used to resume a replay.
+    #
+    # With a CostScheduleRegistry, each block uses the resource_params of its schedule
+    # instead of model's, so one replay can cross parameter changes.
+    #
+    # With per_transaction, snapshots also have the per-transaction "count_matrix" (unscaled,
+    # see get_resource_count_matrix) and "cost_columns" (see get_rc_cost_columns).
+    if isinstance(blocks, str):
+        blocks = read_jsonl(blocks)
+    resource_names = model.resource_names
+    replay_model = RCModel( resource_params=model.resource_params,
+                            resource_pool=model.resource_pool,
+                            rc_regen=model.rc_regen )
+    schedule = None
+    for block_num, block in enumerate(blocks, start_block_num):
+        block_num = block.get("block_num", block_num)
+        if schedules is not None and schedules.get_schedule( block_num ) is not schedule:
+            schedule = schedules.get_schedule( block_num )
+            replay_model = RCModel( resource_params=schedule.resource_params,
+                                    resource_pool=replay_model.resource_pool,
+                                    rc_regen=replay_model.rc_regen,
+                                    count_resources=schedule.count_resources )
+        txs = block["transactions"]
+        count_matrix = replay_model.get_resource_count_matrix( txs, block.get("transaction_sizes") )
+        cost_columns = replay_model.get_rc_cost_columns( count_matrix )
+
+        count = collections.OrderedDict()
+        cost = collections.OrderedDict()
+        for i, resource_name in enumerate(resource_names):
+            count[resource_name] = sum(row[i] for row in count_matrix)
+            cost[resource_name] = sum(cost_columns[resource_name])
+
+        dynamics = replay_model.apply_rc_pool_dynamics_compact( list(count.values()) )
+        pool = collections.OrderedDict( (resource_name, collections.OrderedDict( (("pool", new_pool),) ))
+                                        for resource_name, new_pool in zip(resource_names, dynamics.new_pool) )
+        replay_model.resource_pool = pool
+        snapshot = collections.OrderedDict((
+           ("block_num", block_num),
+           ("transaction_count", len(txs)),
+           ("resource_count", count),
+           ("cost", cost),
+           ("pool", pool),
+           ))
+        if per_transaction:
+            snapshot["count_matrix"] = count_matrix
+            snapshot["cost_columns"] = cost_columns
+        yield snapshot
+
+class ResourceTotals(object):
+    # Resource usage summed over many blocks.  merge() is associative, so totals of
+    # consecutive block ranges can be counted independently and combined in any grouping.
+    def __init__(self, resource_names):
+        self.resource_names = resource_names
+        self.block_count = 0
+        self.transaction_count = 0
+        self.resource_count = collections.OrderedDict( (resource_name, 0) for resource_name in resource_names )
+        # op_type -> [op_count, state_bytes, execution_time]
+        self.operations = {}
+
+    def add_block( self, block, count_resources ):
+        self.block_count += 1
+        resource_count = self.resource_count
+        count_operation = count_resources._count_operation
+        operations = self.operations
+        tx_sizes = block.get("transaction_sizes")
+        for i, tx in enumerate(block["transactions"]):
+            self.transaction_count += 1
+            for resource_name, value in count_resources( tx, -1 if tx_sizes is None else tx_sizes[i] )["resource_count"].items():
+                resource_count[resource_name] += value
+            for op in tx["operations"]:
+                state_bytes, execution_time, market_ops, new_account_ops = count_operation[op["type"]](op["value"])
+                totals = operations.get(op["type"])
+                if totals is None:
+                    totals = operations[op["type"]] = [0, 0, 0]
+                totals[0] += 1
+                totals[1] += state_bytes
+                totals[2] += execution_time
+
+    def merge( self, other ):
+        self.block_count += other.block_count
+        self.transaction_count += other.transaction_count
+        for resource_name, value in other.resource_count.items():
+            self.resource_count[resource_name] += value
+        for op_type, other_totals in other.operations.items():
+            totals = self.operations.setdefault(op_type, [0, 0, 0])
+            for i, value in enumerate(other_totals):
+                totals[i] += value
+        return self
+
+    def to_dict(self):
+        return collections.OrderedDict((
+           ("block_count", self.block_count),
+           ("transaction_count", self.transaction_count),
+           ("resource_count", collections.OrderedDict(self.resource_count)),
+           ("operations", collections.OrderedDict(
+              (op_type, collections.OrderedDict(zip(("count", "state_bytes", "execution_time"), totals)))
+              for op_type, totals in sorted(self.operations.items()) )),
+           ))
+
+def count_blocks( blocks, resource_params, start_block_num=1 ):
+    # resource_params may also be a CostScheduleRegistry, then each block is counted with
+    # the schedule in force at its "block_num", or at its position counted from
+    # start_block_num for blocks without one (get_block results), like replay_blocks()
+    if isinstance(resource_params, CostScheduleRegistry):
+        totals = ResourceTotals(resource_params.resource_names)
+        for block_num, block in enumerate(blocks, start_block_num):
+            totals.add_block( block, resource_params.get_counter( block.get("block_num", block_num) ) )
+        return totals
+    count_resources = ResourceCounter(resource_params)
+    totals = ResourceTotals(resource_params["resource_names"])
+    for block in blocks:
+        totals.add_block( block, count_resources )
+    return totals
+
+def shard_jsonl( filename, shard_count ):
+    # Splits a JSONL file into byte ranges which start and end on line boundaries.  Since the
+    # archive stores one block per line in order, each range is a contiguous block range.
+    size = os.path.getsize(filename)
+    offsets = [0]
+    with open(filename, "rb") as f:
+        for k in range(1, shard_count):
+            f.seek(max(size * k // shard_count, offsets[-1]))
+            f.readline()
+            offsets.append(f.tell())
+    offsets.append(size)
+    return [(start, end) for start, end in zip(offsets, offsets[1:]) if end > start]
+
+def read_jsonl_range( filename, start, end ):
+    with open(filename, "rb") as f:
+        f.seek(start)
+        while f.tell() < end:
+            line = f.readline()
+            if not line:
+                break
+            if line.strip():
+                yield parse_block_record( line )
+
+def count_jsonl_range( filename, start, end, resource_params, start_block_num=1 ):
+    return count_blocks( read_jsonl_range( filename, start, end ), resource_params, start_block_num )
+
+def count_jsonl_blocks( filename, start, end ):
+    # Number of non-blank lines in a byte range from shard_jsonl()
+    count = 0
+    with open(filename, "rb") as f:
+        f.seek(start)
+        while f.tell() < end:
+            line = f.readline()
+            if not line:
+                break
+            if line.strip():
+                count += 1
+    return count
+
+def count_block_archive( filename, resource_params, jobs=None, shards_per_job=4 ):
+    # Counts a JSONL block archive on a pool of jobs processes (default: one per CPU)
+    # and reduces the per-shard totals.  The result equals count_blocks() over the whole file.
+    # resource_params may be a CostScheduleRegistry, as in count_blocks().
+    import concurrent.futures
+    import functools
+
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    if jobs <= 1:
+        return count_blocks( read_block_records(filename), resource_params )
+    if isinstance(resource_params, CostScheduleRegistry):
+        resource_names = resource_params.resource_names
+    else:
+        resource_names = resource_params["resource_names"]
+    shards = shard_jsonl( filename, jobs * shards_per_job )
+    # A registry needs each block's number.  When the archive's blocks have no "block_num",
+    # it is the line number, so count the lines before each shard.
+    start_block_nums = [1] * len(shards)
+    if isinstance(resource_params, CostScheduleRegistry):
+        with contextlib.closing( read_jsonl_range( filename, 0, os.path.getsize(filename) ) ) as records:
+            first = next(records, None)
+        if first is not None and "block_num" not in first:
+            block_num = 1
+            for k, (start, end) in enumerate(shards):
+                start_block_nums[k] = block_num
+                block_num += count_jsonl_blocks( filename, start, end )
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit( count_jsonl_range, filename, start, end, resource_params, start_block_num )
+                   for (start, end), start_block_num in zip(shards, start_block_nums)]
+        return functools.reduce( ResourceTotals.merge,
+                                 (f.result() for f in futures),
+                                 ResourceTotals(resource_names) )
+
+class AccountRCStore(object):
+    # RC manabars of many accounts, stored in parallel arrays indexed by account id.
+    # max_mana is the account's effective vesting shares (in satoshis), current_mana
+    # regenerates lazily to max_mana over STEEM_RC_REGEN_TIME seconds.  Times are in
+    # seconds, and are truncated to whole seconds like the chain's time_point_sec.
+    def __init__(self, regen_time=None):
+        self.regen_time = STEEM_RC_REGEN_TIME if regen_time is None else regen_time
+        self.account_ids = {}
+        self.account_names = []
+        self.max_mana = array.array("q")
+        self.current_mana = array.array("q")
+        self.last_update_time = array.array("I")
+        # Transactions whose resource user has no account in the store
+        self.unknown_account_count = 0
+
+    def __len__(self):
+        return len(self.account_names)
+
+    def create_account( self, name, vesting_shares, now ):
+        # New accounts start with a full manabar
+        account_id = len(self.account_names)
+        self.account_ids[name] = account_id
+        self.account_names.append(name)
+        self.max_mana.append(vesting_shares)
+        self.current_mana.append(vesting_shares)
+        self.last_update_time.append(int(now))
+        return account_id
+
+    def regenerate( self, account_id, now ):
+        now = int(now)
+        dt = now - self.last_update_time[account_id]
+        if dt <= 0:
+            return self.current_mana[account_id]
+        max_mana = self.max_mana[account_id]
+        current_mana = self.current_mana[account_id]
+        if dt >= self.regen_time or current_mana >= max_mana:
+            current_mana = max_mana
+        else:
+            current_mana = min(current_mana + (max_mana * dt) // self.regen_time, max_mana)
+        self.current_mana[account_id] = current_mana
+        self.last_update_time[account_id] = now
+        return current_mana
+
+    def set_vesting_shares( self, name, vesting_shares, now ):
+        account_id = self.account_ids[name]
+        self.regenerate( account_id, now )
+        self.max_mana[account_id] = vesting_shares
+
+    def get_current_mana( self, name, now ):
+        return self.regenerate( self.account_ids[name], now )
+
+    def use_mana( self, name, amount, now ):
+        account_id = self.account_ids[name]
+        current_mana = self.regenerate( account_id, now ) - amount
+        self.current_mana[account_id] = current_mana
+        return current_mana
+
+    def apply_transaction( self, model, tx, now, tx_size=-1 ):
+        # Charges the resource user of tx, returns (resource_user, rc_cost).  A resource user
+        # without an account in the store is not charged, only counted in unknown_account_count.
+        resource_user = get_resource_user( tx )
+        rc_cost = sum(model.get_transaction_rc_cost( tx, tx_size )["cost"].values())
+        if resource_user is not None:
+            if resource_user in self.account_ids:
+                self.use_mana( resource_user, rc_cost, now )
+            else:
+                self.unknown_account_count += 1
+        return resource_user, rc_cost
+
+class CapacityPlanner(object):
+    # Answers capacity questions for many accounts without pricing transactions per account.
+    # templates maps a name to {"tx" : ..., "tx_size" : ...} like example_transactions, a mix
+    # maps template names to counts.  Template costs are computed once at the model's current
+    # pool levels, after which every query is a few integer operations.  The costs drift as
+    # the pools move, so make a new planner when the model is refreshed.
+    def __init__(self, model, templates, total_vesting_shares, total_vesting_fund_steem, regen_time=None):
+        self.model = model
+        self.regen_time = STEEM_RC_REGEN_TIME if regen_time is None else regen_time
+        self.total_vesting_shares = total_vesting_shares
+        self.total_vesting_fund_steem = total_vesting_fund_steem
+        names = list(templates.keys())
+        cost_columns = model.get_transactions_rc_cost(
+           [templates[name]["tx"] for name in names],
+           [templates[name].get("tx_size", -1) for name in names] )
+        self.template_costs = collections.OrderedDict(
+           (name, sum(column[i] for column in cost_columns.values())) for i, name in enumerate(names) )
+
+    def get_cost( self, what ):
+        # what is a template name or a mix
+        if isinstance(what, str):
+            return self.template_costs[what]
+        return sum(self.template_costs[name] * count for name, count in what.items())
+
+    def get_affordable_count( self, what, vesting_shares, current_mana=None ):
+        # Returns (count affordable right now, count affordable per regen_time at steady state).
+        # Regeneration refills exactly vesting_shares mana per regen_time.
+        cost = self.get_cost( what )
+        if current_mana is None:
+            current_mana = vesting_shares
+        return (max(current_mana, 0) // cost, vesting_shares // cost)
+
+    def get_affordable_counts( self, vesting_shares, current_mana=None ):
+        return collections.OrderedDict( (name, self.get_affordable_count( name, vesting_shares, current_mana ))
+                                        for name in self.template_costs )
+
+    def get_required_vesting_shares( self, what, period=None ):
+        # Vesting shares needed to sustain the given count (or mix) every period seconds
+        # (default regen_time), rounded up
+        if period is None:
+            period = self.regen_time
+        return -((-self.get_cost( what ) * self.regen_time) // period)
+
+    def get_required_steem_power( self, what, period=None ):
+        # Like get_required_vesting_shares(), in STEEM satoshis at the current vesting price
+        vests = self.get_required_vesting_shares( what, period )
+        return -((-vests * self.total_vesting_fund_steem) // self.total_vesting_shares)
+
+    def get_time_until_affordable( self, what, vesting_shares, current_mana ):
+        # Seconds until current_mana regenerates enough to pay for what, using the same
+        # integer regeneration as AccountRCStore.regenerate().  None if it never will.
+        cost = self.get_cost( what )
+        if current_mana >= cost:
+            return 0
+        if cost > vesting_shares:
+            return None
+        return min(-((-(cost - current_mana) * self.regen_time) // vesting_shares), self.regen_time)
+
+class OperationPacker(object):
+    # Packs a queue of pending operations into transactions of minimal total RC cost.  Every
+    # transaction pays for its own header, signatures and transaction object, so within a
+    # group of operations which may share a transaction, fewer transactions always cost
+    # less.  Operations may share a transaction when they have the same resource user (who
+    # pays), are either all posting-only or all not (steemd rejects transactions mixing
+    # posting and active/owner authorities), and are either all market operations or all
+    # not, since one market operation charges resource_market_bytes for the whole
+    # transaction.  Each group is packed first fit decreasing, under max_size bytes and
+    # max_operations operations per transaction.
+    #
+    # Operations are reordered, so only pack operations whose order does not matter (votes,
+    # custom_json's...).  Sizes assume signature_count signatures per transaction.
+    def __init__(self, model, max_size=None, max_operations=None, signature_count=1):
+        self.model = model
+        self.max_size = STEEM_MAX_TRANSACTION_SIZE if max_size is None else max_size
+        self.max_operations = max_operations
+        self.signature_count = signature_count
+        # ref_block_num, ref_block_prefix, expiration, no extensions, the signatures
+        self._envelope_size = 2 + 4 + 4 + 1 + varint_size(signature_count) + STEEM_SIGNATURE_SIZE * signature_count
+
+    def get_transaction_size( self, op_count, op_size_sum ):
+        return self._envelope_size + varint_size(op_count) + op_size_sum
+
+    def get_operation_size( self, op ):
+        ser = SizeSerializer()
+        ser.operation(op)
+        return ser.flush()
+
+    def get_group_key( self, op ):
+        active, owner, posting, other = operation_authorities[op["type"]](op["value"])
+        posting_only = len(posting) > 0 and not (active or owner or other)
+        market = self.model.count_resources._count_operation[op["type"]](op["value"])[2] > 0
+        return (get_operation_resource_user( op ), posting_only, market)
+
+    def pack( self, ops, sizes=None ):
+        # Returns a list of transactions, each a list of indexes into ops.  sizes are the
+        # operation sizes if already known.
+        if sizes is None:
+            sizes = [self.get_operation_size( op ) for op in ops]
+        groups = collections.OrderedDict()
+        for i, op in enumerate(ops):
+            if self.get_transaction_size( 1, sizes[i] ) > self.max_size:
+                raise ValueError("Operation {} ({}) does not fit in a transaction of {} bytes".format(i, op["type"], self.max_size))
+            groups.setdefault( self.get_group_key( op ), [] ).append(i)
+
+        transactions = []
+        for indexes in groups.values():
+            # [op_size_sum, indexes] of the transactions of this group
+            bins = []
+            for i in sorted( indexes, key=lambda i : -sizes[i] ):
+                for b in bins:
+                    n = len(b[1]) + 1
+                    if ((self.max_operations is None or n <= self.max_operations)
+                        and self.get_transaction_size( n, b[0] + sizes[i] ) <= self.max_size):
+                        b[0] += sizes[i]
+                        b[1].append(i)
+                        break
+                else:
+                    bins.append( [sizes[i], [i]] )
+            transactions.extend( sorted(b[1]) for b in bins )
+        return transactions
+
+    def plan( self, ops ):
+        # Packs ops and prices the result against pricing each operation alone
+        sizes = [self.get_operation_size( op ) for op in ops]
+        packed = self.pack( ops, sizes )
+        txs = [{"operations" : [ops[i] for i in indexes]} for indexes in packed]
+        tx_sizes = [self.get_transaction_size( len(indexes), sum(sizes[i] for i in indexes) ) for indexes in packed]
+        cost_columns = list(self.model.get_transactions_rc_cost( txs, tx_sizes ).values())
+        costs = [sum(column[k] for column in cost_columns) for k in range(len(txs))]
+        single_costs = self.model.get_transactions_rc_cost(
+           [{"operations" : [op]} for op in ops],
+           [self.get_transaction_size( 1, size ) for size in sizes] )
+        unpacked_cost = sum(sum(column) for column in single_costs.values())
+        return collections.OrderedDict((
+           ("transactions", [collections.OrderedDict( (("operations", indexes), ("tx_size", tx_size), ("cost", cost)) )
+                             for indexes, tx_size, cost in zip(packed, tx_sizes, costs)]),
+           ("total_cost", sum(costs)),
+           ("unpacked_cost", unpacked_cost),
+           ))
+
 # These are constants #define in the code
 STEEM_RC_REGEN_TIME = 60*60*24*5
+STEEM_MAX_TRANSACTION_SIZE = 1024*64
 STEEM_BLOCK_INTERVAL = 3
 
 # This is the result of rc_api.get_resource_params()
@@ -678,12 +2969,56 @@ vote_tx_size = example_transactions["vote"]["tx_size"]
 
 import json
 
-count_resources = ResourceCounter(resource_params)
-
-rc_regen = total_vesting_shares // (STEEM_RC_REGEN_TIME // STEEM_BLOCK_INTERVAL)
-model = RCModel( resource_params=resource_params, resource_pool=resource_pool, rc_regen=rc_regen )
+def load_model( params_filename=None, pool_filename=None, rc_regen=None, total_vesting_shares=None ):
+    # Builds an RCModel from the results of rc_api.get_resource_params / get_resource_pool
+    # saved as JSON, falling back to the values embedded here
+    resource_params = globals()["resource_params"]
+    resource_pool = globals()["resource_pool"]
+    if params_filename is not None:
+        with open(params_filename, "r") as f:
+            resource_params = json.load(f)
+    if pool_filename is not None:
+        with open(pool_filename, "r") as f:
+            resource_pool = json.load(f)
+        resource_pool = resource_pool.get("resource_pool", resource_pool)
+    if rc_regen is None:
+        if total_vesting_shares is None:
+            total_vesting_shares = globals()["total_vesting_shares"]
+        rc_regen = total_vesting_shares // (STEEM_RC_REGEN_TIME // STEEM_BLOCK_INTERVAL)
+    return RCModel( resource_params=resource_params, resource_pool=resource_pool, rc_regen=rc_regen )
+
+# Only one parameter era is known so far, add later ones with cost_schedules.add()
+cost_schedules = CostScheduleRegistry()
+cost_schedules.add( 1, resource_params, name="hf20" )
+
+# count_resources, rc_regen and model are built on first access through the module
+# __getattr__ (PEP 562), so importing rcdemo for its functions stays cheap
+lazy_module_objects = collections.OrderedDict((
+   ("count_resources", lambda : ResourceCounter(resource_params)),
+   ("rc_regen", lambda : total_vesting_shares // (STEEM_RC_REGEN_TIME // STEEM_BLOCK_INTERVAL)),
+   ("model", lambda : RCModel( resource_params=resource_params, resource_pool=resource_pool, rc_regen=lazy_module_object( "rc_regen" ) )),
+   ))
+
+def __getattr__( name ):
+    factory = lazy_module_objects.get(name)
+    if factory is None:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    value = factory()
+    globals()[name] = value
+    return value
+
+def lazy_module_object( name ):
+    # Like rcdemo.<name>, reusing the object if it was already built
+    module_globals = globals()
+    if name in module_globals:
+        return module_globals[name]
+    return __getattr__( name )
+
+# Without __all__, "from rcdemo import *" would skip the lazy objects
+__all__ = [name for name in globals() if not name.startswith("_")] + list(lazy_module_objects)
 
 if __name__ == "__main__":
+    model = lazy_module_object( "model" )
     for example_name, etx in sorted(example_transactions.items()):
         tx = etx["tx"]
         tx_size = etx["tx_size"]
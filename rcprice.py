@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+
+# Prices transactions from shell pipelines.  Reads JSONL from files or stdin, one
+# transaction per line or {"tx" : ..., "tx_size" : ...}, and writes one JSON line of usage
+# and cost per transaction, in input order, in the format of get_transaction_rc_cost().
+# Lines are priced in batches through get_resource_count_matrix() / get_rc_cost_columns(),
+# in this process or on --jobs worker processes.  Every transaction is priced against the
+# same pool levels, like a quote; pools are not stepped between transactions.
+#
+#   python rcprice.py txs.jsonl --params params.json --pool pool.json > costs.jsonl
+#   python -m rcprice --jobs 4 < txs.jsonl
+
+import argparse
+import collections
+import json
+import os
+import sys
+
+import rcdemo
+
+def parse_line( line ):
+    # Returns (tx, tx_size)
+    obj = json.loads(line)
+    if "operations" not in obj and "tx" in obj:
+        return obj["tx"], obj.get("tx_size", -1)
+    return obj, -1
+
+def price_lines( model, lines ):
+    # Returns one JSON output line per input line, {"error" : ...} for lines which cannot
+    # be parsed or counted, so output lines stay aligned with the input
+    results = [None] * len(lines)
+    count_matrix = []
+    indexes = []
+    for i, line in enumerate(lines):
+        try:
+            tx, tx_size = parse_line( line )
+            count_matrix.append( model.count_resources.count_compact( tx, tx_size ).values )
+        except Exception as e:
+            results[i] = json.dumps( {"error" : "Cannot price transaction: {!r}".format(e)} )
+            continue
+        indexes.append(i)
+    if indexes:
+        snapshot = model.get_price_snapshot()
+        cost_columns = list(model.get_rc_cost_columns( count_matrix ).values())
+        for k, (i, count) in enumerate(zip(indexes, count_matrix)):
+            usage = [c * unit for c, unit in zip(count, snapshot.unit)]
+            cost = [column[k] for column in cost_columns]
+            results[i] = json.dumps( rcdemo.TransactionCost( model.resource_names, usage, cost ).to_dict() )
+    return results
+
+def read_batches( files, batch_size ):
+    # Yields lists of up to batch_size non-blank lines, "-" is stdin
+    batch = []
+    for filename in files:
+        if filename == "-":
+            f = sys.stdin.buffer
+        else:
+            f = open(filename, "rb")
+        try:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                batch.append(line)
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+        finally:
+            if f is not sys.stdin.buffer:
+                f.close()
+    if batch:
+        yield batch
+
+# Per-process model of price workers, set once by init_worker()
+worker_model = None
+
+def init_worker( resource_params, resource_pool, rc_regen ):
+    global worker_model
+    worker_model = rcdemo.RCModel( resource_params=resource_params, resource_pool=resource_pool, rc_regen=rc_regen )
+
+def price_batch( lines ):
+    return price_lines( worker_model, lines )
+
+def price_stream( model, batches, out, jobs=1 ):
+    # Writes the results of every batch to out as soon as it and the batches before it are
+    # done.  With jobs > 1 at most 2 * jobs batches are in flight, so memory stays bounded
+    # however long the input is.
+    def write( results ):
+        out.write( "\n".join(results) + "\n" )
+        out.flush()
+
+    if jobs <= 1:
+        for batch in batches:
+            write( price_lines( model, batch ) )
+        return
+
+    import concurrent.futures
+
+    args = (model.resource_params, model.resource_pool, model.rc_regen)
+    with concurrent.futures.ProcessPoolExecutor( max_workers=jobs, initializer=init_worker, initargs=args ) as executor:
+        pending = collections.deque()
+        for batch in batches:
+            pending.append( executor.submit( price_batch, batch ) )
+            if len(pending) >= 2 * jobs:
+                write( pending.popleft().result() )
+        while pending:
+            write( pending.popleft().result() )
+
+def main( argv=None ):
+    parser = argparse.ArgumentParser( description="Price JSONL transactions, one JSON line of usage and cost per transaction" )
+    parser.add_argument( "inputs", nargs="*", default=["-"], help="JSONL files, default or - for stdin" )
+    parser.add_argument( "--params", help="JSON file with the result of rc_api.get_resource_params" )
+    parser.add_argument( "--pool", help="JSON file with the result of rc_api.get_resource_pool" )
+    parser.add_argument( "--rc-regen", type=int, help="Global RC regeneration rate" )
+    parser.add_argument( "--total-vesting-shares", type=int, help="Used to compute --rc-regen when it is not given" )
+    parser.add_argument( "--jobs", type=int, default=1, help="Worker processes, 0 for one per CPU (default: 1, price in this process)" )
+    parser.add_argument( "--batch-size", type=int, help="Lines per batch (default: 256, or 1 when reading a terminal)" )
+    args = parser.parse_args(argv)
+
+    batch_size = args.batch_size
+    if batch_size is None:
+        batch_size = 1 if "-" in args.inputs and sys.stdin.isatty() else 256
+    jobs = args.jobs or os.cpu_count() or 1
+
+    model = rcdemo.load_model( args.params, args.pool, args.rc_regen, args.total_vesting_shares )
+    try:
+        price_stream( model, read_batches( args.inputs, max(1, batch_size) ), sys.stdout, jobs )
+    except BrokenPipeError:
+        # The reader went away, e.g. "| head", don't complain when stdout is closed at exit
+        os.dup2( os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno() )
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
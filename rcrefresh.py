@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+
+# Keeps an RCModel up to date with a steemd node.  The chain state is fetched with one
+# JSON-RPC batch over a small pool of keep-alive HTTP connections, and each refresh
+# replaces the whole ChainState with one reference assignment, so readers never see a
+# model built from a mix of old and new values.
+
+import asyncio
+import collections
+import json
+import ssl
+import time
+import urllib.parse
+
+import rcdemo
+
+class JsonRpcError(Exception):
+    pass
+
+class HttpConnection(object):
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    def close(self):
+        self.writer.close()
+
+class JsonRpcClient(object):
+    # Minimal asyncio HTTP/1.1 JSON-RPC client which reuses up to pool_size idle connections
+    def __init__(self, url, pool_size=4, timeout=10.0):
+        u = urllib.parse.urlsplit(url)
+        self.host = u.hostname
+        self.ssl = ssl.create_default_context() if u.scheme == "https" else None
+        self.port = u.port or (443 if self.ssl else 80)
+        self.path = u.path or "/"
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._idle = []
+        self._next_id = 0
+
+    async def _connect(self):
+        if self._idle:
+            return self._idle.pop()
+        reader, writer = await asyncio.open_connection( self.host, self.port, ssl=self.ssl )
+        return HttpConnection(reader, writer)
+
+    def _release( self, conn, keep_alive ):
+        if keep_alive and len(self._idle) < self.pool_size:
+            self._idle.append(conn)
+        else:
+            conn.close()
+
+    async def _read_response( self, reader ):
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionError("Connection closed by server")
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            k, _, v = line.decode("latin-1").partition(":")
+            headers[k.strip().lower()] = v.strip()
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            body = bytearray()
+            while True:
+                size = int((await reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    await reader.readline()
+                    break
+                body += await reader.readexactly(size)
+                await reader.readline()
+        elif "content-length" in headers:
+            body = await reader.readexactly(int(headers["content-length"]))
+        elif status in (204, 304) or status < 200:
+            body = b""
+        else:
+            # Without a length the body ends when the server closes the connection
+            body = await reader.read()
+            return status, body, False
+        keep_alive = headers.get("connection", "").lower() != "close"
+        return status, bytes(body), keep_alive
+
+    async def _post( self, payload ):
+        request = (
+           "POST {} HTTP/1.1\r\n"
+           "Host: {}\r\n"
+           "Content-Type: application/json\r\n"
+           "Content-Length: {}\r\n"
+           "Connection: keep-alive\r\n"
+           "\r\n").format(self.path, self.host, len(payload)).encode("latin-1") + payload
+        # A pooled connection may have been closed by the server while idle, retry once on a new one
+        for attempt in range(2):
+            reused = bool(self._idle)
+            conn = await self._connect()
+            try:
+                conn.writer.write(request)
+                await conn.writer.drain()
+                status, body, keep_alive = await asyncio.wait_for( self._read_response( conn.reader ), self.timeout )
+            except (ConnectionError, asyncio.IncompleteReadError):
+                conn.close()
+                if reused and attempt == 0:
+                    continue
+                raise
+            except BaseException:
+                conn.close()
+                raise
+            self._release( conn, keep_alive )
+            if status != 200:
+                raise JsonRpcError("HTTP status {}".format(status))
+            return json.loads(body)
+
+    async def call( self, method, params=None ):
+        return (await self.batch( [(method, params)] ))[0]
+
+    async def batch( self, calls ):
+        # calls is a list of (method, params), returns the results in the same order
+        requests = []
+        for method, params in calls:
+            self._next_id += 1
+            requests.append( collections.OrderedDict((
+               ("jsonrpc", "2.0"),
+               ("method", method),
+               ("params", {} if params is None else params),
+               ("id", self._next_id),
+               )) )
+        responses = await self._post( json.dumps(requests).encode("utf8") )
+        if isinstance(responses, dict):
+            responses = [responses]
+        by_id = dict( (r.get("id"), r) for r in responses )
+        results = []
+        for request in requests:
+            response = by_id.get(request["id"])
+            if response is None:
+                raise JsonRpcError("No response to {}".format(request["method"]))
+            if "error" in response:
+                raise JsonRpcError("{}: {}".format(request["method"], response["error"]))
+            results.append(response["result"])
+        return results
+
+    async def close(self):
+        while self._idle:
+            self._idle.pop().close()
+
+def parse_vests( v ):
+    # total_vesting_shares is a NAI asset in database_api and "1.000000 VESTS" in condenser_api
+    if isinstance(v, dict):
+        return int(v["amount"])
+    amount, symbol = v.split(" ")
+    return int(amount.replace(".", ""))
+
+class ChainState(object):
+    def __init__(self, model, total_vesting_shares, total_vesting_fund_steem, fetched_at):
+        self.model = model
+        self.total_vesting_shares = total_vesting_shares
+        self.total_vesting_fund_steem = total_vesting_fund_steem
+        self.fetched_at = fetched_at
+
+    def age(self):
+        return time.monotonic() - self.fetched_at
+
+class ChainStateRefresher(object):
+    # Serves get_state() from the cached ChainState.  Once it is older than refresh_interval
+    # a refresh starts in the background and callers keep the cached state meanwhile.  Only
+    # when it is older than max_staleness do callers wait for the refresh to finish.
+    def __init__(self, client, refresh_interval=3.0, max_staleness=30.0, cache_size=0):
+        self.client = client
+        self.refresh_interval = refresh_interval
+        self.max_staleness = max_staleness
+        self.cache_size = cache_size
+        self.state = None
+        self.refresh_count = 0
+        self.error_count = 0
+        self.last_error = None
+        self._refresh_task = None
+
+    async def fetch(self):
+        resource_pool, resource_params, dgpo = await self.client.batch([
+           ("rc_api.get_resource_pool", {}),
+           ("rc_api.get_resource_params", {}),
+           ("database_api.get_dynamic_global_properties", {}),
+           ])
+        resource_pool = resource_pool.get("resource_pool", resource_pool)
+        total_vesting_shares = parse_vests(dgpo["total_vesting_shares"])
+        total_vesting_fund_steem = parse_vests(dgpo["total_vesting_fund_steem"])
+        rc_regen = total_vesting_shares // (rcdemo.STEEM_RC_REGEN_TIME // rcdemo.STEEM_BLOCK_INTERVAL)
+
+        model = rcdemo.RCModel( resource_params=resource_params, resource_pool=resource_pool,
+                                rc_regen=rc_regen, cache_size=self.cache_size )
+        return ChainState( model, total_vesting_shares, total_vesting_fund_steem, time.monotonic() )
+
+    async def refresh(self):
+        try:
+            self.state = await self.fetch()
+            self.refresh_count += 1
+        except Exception as e:
+            self.error_count += 1
+            self.last_error = e
+            raise
+        return self.state
+
+    def _start_refresh(self):
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.ensure_future( self.refresh() )
+            # Errors of background refreshes are counted in refresh(), do not log them as unretrieved
+            self._refresh_task.add_done_callback( lambda t : t.cancelled() or t.exception() )
+        return self._refresh_task
+
+    async def get_state(self):
+        state = self.state
+        if state is None or state.age() > self.max_staleness:
+            return await asyncio.shield( self._start_refresh() )
+        if state.age() > self.refresh_interval:
+            self._start_refresh()
+        return state
+
+    async def get_model(self):
+        return (await self.get_state()).model
+
+    async def run(self):
+        # Optional loop which keeps the state fresh without waiting for callers
+        while True:
+            try:
+                await self._start_refresh()
+            except Exception:
+                pass
+            await asyncio.sleep( self.refresh_interval )
+
+    async def close(self):
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+        await self.client.close()
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+
+# JSON-RPC server which quotes RC costs of transactions.  Concurrent quotes are priced
+# together: requests arriving in the same event loop iteration are counted and priced in
+# one pass against one PriceSnapshot, and identical transactions waiting for the same pass
+# share a single result.  Nothing is fetched from the network, the model is built from
+# the parameters embedded in rcdemo or from local JSON files.
+
+import argparse
+import asyncio
+import collections
+import json
+import time
+
+import rcdemo
+
+# Endpoint latencies are much longer than single counting calls
+server_latency_bounds = (1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2, 0.1, 1.0)
+
+class JsonRpcError(Exception):
+    def __init__(self, code, message):
+        Exception.__init__(self, message)
+        self.code = code
+        self.message = message
+
+def is_int( value ):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+class QuoteBatcher(object):
+    # Collects quote requests and prices them in batches of at most max_batch_size.  A batch
+    # is priced max_delay seconds after its first request, or on the next event loop
+    # iteration when max_delay is 0.
+    def __init__(self, model, max_batch_size=256, max_delay=0.0):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        # key -> (tx, tx_size, future)
+        self._pending = collections.OrderedDict()
+        self._flush_handle = None
+        self.batch_count = 0
+        self.quote_count = 0
+        self.coalesced_count = 0
+
+    async def quote( self, tx, tx_size=-1 ):
+        key = json.dumps( [tx, tx_size], sort_keys=True, separators=(",", ":") )
+        self.quote_count += 1
+        entry = self._pending.get(key)
+        if entry is not None:
+            self.coalesced_count += 1
+            future = entry[2]
+        else:
+            future = asyncio.get_running_loop().create_future()
+            self._pending[key] = (tx, tx_size, future)
+            if len(self._pending) >= self.max_batch_size:
+                self.flush()
+            elif self._flush_handle is None:
+                loop = asyncio.get_running_loop()
+                if self.max_delay > 0:
+                    self._flush_handle = loop.call_later( self.max_delay, self.flush )
+                else:
+                    self._flush_handle = loop.call_soon( self.flush )
+        # Other requests may wait for the same future, so a cancelled caller must not cancel it
+        return await asyncio.shield( future )
+
+    def flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        pending = list(self._pending.values())
+        self._pending.clear()
+        if not pending:
+            return
+        self.batch_count += 1
+
+        # Take one reference to the model, set_model() may replace it at any time
+        model = self.model
+        count_matrix = []
+        futures = []
+        for tx, tx_size, future in pending:
+            try:
+                count_matrix.append( model.count_resources.count_compact( tx, tx_size ).values )
+            except Exception as e:
+                future.set_exception( JsonRpcError(-32602, "Cannot count transaction: {!r}".format(e)) )
+                continue
+            futures.append(future)
+        if not futures:
+            return
+        snapshot = model.get_price_snapshot()
+        cost_columns = model.get_rc_cost_columns( count_matrix )
+        for i, (count, future) in enumerate(zip(count_matrix, futures)):
+            usage = [c * unit for c, unit in zip(count, snapshot.unit)]
+            cost = [column[i] for column in cost_columns.values()]
+            future.set_result( rcdemo.TransactionCost( model.resource_names, usage, cost ).to_dict() )
+
+class QuoteServer(object):
+    def __init__(self, model, max_batch_size=256, max_delay=0.0, latency_bounds=None):
+        self.batcher = QuoteBatcher( model, max_batch_size, max_delay )
+        self.instrumentation = rcdemo.Instrumentation( model.resource_names,
+           server_latency_bounds if latency_bounds is None else latency_bounds )
+        self.methods = {
+           "rc_quote.get_transaction_rc_cost" : self.get_transaction_rc_cost,
+           "rc_quote.get_transactions_rc_cost" : self.get_transactions_rc_cost,
+           "rc_quote.get_stats" : self.get_stats,
+           }
+        self._server = None
+        self._connections = set()
+
+    def set_model( self, model ):
+        # Quotes already being priced keep the model they started with
+        self.batcher.model = model
+
+    async def get_transaction_rc_cost( self, params ):
+        if isinstance(params, list):
+            params = dict(zip(("tx", "tx_size"), params))
+        if not isinstance(params, dict) or not isinstance(params.get("tx"), dict) or not is_int( params.get("tx_size", -1) ):
+            raise JsonRpcError(-32602, "Expected params {\"tx\" : ..., \"tx_size\" : ...}")
+        return await self.batcher.quote( params["tx"], params.get("tx_size", -1) )
+
+    async def get_transactions_rc_cost( self, params ):
+        if isinstance(params, list):
+            params = dict(zip(("txs", "tx_sizes"), params))
+        if not isinstance(params, dict) or not isinstance(params.get("txs"), list):
+            raise JsonRpcError(-32602, "Expected params {\"txs\" : [...], \"tx_sizes\" : [...]}")
+        txs = params["txs"]
+        tx_sizes = params.get("tx_sizes")
+        if tx_sizes is None:
+            tx_sizes = [-1] * len(txs)
+        if not isinstance(tx_sizes, list) or not all(is_int(tx_size) for tx_size in tx_sizes):
+            raise JsonRpcError(-32602, "tx_sizes must be a list of integers")
+        if len(tx_sizes) != len(txs):
+            raise JsonRpcError(-32602, "txs and tx_sizes have different lengths")
+        return await asyncio.gather( *[self.batcher.quote( tx, tx_size ) for tx, tx_size in zip(txs, tx_sizes)] )
+
+    async def get_stats( self, params ):
+        batcher = self.batcher
+        return collections.OrderedDict((
+           ("quote_count", batcher.quote_count),
+           ("coalesced_count", batcher.coalesced_count),
+           ("batch_count", batcher.batch_count),
+           ("latency", self.instrumentation.snapshot()["latency"]),
+           ))
+
+    async def dispatch( self, request ):
+        # Returns the JSON-RPC response to one request object, None for notifications
+        request_id = request.get("id") if isinstance(request, dict) else None
+        start = time.perf_counter_ns()
+        method = None
+        try:
+            if not isinstance(request, dict) or not isinstance(request.get("method"), str):
+                raise JsonRpcError(-32600, "Invalid request")
+            method = self.methods.get(request["method"])
+            if method is None:
+                raise JsonRpcError(-32601, "Method not found: {}".format(request["method"]))
+            result = await method( request.get("params", {}) )
+            response = collections.OrderedDict( (("jsonrpc", "2.0"), ("result", result), ("id", request_id)) )
+        except JsonRpcError as e:
+            response = collections.OrderedDict( (("jsonrpc", "2.0"), ("error", {"code" : e.code, "message" : e.message}), ("id", request_id)) )
+        except Exception:
+            # A bug in one method must not tear down the connection
+            response = collections.OrderedDict( (("jsonrpc", "2.0"), ("error", {"code" : -32603, "message" : "Internal error"}), ("id", request_id)) )
+        if method is not None:
+            self.instrumentation.observe_latency( request["method"], time.perf_counter_ns() - start )
+        if isinstance(request, dict) and "id" not in request:
+            return None
+        return response
+
+    async def handle_body( self, body ):
+        try:
+            request = json.loads(body)
+        except ValueError:
+            return collections.OrderedDict( (("jsonrpc", "2.0"), ("error", {"code" : -32700, "message" : "Parse error"}), ("id", None)) )
+        if isinstance(request, list):
+            if not request:
+                return collections.OrderedDict( (("jsonrpc", "2.0"), ("error", {"code" : -32600, "message" : "Empty batch"}), ("id", None)) )
+            # Dispatched concurrently so the whole batch is priced in one pass
+            responses = await asyncio.gather( *[self.dispatch( r ) for r in request] )
+            return [r for r in responses if r is not None] or None
+        return await self.dispatch( request )
+
+    async def handle_connection( self, reader, writer ):
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                parts = request_line.split()
+                if len(parts) != 3:
+                    await self._write_response( writer, 400, b"Bad request\n", "text/plain", False )
+                    break
+                method, path, version = parts
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    k, _, v = line.decode("latin-1").partition(":")
+                    headers[k.strip().lower()] = v.strip()
+                connection = headers.get("connection", "").lower()
+                keep_alive = connection == "keep-alive" if version == b"HTTP/1.0" else connection != "close"
+                body = await reader.readexactly( int(headers.get("content-length", 0)) )
+
+                if method == b"GET" and path == b"/metrics":
+                    start = time.perf_counter_ns()
+                    text = self.instrumentation.prometheus_text( prefix="rc_quote" )
+                    self.instrumentation.observe_latency( "/metrics", time.perf_counter_ns() - start )
+                    await self._write_response( writer, 200, text.encode("utf8"), "text/plain; version=0.0.4", keep_alive )
+                elif method == b"POST":
+                    response = await self.handle_body( body )
+                    payload = b"" if response is None else json.dumps( response, separators=(",", ":") ).encode("utf8")
+                    await self._write_response( writer, 200, payload, "application/json", keep_alive )
+                else:
+                    await self._write_response( writer, 404, b"Not found\n", "text/plain", keep_alive )
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError, asyncio.CancelledError):
+            pass
+        finally:
+            self._connections.discard(task)
+            writer.close()
+
+    async def _write_response( self, writer, status, payload, content_type, keep_alive ):
+        reason = {200 : "OK", 400 : "Bad Request", 404 : "Not Found"}[status]
+        writer.write( (
+           "HTTP/1.1 {} {}\r\n"
+           "Content-Type: {}\r\n"
+           "Content-Length: {}\r\n"
+           "Connection: {}\r\n"
+           "\r\n").format(status, reason, content_type, len(payload), "keep-alive" if keep_alive else "close").encode("latin-1") + payload )
+        await writer.drain()
+
+    async def start( self, host="127.0.0.1", port=8090 ):
+        self._server = await asyncio.start_server( self.handle_connection, host, port )
+        return self._server
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        # Idle keep-alive connections would otherwise wait for their next request forever
+        connections = list(self._connections)
+        for task in connections:
+            task.cancel()
+        await asyncio.gather( *connections, return_exceptions=True )
+
+def main( argv=None ):
+    parser = argparse.ArgumentParser( description="Serve RC cost quotes over JSON-RPC" )
+    parser.add_argument( "--host", default="127.0.0.1" )
+    parser.add_argument( "--port", type=int, default=8090 )
+    parser.add_argument( "--params", help="JSON file with the result of rc_api.get_resource_params" )
+    parser.add_argument( "--pool", help="JSON file with the result of rc_api.get_resource_pool" )
+    parser.add_argument( "--rc-regen", type=int, help="Global RC regeneration rate" )
+    parser.add_argument( "--total-vesting-shares", type=int, help="Used to compute --rc-regen when it is not given" )
+    parser.add_argument( "--max-batch-size", type=int, default=256 )
+    parser.add_argument( "--max-delay", type=float, default=0.0, help="Seconds to wait for more requests before pricing a batch" )
+    args = parser.parse_args(argv)
+
+    model = rcdemo.load_model( args.params, args.pool, args.rc_regen, args.total_vesting_shares )
+    server = QuoteServer( model, args.max_batch_size, args.max_delay )
+
+    async def serve():
+        s = await server.start( args.host, args.port )
+        async with s:
+            await s.serve_forever()
+
+    try:
+        asyncio.run( serve() )
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+
+# Projects resource pools and RC prices forward under hypothetical load.  Each transaction
+# template has an arrival rate profile (mean transactions per block, possibly changing over
+# time), arrivals are drawn from a Poisson distribution, and the pools are stepped with the
+# same dynamics as replay_blocks().  Templates are counted once, so a simulated block costs
+# a few integer operations per resource whatever its transaction count.
+#
+# rc_regen stays at the model's value for the whole run, changes of total_vesting_shares
+# over the simulated period are ignored.
+
+import argparse
+import bisect
+import collections
+import json
+import math
+import os
+import random
+
+import rcdemo
+
+def compile_profile( profile ):
+    # A profile is a constant rate, or a list of [start_block_index, rate] steps sorted
+    # by start_block_index (the rate is 0 before the first step)
+    if isinstance(profile, (int, float)):
+        return ([0], [profile])
+    steps = sorted( (int(start), rate) for start, rate in profile )
+    return ([start for start, rate in steps], [rate for start, rate in steps])
+
+def profile_rate( compiled_profile, block_index ):
+    starts, rates = compiled_profile
+    i = bisect.bisect_right( starts, block_index ) - 1
+    return rates[i] if i >= 0 else 0
+
+def poisson( rng, lam ):
+    if lam <= 0:
+        return 0
+    if lam < 30:
+        limit = math.exp(-lam)
+        k = 0
+        p = rng.random()
+        while p > limit:
+            k += 1
+            p *= rng.random()
+        return k
+    # Normal approximation, accurate enough for load projections at high rates
+    return max(0, int(round(rng.gauss(lam, math.sqrt(lam)))))
+
+def count_templates( model, templates ):
+    # Unscaled resource counts of each template, in model.resource_names order
+    names = list(templates.keys())
+    count_matrix = model.get_resource_count_matrix(
+       [templates[name]["tx"] for name in names],
+       [templates[name].get("tx_size", -1) for name in names] )
+    return collections.OrderedDict( zip(names, count_matrix) )
+
+def simulate_run( resource_params, resource_pool, rc_regen, template_counts, profiles, block_count, seed ):
+    # One Monte Carlo run.  Takes plain data rather than an RCModel so it can run in a
+    # worker process.  Returns per-block trajectories, each list has block_count entries.
+    rng = random.Random(seed)
+    sim_model = rcdemo.RCModel( resource_params=resource_params, resource_pool=resource_pool, rc_regen=rc_regen )
+    resource_names = sim_model.resource_names
+    compiled = [(name, template_counts[name], compile_profile( profile )) for name, profile in profiles.items()]
+
+    pool = collections.OrderedDict( (resource_name, []) for resource_name in resource_names )
+    price = collections.OrderedDict( (resource_name, []) for resource_name in resource_names )
+    template_cost = collections.OrderedDict( (name, []) for name, counts, profile in compiled )
+    arrivals = collections.OrderedDict( (name, []) for name, counts, profile in compiled )
+
+    for block_index in range(block_count):
+        # Transactions are priced against the pool at the start of their block
+        snapshot = sim_model.get_price_snapshot()
+        for i, resource_name in enumerate(resource_names):
+            price[resource_name].append( snapshot.factor[i] / snapshot.denom[i] )
+        usage = [0] * len(resource_names)
+        for name, counts, profile in compiled:
+            n = poisson( rng, profile_rate( profile, block_index ) )
+            arrivals[name].append(n)
+            template_cost[name].append( snapshot.get_total_rc_cost( counts ) )
+            for i, c in enumerate(counts):
+                usage[i] += n * c
+
+        dynamics = sim_model.apply_rc_pool_dynamics_compact( usage )
+        sim_model.resource_pool = collections.OrderedDict(
+           (resource_name, collections.OrderedDict( (("pool", new_pool),) ))
+           for resource_name, new_pool in zip(resource_names, dynamics.new_pool) )
+        for resource_name, new_pool in zip(resource_names, dynamics.new_pool):
+            pool[resource_name].append(new_pool)
+
+    return collections.OrderedDict((
+       ("seed", seed),
+       ("pool", pool),
+       ("price", price),
+       ("template_cost", template_cost),
+       ("arrivals", arrivals),
+       ))
+
+def simulate( model, templates, profiles, block_count, runs=1, seed=0, jobs=None ):
+    # Runs independent simulations with seeds seed, seed+1, ... on a pool of jobs processes
+    # (default: one per CPU, jobs=1 runs them in this process).  Returns the list of runs.
+    import concurrent.futures
+
+    template_counts = count_templates( model, templates )
+    args = (model.resource_params, model.resource_pool, model.rc_regen, template_counts, profiles, block_count)
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    if jobs <= 1 or runs <= 1:
+        return [simulate_run( *args, seed=seed+k ) for k in range(runs)]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=min(jobs, runs)) as executor:
+        futures = [executor.submit( simulate_run, *args, seed=seed+k ) for k in range(runs)]
+        return [f.result() for f in futures]
+
+def percentile( sorted_values, q ):
+    return sorted_values[min(len(sorted_values)-1, int(q * len(sorted_values)))]
+
+def summarize_runs( runs, quantiles=(0.1, 0.5, 0.9) ):
+    # Per-block quantiles across runs of each pool, price and template cost trajectory
+    summary = collections.OrderedDict()
+    for series in ("pool", "price", "template_cost"):
+        summary[series] = collections.OrderedDict()
+        for name in runs[0][series]:
+            columns = zip(*[run[series][name] for run in runs])
+            per_block = [sorted(column) for column in columns]
+            summary[series][name] = collections.OrderedDict(
+               ("p{:g}".format(q * 100), [percentile( values, q ) for values in per_block]) for q in quantiles )
+    return summary
+
+def main( argv=None ):
+    parser = argparse.ArgumentParser( description="Project RC pools and prices under hypothetical load" )
+    parser.add_argument( "profiles", help="JSON file mapping template names to a rate or a list of [block, rate] steps" )
+    parser.add_argument( "--templates", help="JSON file of {name : {\"tx\" : ..., \"tx_size\" : ...}}, default: rcdemo's example transactions" )
+    parser.add_argument( "--blocks", type=int, default=1200 )
+    parser.add_argument( "--runs", type=int, default=16 )
+    parser.add_argument( "--seed", type=int, default=0 )
+    parser.add_argument( "--jobs", type=int )
+    parser.add_argument( "--every", type=int, default=100, help="Only report every n-th block" )
+    args = parser.parse_args(argv)
+
+    with open(args.profiles, "r") as f:
+        profiles = json.load(f)
+    templates = rcdemo.example_transactions
+    if args.templates:
+        with open(args.templates, "r") as f:
+            templates = json.load(f)
+
+    runs = simulate( rcdemo.model, templates, profiles, args.blocks, args.runs, args.seed, args.jobs )
+    summary = summarize_runs( runs )
+    for series in summary.values():
+        for quantiles in series.values():
+            for q, values in quantiles.items():
+                quantiles[q] = values[args.every-1::args.every]
+    print( json.dumps( summary, indent=1 ) )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+
+# Evaluates many candidate resource_params against a recorded workload.  A candidate is a
+# set of overrides of price_curve_params, decay_params, budget_per_time_unit and the other
+# per-resource values, addressed by paths like "resource_state_bytes.price_curve_params.coeff_a".
+# The workload is counted once up front, since resource counts only depend on size_info,
+# which is not swept.  Each candidate then only replays pool dynamics and prices.
+
+import argparse
+import collections
+import copy
+import csv
+import itertools
+import json
+import os
+import random
+
+import rcdemo
+
+def apply_overrides( resource_params, overrides ):
+    # Returns a copy of resource_params with overrides applied.  Paths are relative to
+    # resource_params["resource_params"] and must already exist, so a typo is an error.
+    result = copy.deepcopy(resource_params)
+    for path, value in overrides.items():
+        keys = path.split(".")
+        d = result["resource_params"]
+        for k in keys[:-1]:
+            d = d[k]
+        if keys[-1] not in d:
+            raise KeyError("Unknown parameter {}".format(path))
+        d[keys[-1]] = value
+    return result
+
+def grid_candidates( space ):
+    # space maps a path to the list of values to try, returns every combination
+    paths = list(space.keys())
+    return [collections.OrderedDict(zip(paths, values)) for values in itertools.product( *[space[path] for path in paths] )]
+
+def random_candidates( space, count, seed=0 ):
+    # space maps a path to a list of values to choose from, or to {"min" : a, "max" : b}
+    # for a uniformly drawn integer
+    rng = random.Random(seed)
+    candidates = []
+    for i in range(count):
+        candidate = collections.OrderedDict()
+        for path, values in space.items():
+            if isinstance(values, dict):
+                candidate[path] = rng.randint( int(values["min"]), int(values["max"]) )
+            else:
+                candidate[path] = rng.choice(values)
+        candidates.append(candidate)
+    return candidates
+
+def load_workload( blocks, count_resources ):
+    # Counts a recorded workload (a JSONL filename or an iterable of blocks) into one list of
+    # unscaled resource count rows per block
+    if isinstance(blocks, str):
+        blocks = rcdemo.read_block_records(blocks)
+    workload = []
+    for block in blocks:
+        tx_sizes = block.get("transaction_sizes") or itertools.repeat(-1)
+        workload.append( [count.values for count in map(count_resources.count_compact, block["transactions"], tx_sizes)] )
+    return workload
+
+def evaluate_candidate( resource_params, resource_pool, rc_regen, workload, count_resources=None ):
+    # Replays the workload under resource_params and returns an OrderedDict of metrics
+    model = rcdemo.RCModel( resource_params=resource_params, resource_pool=resource_pool,
+                            rc_regen=rc_regen, count_resources=count_resources )
+    resource_names = model.resource_names
+    n = len(resource_names)
+    min_pool = [None] * n
+    total_cost = [0] * n
+    tx_count = 0
+    max_tx_cost = 0
+    new_pool = [int(resource_pool[resource_name]["pool"]) for resource_name in resource_names]
+
+    for rows in workload:
+        if rows:
+            cost_columns = list(model.get_rc_cost_columns( rows ).values())
+            for i in range(n):
+                total_cost[i] += sum(cost_columns[i])
+            max_tx_cost = max(max_tx_cost, max(map(sum, zip(*cost_columns))))
+            tx_count += len(rows)
+        usage = [sum(column) for column in zip(*rows)] if rows else [0] * n
+        new_pool = model.apply_rc_pool_dynamics_compact( usage ).new_pool
+        model.resource_pool = collections.OrderedDict(
+           (resource_name, collections.OrderedDict( (("pool", p),) )) for resource_name, p in zip(resource_names, new_pool) )
+        for i, p in enumerate(new_pool):
+            if min_pool[i] is None or p < min_pool[i]:
+                min_pool[i] = p
+
+    metrics = collections.OrderedDict()
+    metrics["transaction_count"] = tx_count
+    metrics["mean_tx_cost"] = sum(total_cost) / tx_count if tx_count else 0.0
+    metrics["max_tx_cost"] = max_tx_cost
+    for i, resource_name in enumerate(resource_names):
+        metrics["final_pool." + resource_name] = new_pool[i]
+        metrics["min_pool." + resource_name] = min_pool[i]
+        metrics["total_cost." + resource_name] = total_cost[i]
+    return metrics
+
+# Per-process state of sweep workers, set once by init_worker() so the workload is not
+# pickled again for every candidate
+worker_state = None
+
+def init_worker( resource_params, resource_pool, rc_regen, workload ):
+    global worker_state
+    worker_state = (resource_params, resource_pool, rc_regen, workload, rcdemo.ResourceCounter(resource_params))
+
+def evaluate_overrides( overrides ):
+    resource_params, resource_pool, rc_regen, workload, count_resources = worker_state
+    return evaluate_candidate( apply_overrides( resource_params, overrides ), resource_pool, rc_regen, workload, count_resources )
+
+def sweep( model, workload, candidates, jobs=None, chunksize=None ):
+    # Evaluates every candidate (a dict of overrides of model.resource_params) on a pool of
+    # jobs processes, default one per CPU.  Returns the results as columns: one column per
+    # override path, then one per metric, each a list in candidate order.
+    import concurrent.futures
+
+    args = (model.resource_params, model.resource_pool, model.rc_regen, workload)
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    if jobs <= 1:
+        init_worker( *args )
+        results = [evaluate_overrides( overrides ) for overrides in candidates]
+    else:
+        if chunksize is None:
+            chunksize = max(1, len(candidates) // (jobs * 4))
+        with concurrent.futures.ProcessPoolExecutor( max_workers=jobs, initializer=init_worker, initargs=args ) as executor:
+            results = list(executor.map( evaluate_overrides, candidates, chunksize=chunksize ))
+
+    columns = collections.OrderedDict()
+    columns["candidate"] = list(range(len(candidates)))
+    for candidate in candidates:
+        for path in candidate:
+            columns.setdefault( path, [] )
+    for path in list(columns.keys())[1:]:
+        columns[path] = [candidate.get(path) for candidate in candidates]
+    for name in (results[0].keys() if results else ()):
+        columns[name] = [result[name] for result in results]
+    return columns
+
+def write_columns( columns, filename ):
+    # .csv files get one row per candidate, anything else a JSON object of columns
+    if filename.endswith(".csv"):
+        with open(filename, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow( list(columns.keys()) )
+            writer.writerows( zip(*columns.values()) )
+    else:
+        with open(filename, "w") as f:
+            json.dump( columns, f )
+
+def main( argv=None ):
+    parser = argparse.ArgumentParser( description="Sweep resource parameters over a recorded workload" )
+    parser.add_argument( "workload", help="JSONL block file" )
+    parser.add_argument( "space", help="JSON file mapping parameter paths to values, or to {\"min\", \"max\"} with --random" )
+    parser.add_argument( "--random", type=int, help="Evaluate this many random candidates instead of the full grid" )
+    parser.add_argument( "--seed", type=int, default=0 )
+    parser.add_argument( "--jobs", type=int )
+    parser.add_argument( "--output", default="sweep.json", help="Output file, .csv or JSON columns" )
+    args = parser.parse_args(argv)
+
+    with open(args.space, "r") as f:
+        space = json.load(f, object_pairs_hook=collections.OrderedDict)
+    if args.random is not None:
+        candidates = random_candidates( space, args.random, args.seed )
+    else:
+        candidates = grid_candidates( space )
+    workload = load_workload( args.workload, rcdemo.model.count_resources )
+    write_columns( sweep( rcdemo.model, workload, candidates, args.jobs ), args.output )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import io
+import json
+import os
+import struct
+import tempfile
+import unittest
+
+import rcanalytics
+import rcbench
+import rcblocklog
+import rcdemo
+
+def make_blocks( block_count=20, txs_per_block=10, seed=1 ):
+    gen = rcbench.TransactionGenerator(seed)
+    txs = gen.transactions(block_count * txs_per_block)
+    blocks = []
+    for n in range(1, block_count + 1):
+        header = gen.signed_block_header()
+        header["previous"] = "{:08x}".format(n - 1) + header["previous"][8:]
+        header["timestamp"] = "2018-09-28T01:{:02d}:{:02d}".format(n // 20, 3 * n % 60)
+        block = dict(header)
+        block["transactions"] = txs[(n - 1) * txs_per_block:n * txs_per_block]
+        blocks.append(block)
+    return blocks
+
+def write_block_log( directory, blocks ):
+    with open(os.path.join(directory, "block_log"), "wb") as f:
+        for block in blocks:
+            ser = rcdemo.Serializer()
+            header = dict( (k, v) for k, v in block.items() if k != "transactions" )
+            ser.signed_block_header(header)
+            ser.vector(ser.signed_transaction, block["transactions"])
+            pos = f.tell()
+            f.write(ser.flush())
+            f.write(struct.pack("<Q", pos))
+    return os.path.join(directory, "block_log")
+
+class RollingAnalyticsTest(unittest.TestCase):
+    def report( self, blocks ):
+        analytics = rcanalytics.RollingAnalytics( rcdemo.count_resources, top_k=1000 )
+        for block in blocks:
+            analytics.add_block(block)
+        return analytics.report( top_n=None )
+
+    def test_trimmed_records( self ):
+        blocks = make_blocks()
+        lines = io.BytesIO( b"".join(json.dumps(block).encode("utf8") + b"\n" for block in blocks) )
+        full = list(rcdemo.read_block_records( lines, trim=False ))
+        lines.seek(0)
+        trimmed = list(rcdemo.read_block_records( lines ))
+        self.assertEqual( self.report( trimmed ), self.report( full ) )
+
+    def test_block_log( self ):
+        blocks = make_blocks()
+        records = [rcdemo.parse_block_record( json.dumps(block), trim=False ) for block in blocks]
+        with tempfile.TemporaryDirectory() as directory:
+            with rcblocklog.BlockLogReader( write_block_log( directory, blocks ) ) as reader:
+                self.assertEqual( self.report( reader.blocks() ), self.report( records ) )
+
+    def test_vote( self ):
+        block = rcdemo.parse_block_record( json.dumps({"timestamp" : "2018-09-28T01:02:03", "transactions" : [rcdemo.vote_tx]}) )
+        analytics = rcanalytics.RollingAnalytics( rcdemo.count_resources )
+        analytics.add_block(block)
+        top = analytics.report()[3600]["top_accounts"]["resource_state_bytes"]
+        self.assertEqual( top[0]["account"], rcdemo.vote_tx["operations"][0]["value"]["voter"] )
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+import json
+import unittest
+
+import rcbench
+import rcdemo
+
+class AccountRCStoreTest(unittest.TestCase):
+    def test_trimmed_records( self ):
+        gen = rcbench.TransactionGenerator(2)
+        txs = gen.transactions(100)
+        line = json.dumps({"timestamp" : "2018-09-28T01:02:03", "transactions" : txs}).encode("utf8")
+        full = rcdemo.parse_block_record( line, trim=False )
+        trimmed = rcdemo.parse_block_record( line )
+        users = set(rcdemo.get_resource_user( tx ) for tx in full["transactions"]) - {None}
+        model = rcdemo.load_model()
+        results = []
+        for block in (full, trimmed):
+            store = rcdemo.AccountRCStore()
+            for name in sorted(users):
+                store.create_account( name, 10**15, 0 )
+            results.append( [store.apply_transaction( model, tx, 1, tx_size )
+                             for tx, tx_size in zip(block["transactions"], block["transaction_sizes"])] )
+            results.append( list(store.current_mana) )
+        self.assertEqual( results[2:], results[:2] )
+
+    def test_float_time( self ):
+        store = rcdemo.AccountRCStore( regen_time=100 )
+        store.create_account( "alice", 1000, 10.5 )
+        store.use_mana( "alice", 1000, 10.9 )
+        self.assertEqual( store.get_current_mana( "alice", 60.7 ), 500 )
+
+    def test_unknown_account( self ):
+        store = rcdemo.AccountRCStore()
+        store.create_account( "bob", 10**15, 0 )
+        resource_user, rc_cost = store.apply_transaction( rcdemo.load_model(), rcdemo.vote_tx, 1, rcdemo.vote_tx_size )
+        self.assertEqual( resource_user, rcdemo.vote_tx["operations"][0]["value"]["voter"] )
+        self.assertGreater( rc_cost, 0 )
+        self.assertEqual( store.unknown_account_count, 1 )
+        self.assertEqual( store.get_current_mana( "bob", 1 ), 10**15 )
+
+class FastForwardPoolTest(unittest.TestCase):
+    def test_approx( self ):
+        # The closed form against the per-block recurrence over up to 30 days of blocks
+        model = rcdemo.load_model()
+        for block_count in (1, 1000, 28800, 201600, 227258, 833821, 864000):
+            approx = model.fast_forward_pools( block_count )
+            exact = model.fast_forward_pools( block_count, exact=True )
+            for resource_name in model.resource_names:
+                decay_params = model.resource_params["resource_params"][resource_name]["resource_dynamics_params"]["decay_params"]
+                c = 1 << int(decay_params["decay_per_time_unit_denom_shift"])
+                bound = min(block_count, c // int(decay_params["decay_per_time_unit"])) // 2 + 1
+                error = abs(approx[resource_name]["pool"] - exact[resource_name]["pool"])
+                self.assertLessEqual( error, bound, (resource_name, block_count) )
+                self.assertLess( error, 2000, (resource_name, block_count) )
+
+    def test_exact( self ):
+        model = rcdemo.load_model()
+        for resource_name in model.resource_names:
+            params = model.resource_params["resource_params"][resource_name]["resource_dynamics_params"]
+            budget = int(params["budget_per_time_unit"])
+            pool = int(model.resource_pool[resource_name]["pool"])
+            expected = pool
+            for i in range(500):
+                expected += budget - rcdemo.rd_compute_pool_decay( params["decay_params"], expected, 1 )
+            self.assertEqual( rcdemo.rd_fast_forward_pool( params["decay_params"], budget, pool, 500, exact=True ), expected )
+
+if __name__ == "__main__":
+    unittest.main()
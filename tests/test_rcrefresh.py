@@ -0,0 +1,106 @@
+import asyncio
+import collections
+import json
+import unittest
+
+import rcdemo
+import rcrefresh
+
+class StandInNode(object):
+    # Local stand-in for the steemd JSON-RPC API, answering from the values embedded in rcdemo.
+    # Responses wait for self.gate, and with content_length=False they are sent without a
+    # Content-Length and delimited by closing the connection.
+    def __init__(self, content_length=True):
+        self.content_length = content_length
+        self.connection_count = 0
+        self.request_count = 0
+        self.gate = asyncio.Event()
+        self.gate.set()
+        self.server = None
+        self.results = {
+           "rc_api.get_resource_pool" : {"resource_pool" : rcdemo.resource_pool},
+           "rc_api.get_resource_params" : rcdemo.resource_params,
+           "database_api.get_dynamic_global_properties" : {
+              "total_vesting_shares" : {"amount" : str(rcdemo.total_vesting_shares), "precision" : 6, "nai" : "@@000000037"},
+              "total_vesting_fund_steem" : {"amount" : str(rcdemo.total_vesting_fund_steem), "precision" : 3, "nai" : "@@000000021"},
+              },
+           }
+
+    async def start(self):
+        self.server = await asyncio.start_server( self.handle_connection, "127.0.0.1", 0 )
+        return "http://127.0.0.1:{}/".format(self.server.sockets[0].getsockname()[1])
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def handle_connection( self, reader, writer ):
+        self.connection_count += 1
+        try:
+            while True:
+                if not await reader.readline():
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b""):
+                        break
+                    k, _, v = line.decode("latin-1").partition(":")
+                    headers[k.strip().lower()] = v.strip()
+                requests = json.loads( await reader.readexactly(int(headers["content-length"])) )
+                self.request_count += 1
+                await self.gate.wait()
+                body = json.dumps([collections.OrderedDict( (("jsonrpc", "2.0"), ("result", self.results[r["method"]]), ("id", r["id"])) )
+                                   for r in requests]).encode("utf8")
+                if self.content_length:
+                    writer.write( "HTTP/1.1 200 OK\r\nContent-Length: {}\r\n\r\n".format(len(body)).encode("latin-1") + body )
+                    await writer.drain()
+                else:
+                    writer.write( b"HTTP/1.1 200 OK\r\n\r\n" + body )
+                    await writer.drain()
+                    break
+        finally:
+            writer.close()
+
+class ChainStateRefresherTest(unittest.IsolatedAsyncioTestCase):
+    async def test_refresh( self ):
+        node = StandInNode()
+        refresher = rcrefresh.ChainStateRefresher( rcrefresh.JsonRpcClient( await node.start() ),
+                                                   refresh_interval=0.01, max_staleness=60.0 )
+        try:
+            state = await refresher.get_state()
+            self.assertEqual( state.total_vesting_shares, rcdemo.total_vesting_shares )
+            self.assertEqual( state.model.get_transaction_rc_cost( rcdemo.vote_tx, rcdemo.vote_tx_size ),
+                              rcdemo.load_model().get_transaction_rc_cost( rcdemo.vote_tx, rcdemo.vote_tx_size ) )
+            await asyncio.sleep(0.02)
+
+            # The stale state is served at once while the refresh waits for the node
+            node.gate.clear()
+            self.assertIs( await asyncio.wait_for( refresher.get_state(), 1.0 ), state )
+            await asyncio.sleep(0.01)
+            self.assertEqual( node.request_count, 2 )
+            self.assertIs( refresher.state, state )
+
+            node.gate.set()
+            await refresher._refresh_task
+            self.assertIsNot( refresher.state, state )
+            self.assertEqual( refresher.refresh_count, 2 )
+            # Both batches went over one keep-alive connection
+            self.assertEqual( node.connection_count, 1 )
+        finally:
+            await refresher.close()
+            await node.stop()
+
+    async def test_no_content_length( self ):
+        node = StandInNode( content_length=False )
+        client = rcrefresh.JsonRpcClient( await node.start() )
+        try:
+            self.assertEqual( await client.call( "rc_api.get_resource_params" ), rcdemo.resource_params )
+            self.assertEqual( await client.call( "rc_api.get_resource_params" ), rcdemo.resource_params )
+            self.assertEqual( node.connection_count, 2 )
+        finally:
+            await client.close()
+            await node.stop()
+
+if __name__ == "__main__":
+    unittest.main()